@@ -20,11 +20,15 @@ sys.path.append('../')
 import re
 from pycassa import ColumnFamily, NotFoundException
 import json
+from itertools import compress, izip
 import numpy as np
+import pandas as pd
 
 from orm.cassandra_util import load_pool
 import orm.sqlalchemy_model as sqlm
-from analysis_utils import rearrange_timeseries
+from analysis_utils import rearrange_timeseries, linear_interpolation
+from analysis_utils import split_timeseries, values_array
+from analysis_utils import interval_boundaries
 from analysis_utils import time_interval_beginning as tib
 
 def json_error_not_exists(Item, attr=None, attrValue=None):
@@ -42,6 +46,8 @@ def json_error_not_exists(Item, attr=None, attrValue=None):
 # .. arguments:
 #   - (string) id_variable: id of the variable we want to retrieve the data from
 #   - (dict) columns: contains the time range of data we want to receive
+#   - (boolean) compact: keep only the values different from the previous one,
+#       as clean_duplicated does, without reading the whole timeserie at once
 #
 # .. returns:
 #   - on success: list containing a list with the timeserie. This data formatting is
@@ -53,7 +59,20 @@ def json_error_not_exists(Item, attr=None, attrValue=None):
 #       - invalid data_range given
 #       - no data found
 #
-def get_variable_data(id_variable, columns):
+def get_variable_data(id_variable, columns, compact = False):
+
+    # Only the value changes are kept, compacting while the data is read
+    if compact:
+        chunks = get_variable_data_chunks(id_variable, columns, compact = True)
+        if type(chunks) == dict:
+            return chunks
+
+        output = [elem for chunk in chunks for elem in chunk]
+        if not output:
+            return {'error': json.dumps({'error': 'No data found'})}
+        output.reverse()
+
+        return [output]
 
     # Load Postgres session
     session = sqlm.load_session()
@@ -93,6 +112,251 @@ def get_variable_data(id_variable, columns):
     return [output]
 
 
+def get_variables_data(ids_variable, columns):
+
+    ''' Same as get_variable_data for several variables at once. The variables
+        are read with a single query to postgres and a multiget for each
+        column family in cassandra, instead of one round trip per variable.
+
+    .. arguments:
+    - (list) ids_variable: ids of the variables we want to retrieve the data from
+    - (dict) columns: contains the time range of data we want to receive
+
+    .. returns:
+    - on success: list containing a list with the timeserie of each variable,
+        in the order of ids_variable, from older to newer. The timeseries of
+        the variables without data in the range are empty lists
+    - on error:
+        - variable does not exist error
+        - no data found'''
+
+    # Load Postgres session
+    session = sqlm.load_session()
+
+    variables = session.query(sqlm.Variable).\
+            filter(sqlm.Variable.id.in_(ids_variable)).\
+            filter(sqlm.Variable.deletion_date == None).\
+            all()
+
+    session.close()
+
+    variables = dict((variable.id, variable) for variable in variables)
+    for id_variable in ids_variable:
+        if int(id_variable) not in variables:
+            return {'error': json_error_not_exists(sqlm.Variable, 'id', id_variable)}
+
+    # build query cassandra, structured by tables
+    query_cassandra = {} # {table name: list of cassandra ids}
+    for variable in variables.values():
+        query_cassandra.setdefault(variable.timeseries_cassandra, []).append(variable.id_cassandra)
+
+    # query cassandra
+    pool = load_pool()
+    pool.timeout = 300
+
+    ans_cassandra = {}
+    for (table, ids_cassandra) in query_cassandra.items():
+        cf = ColumnFamily(pool, table)
+        ans_cassandra.update(cf.multiget(ids_cassandra, **columns))
+
+    pool.dispose()
+
+    output = []
+    for id_variable in ids_variable:
+        id_cassandra = variables[int(id_variable)].id_cassandra
+        output.append(rearrange_timeseries(ans_cassandra.get(id_cassandra, {})))
+
+    if not any(output):
+        return {'error': json.dumps({'error': 'No data found'})}
+
+    return output
+
+
+def get_variable_data_preceding(id_variable, columns, margin = 300):
+
+    ''' Same as get_variable_data, but the timeserie begins with the last value
+        before the oldest value in the range, unless this one is placed at
+        column_finish. That value is needed to compute the first increment.
+
+        Both are read in a single query, moving column_finish margin seconds
+        back and asking for one more column. A second query is only needed
+        when there are no values in those margin seconds.
+
+    .. arguments:
+    - (string) id_variable: id of the variable we want to retrieve the data from
+    - (dict) columns: contains the time range of data we want to receive
+    - (integer) margin: seconds before the range read in the same query
+
+    .. returns:
+    - on success: list containing a list with the timeserie, as get_variable_data
+    - on error:
+        - variable does not exist error
+        - no data found'''
+
+    # Load Postgres session
+    session = sqlm.load_session()
+
+    # get variable by id
+    variable = session.query(sqlm.Variable).\
+            filter(sqlm.Variable.id == id_variable).\
+            filter(sqlm.Variable.deletion_date == None).\
+            first()
+
+    session.close()
+
+    if not variable:
+        return {'error': json_error_not_exists(sqlm.Variable)}
+
+    # pycassa reads 100 columns when no count is given
+    count = int(columns.get('column_count', 100))
+    finish = columns.get('column_finish')
+
+    wide_columns = dict(columns)
+    wide_columns['column_count'] = count + 1
+    if finish:
+        wide_columns['column_finish'] = (finish[0], finish[1] - int(margin))
+
+    pool = load_pool()
+    pool.timeout = 300
+
+    cf = ColumnFamily(pool, variable.timeseries_cassandra)
+
+    try:
+        data = rearrange_timeseries(cf.get(variable.id_cassandra, **wide_columns))
+    except NotFoundException:
+        data = []
+
+    # Values the range alone would have given, the last count of them
+    if finish:
+        n_range = len([elem for elem in data if elem[0] >= finish[1]])
+    else:
+        n_range = len(data)
+    n_range = min(n_range, count)
+
+    if n_range == 0:
+        pool.dispose()
+        return {'error': json.dumps({'error': 'No data found'})}
+
+    output = data[len(data) - n_range:]
+
+    # The extra value is not needed when a value is placed at column_finish
+    if finish and output[0][0] == finish[1]:
+        extra_value = []
+    elif len(data) > n_range:
+        extra_value = [data[len(data) - n_range - 1]]
+    elif finish:
+        # No values in the margin, look further back
+        try:
+            extra_value = rearrange_timeseries(cf.get(variable.id_cassandra,
+                column_start = ('timeseries', output[0][0] - 1), column_count = 1))
+        except NotFoundException:
+            extra_value = []
+    else:
+        # There are no values before the ones received
+        extra_value = []
+
+    pool.dispose()
+
+    return [extra_value + output]
+
+
+def get_variable_data_chunks(id_variable, columns, chunk_size = 100000, compact = False):
+
+    ''' Same as get_variable_data, but the data is read from cassandra in
+        pages of chunk_size columns, so that timeseries that do not fit in
+        memory can be processed chunk by chunk.
+
+    .. arguments:
+    - (string) id_variable: id of the variable we want to retrieve the data from
+    - (dict) columns: contains the time range of data we want to receive
+    - (integer) chunk_size: number of values of each chunk
+    - (boolean) compact: keep only the values different from the previous one
+        in time, see compact_columns
+
+    .. returns:
+    - on success: generator of chunks [(epoch_0, value_0), ..., (epoch_n, value_n)].
+        The chunks follow the order of the columns in cassandra, from newer to
+        older, and so do the values in each chunk
+    - on error: variable does not exist error'''
+
+    # Load Postgres session
+    session = sqlm.load_session()
+
+    # get variable by id
+    variable = session.query(sqlm.Variable).\
+            filter(sqlm.Variable.id == id_variable).\
+            filter(sqlm.Variable.deletion_date == None).\
+            first()
+
+    session.close()
+
+    if not variable:
+        return {'error': json_error_not_exists(sqlm.Variable)}
+
+    columns = dict(columns)
+    if 'column_count' in columns:
+        columns['column_count'] = int(columns['column_count'])
+
+    return iter_variable_data(variable.timeseries_cassandra, variable.id_cassandra,
+        columns, chunk_size, compact)
+
+
+def iter_variable_data(column_family, id_cassandra, columns, chunk_size, compact = False):
+
+    pool = load_pool()
+    pool.timeout = 300
+
+    cf = ColumnFamily(pool, column_family)
+
+    try:
+        data = decode_columns(cf.xget(id_cassandra, buffer_size = chunk_size, **columns))
+        if compact:
+            data = compact_columns(data)
+
+        chunk = []
+        for elem in data:
+            chunk.append(elem)
+
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+    except NotFoundException:
+        pass
+    finally:
+        pool.dispose()
+
+
+def decode_columns(columns):
+
+    ''' Generator of the (clock, value) pairs of the cassandra columns
+        of a timeserie, skipping the columns without value'''
+
+    for ((mode, clock), value) in columns:
+        data = json.loads(value)
+        if type(data) == dict and 'value' in data:
+            yield (clock, data['value'])
+
+
+def compact_columns(columns):
+
+    ''' Generator keeping the (clock, value) pairs of columns given from newer
+        to older whose value is different from the value of the previous
+        pair in time, that is, the older pair of each run of equal values.
+        Only the last pair is held in memory'''
+
+    held = None
+    for elem in columns:
+        if held != None and elem[1] != held[1]:
+            yield held
+        held = elem
+
+    if held != None:
+        yield held
+
+
 # -------------------------------------------------------------------------
 # Return a list containing all the given timeseries divided in shorter timeseries
 # of length the specified timespan
@@ -101,7 +365,7 @@ def get_variable_data(id_variable, columns):
 #   - (list) time_series: list of time_series
 #       [[(epoch_0_0, value_0_0),..., (epoch_0_n0, value_0_n0)], ... (n timeseries)]
 #   - (string) time_int : the time interval for which we want to divide 
-#       the timeseries. Accepted values are: 'year', 'month', 'week' or 'day'       
+#       the timeseries. Accepted values are: 'year', 'month', 'week', 'day' or 'hour'
 #   - (list) data_range: contains the time range of data
 #       we want to receive: [epoch_from , epoch_to]
 #   - (string) tz_name: name of the timezone of the locations we are working with
@@ -109,7 +373,7 @@ def get_variable_data(id_variable, columns):
 # .. returns:
 #   - on success: list containing a list with the timeseries divided into smaller ones of 
 #       length time_int
-#   - on error: NO ERRORS HANDLED
+#   - on error: dictionary with an error description
 #
 def timeseries_group_by(time_series, time_int, data_range = None, tz_name = 'Europe/Madrid'):
 
@@ -123,87 +387,86 @@ def timeseries_group_by(time_series, time_int, data_range = None, tz_name = 'Eur
             e_1 = ts[0][0]
             e_2 = ts[-1][0]
 
-        epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = e_2)
-        old_epoch_pivot = epoch_pivot
-        old_epoch_pivot = e_2
-        pointer = len(ts) - 1
+        epochs = np.fromiter((elem[0] for elem in ts), dtype = np.int64, count = len(ts))
+
+        offsets = group_by_offsets(epochs, time_int, e_1, e_2, tz_name)
+        if type(offsets) == dict:
+            return offsets
+        pivots, starts, ends = offsets
+
         grouped_ts = []
-        divided_ts = []
-        count = 0
-
-        while old_epoch_pivot > e_1:
-            # point strictly of the interior of an interval
-            if pointer > 0 and ts[pointer][0] >= epoch_pivot and ts[pointer - 1][0] >= epoch_pivot:
-                divided_ts.insert(0, ts[pointer])
-                pointer -= 1
-            # outer point but not on the border
-            elif pointer > 0 and ts[pointer][0] > epoch_pivot and ts[pointer - 1][0] < epoch_pivot:
-                divided_ts.insert(0, ts[pointer])
-                divided_ts.insert(0, [epoch_pivot, ts[pointer][1]])
-                grouped_ts.insert(0, divided_ts)
-
-                divided_ts = []
-                divided_ts.insert(0, [epoch_pivot, ts[pointer][1]])                                
-                pointer -= 1
-                old_epoch_pivot = epoch_pivot
-                epoch_pivot -= 1
-                epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = epoch_pivot)
-            # point on the border
-            elif pointer > 0 and ts[pointer][0] == epoch_pivot and ts[pointer - 1][0] < epoch_pivot:
-                divided_ts.insert(0, ts[pointer])
-                grouped_ts.insert(0, divided_ts)
-
-                divided_ts = []
-                divided_ts.insert(0, ts[pointer])                                
-                pointer -= 1
-                old_epoch_pivot = epoch_pivot
-                epoch_pivot -= 1
-                epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = epoch_pivot)
-            # last point is interior
-            elif pointer == 0 and ts[pointer][0] > epoch_pivot:
-                divided_ts.insert(0, ts[pointer])
-                grouped_ts.insert(0, divided_ts)
-
-                divided_ts = []                                
-                pointer -= 1
-                old_epoch_pivot = epoch_pivot
-                epoch_pivot -= 1
-                epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = epoch_pivot)
-            # last point is on the border
-            elif pointer == 0 and ts[pointer][0] == epoch_pivot:
-                divided_ts.insert(0, ts[pointer])
-                grouped_ts.insert(0, divided_ts)
-
-                divided_ts = []
-                divided_ts.insert(0, ts[pointer])
-                pointer -= 1
-                old_epoch_pivot = epoch_pivot
-                epoch_pivot -= 1
-                epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = epoch_pivot)
-            # Else clause covers two cases:
-            #   - when the pointer is greater than 0 but its time reference
-            #       is lower than the epoch_pivot. This situation can happen when the upper 
-            #       bound is greater than the greatest of the time refs in the timeserie
-            #       or because of a gap in the data of the timeserie
-            #   - when the pointer is lower than 0 but epoch_pivot has not reached
-            #       the lower bound of the data_range
+        # border point shared with the following interval
+        next_border = None
+
+        # Walk the intervals backwards, as the borders are taken from the
+        # first point of the following interval
+        for i in range(len(pivots) - 1, -1, -1):
+
+            epoch_pivot = int(pivots[i])
+            (a, b) = (starts[i], ends[i])
+
+            if a == b:
+                if next_border != None:
+                    divided_ts = [next_border]
+                else:
+                    divided_ts = [(max([e_1, epoch_pivot]), None)]
+                next_border = None
             else:
-                if divided_ts == []:
-                    divided_ts.insert(0, (max([e_1, epoch_pivot]), None))
-                grouped_ts.insert(0, divided_ts)
-                old_epoch_pivot = epoch_pivot
-                epoch_pivot -= 1
-                epoch_pivot = tib(time_int, tz_name = tz_name, epoch_ref = epoch_pivot)
-                # Time savings changes can result in an infinite while
-                # To prevent this, we introduce the following if
-                if epoch_pivot == old_epoch_pivot and time_int == 'hour':
-                    epoch_pivot -= 3600
-                divided_ts = []
+                divided_ts = ts[a:b]
+                if next_border != None:
+                    divided_ts.append(next_border)
+
+                # point on the border
+                if epochs[a] == epoch_pivot:
+                    next_border = ts[a]
+                # first point of the timeserie is interior
+                elif a == 0:
+                    next_border = None
+                # outer point but not on the border
+                else:
+                    divided_ts.insert(0, [epoch_pivot, ts[a][1]])
+                    next_border = [epoch_pivot, ts[a][1]]
 
+            grouped_ts.append(divided_ts)
+
+        grouped_ts.reverse()
         output += grouped_ts
 
     return output
 
+
+def group_by_offsets(epochs, time_int, e_1, e_2, tz_name = 'Europe/Madrid'):
+
+    ''' Compute at once the beginnings of the intervals used by
+        timeseries_group_by and the positions of the points of each of them.
+        The points of the interval i are epochs[starts[i]:ends[i]], the last
+        interval takes all the points after its beginning
+
+    .. arguments:
+    - (numpy array) epochs: sorted epochs of the timeserie
+    - (string) time_int: 'year', 'month', 'week', 'day' or 'hour'
+    - (integer) e_1, e_2: time range of the grouping
+    - (string) tz_name: name of the timezone of the locations we are working with
+
+    .. returns:
+    - on success: tuple of numpy arrays (pivots, starts, ends)
+    - on error: dictionary with an error description'''
+
+    if e_2 <= e_1:
+        empty = np.array([], dtype = np.int64)
+        return empty, empty, empty
+
+    # the first interval is the one containing e_1 or beginning on it
+    pivots = interval_boundaries(time_int, tz_name, min([e_1 + 60, e_2]), e_2)
+    if type(pivots) == dict:
+        return pivots
+    pivots = pivots[:-1]
+
+    starts = np.searchsorted(epochs, pivots)
+    ends = np.append(starts[1:], len(epochs))
+
+    return pivots, starts, ends
+
 # -------------------------------------------------------------------------
 # Return a list containing the number of times the state value given has 
 # arised for each of the timeseries given
@@ -221,28 +484,47 @@ def timeseries_group_by(time_series, time_int, data_range = None, tz_name = 'Eur
 def count_state_change(time_series, state_value):
 
     output = []
+    state_value = str(state_value)
 
     for ts in time_series:
-        state_count = 0
-        in_state = True
         epoch = ts[0][0]
-        for element in ts:
-            
-            if str(element[1]) == str(state_value):
-                if in_state:
-                    pass
-                else:
-                    state_count += 1
-                    in_state = True
-            else:
-                if in_state:
-                    in_state = False
-                else:
-                    pass
+
+        in_state = state_mask([elem[1] for elem in ts], state_value)
+
+        # Changes from any other value to the state value
+        state_count = int(np.count_nonzero(in_state[1:] & ~in_state[:-1]))
+
         output.append((epoch, state_count))
 
     return [output]
 
+
+def state_mask(values, state_value):
+
+    ''' Return a boolean array telling which of the values, given as a
+        list or a numpy array, have the same string representation as
+        state_value. Each distinct value is converted to string only once'''
+
+    # The values of a numeric array all have the same type
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        codes, uniques = pd.factorize(values)
+    # Equal values of different types, like 1 and numpy.float64(1.), may
+    # have different representations. Nulls are handled apart
+    elif len(set(map(type, values)) - set([type(None)])) > 1:
+        return np.array([str(v) == state_value for v in values], dtype = bool)
+    else:
+        codes, uniques = pd.factorize(values_array(values))
+
+    matches = np.array([str(u) == state_value for u in uniques.tolist()] + [False])
+    mask = matches[codes]
+
+    # Null values are not factorized
+    for i in np.flatnonzero(codes == -1):
+        mask[i] = str(values[i]) == state_value
+
+    return mask
+
+
 # -------------------------------------------------------------------------
 # Return a list containing the given timeseries with all the values
 # converted to float type, if possible. If it is not possible, return error.
@@ -263,26 +545,30 @@ def timeseries_to_float(timeseries):
     output = []
 
     for ts in timeseries:
-        
-        new_ts = []
-        for elem in ts:
-            (epoch, value) = elem
 
-            if value == None:
-                new_ts.append((epoch, value))                
-            else:
-                new_val_err = False
+        epochs, values = split_timeseries(ts)
+
+        try:
+            new_values = values.astype(np.float64)
+            if values.dtype == object:
+                # Null values are kept as they are
+                nulls = pd.isnull(values)
+                if nulls.any():
+                    new_values = new_values.astype(object)
+                    new_values[nulls] = values[nulls]
+        except:
+            new_values = []
+            for value in values:
+                if value == None:
+                    new_values.append(value)
+                    continue
                 try:
-                    new_val = float(value)
+                    new_values.append(float(value))
                 except:
-                    new_val_err = True
-
-                if new_val_err:
                     return {'error': json.dumps({'error': 'Invalid value %s received' %str(value)})}
+            new_values = np.array(new_values, dtype = object)
 
-                new_ts.append((epoch, new_val))
-
-        output.append(new_ts)
+        output.append(zip(epochs, new_values.tolist()))
 
     return output
 
@@ -314,24 +600,21 @@ def compute_meter_increments(time_series, reset_value = 0):
         epoch = ts[0][0]
         inc = 0
 
-        if len(ts) == 1:
-            output.append((epoch, inc))
-        else:                
-            t0 = float(ts[0][1])
-            t1 = float(ts[1][1])
-
-            for i in range(1, len(ts) - 1):
+        # The increment between the last two values is not accounted
+        if len(ts) > 2:
+            values = np.array([elem[1] for elem in ts[:-1]], dtype = np.float64)
 
-                if t1 >= t0:
-                    inc = inc + t1 - t0
-                else:
-                    inc = inc + t1 - reset_value
+            new_values = values[1:]
+            old_values = values[:-1]
 
-                t0 = t1
-                if i < len(ts) - 1:
-                    t1 = float(ts[i + 1][1])
+            # The increments are added in order, as the element by element loop
+            # did, not pairwise as np.sum. That loop added each value and then
+            # subtracted the previous one, so with values that are not exact
+            # in binary the total may still differ from it in the last bits
+            incs = np.where(new_values >= old_values, new_values - old_values, new_values - reset_value)
+            inc = float(np.add.accumulate(incs)[-1])
 
-            output.append((epoch, inc))
+        output.append((epoch, inc))
 
     return [output]
 
@@ -362,12 +645,10 @@ def scalar_product(timeseries, scalar):
         return {'error': json.dumps({'error': 'Value received is not a number: ' + str(scalar)})}
     
     for ts in timeseries:
-        
-        new_ts = []
-        for element in ts:
-            new_ts.append((element[0], scalar*element[1]))
 
-        output.append(new_ts)
+        epochs, values = split_timeseries(ts)
+
+        output.append(zip(epochs, (scalar*values).tolist()))
     
     return output
 
@@ -396,12 +677,13 @@ def truncate_timeseries(timeseries, truncate_unit = 1):
         return {'error': json.dumps({'error': 'truncate_unit is not positive'})}
 
     output = []
-    for t in timeseries:
-        new_ts = []
-        for element in ts:
-            new_ts.append((element[0], truncate_unit*int(element[1]/truncate_unit)))
+    for ts in timeseries:
 
-        output.append(new_ts)
+        epochs, values = split_timeseries(ts)
+
+        new_values = truncate_unit*np.trunc(values/truncate_unit)
+
+        output.append(zip(epochs, new_values.tolist()))
     
     return output
 
@@ -422,7 +704,7 @@ def round_timeseries(timeseries, round_unit = 1):
 
     # Check that round_unit is numeric
     try:
-        truncate_unit = float(round_unit)
+        round_unit = float(round_unit)
     except:
         return {'error': json.dumps({'error': 'round_unit is not numeric'})}
 
@@ -431,12 +713,17 @@ def round_timeseries(timeseries, round_unit = 1):
         return {'error': json.dumps({'error': 'round_unit is not positive'})}
 
     output = []
-    for t in timeseries:
-        new_ts = []
-        for element in ts:
-            new_ts.append((element[0], round_unit*round(element[1]/round_unit)))
+    for ts in timeseries:
+
+        epochs, values = split_timeseries(ts)
 
-        output.append(new_ts)
+        # Round half away from zero, as python does
+        x = np.abs(values/round_unit)
+        rounded = np.floor(x)
+        rounded += (x - rounded) >= 0.5
+        new_values = round_unit*np.copysign(rounded, values)
+
+        output.append(zip(epochs, new_values.tolist()))
     
     return output
 
@@ -465,6 +752,12 @@ def non_discrete_frecuencies(values, lower_limit = 0, upper_limit = None, n_ints
     except:
         return {'error': json.dumps({'error': 'lower_limit is not numeric'})}
 
+    # Values out of the range, or null, are not counted
+    try:
+        values = np.asarray(values, dtype = np.float64)
+    except:
+        return {'error': json.dumps({'error': 'values are not numeric'})}
+
     # Check the value of upper_limit or get it if it is None
     if upper_limit != None:
         try:
@@ -473,9 +766,11 @@ def non_discrete_frecuencies(values, lower_limit = 0, upper_limit = None, n_ints
             return {'error': json.dumps({'error': 'upper_limit is not numeric'})}
     else:
         try:
-            upper_limit = max(values)
+            upper_limit = float(np.nanmax(values))
         except:
             return {'error': json.dumps({'error': 'unable to find upper_limit'})}
+        if np.isnan(upper_limit):
+            return {'error': json.dumps({'error': 'unable to find upper_limit'})}
 
     # Check that upper_limit is greater than lower_limit
     if upper_limit <= lower_limit:
@@ -492,16 +787,38 @@ def non_discrete_frecuencies(values, lower_limit = 0, upper_limit = None, n_ints
 
     # Build results list
     l_int = float(upper_limit - lower_limit)/n_ints
-    results_list = [[lower_limit + i*l_int, upper_limit - (n_ints - i - 1)*l_int, 0] for i in range(n_ints)]
-
-    # Compute frecuencies
-    for ind, v in enumerate(values):
-        if v >= lower_limit and v < upper_limit:
-            results_list[int((v - lower_limit)/l_int)][2] += 1
+    counts = histogram_counts(values, lower_limit, upper_limit, n_ints).tolist()
+    results_list = [[lower_limit + i*l_int, upper_limit - (n_ints - i - 1)*l_int, counts[i]] for i in range(n_ints)]
 
     return results_list
 
 
+def histogram_counts(values, lower_limit, upper_limit, n_ints):
+
+    ''' Count the values falling in each of the n_ints intervals of equal
+        length between lower_limit and upper_limit. Intervals are closed on
+        the left and open on the right
+
+    .. arguments:
+    - (numpy array) values: float values, nan values are not counted
+    - (float) lower_limit: lower limit of the first interval
+    - (float) upper_limit: upper limit of the last interval
+    - (integer) n_ints: number of intervals
+
+    .. returns:
+    - on success: numpy array with the n_ints counts'''
+
+    l_int = float(upper_limit - lower_limit)/n_ints
+
+    values = values[~np.isnan(values)]
+    values = values[(values >= lower_limit) & (values < upper_limit)]
+
+    # Rounding can send the values next to upper_limit out of the last interval
+    bins = np.minimum(((values - lower_limit)/l_int).astype(np.int64), n_ints - 1)
+
+    return np.bincount(bins, minlength = n_ints)
+
+
 def distr_std_timeseries(timeseries, time_int = 900., monotony = 'increasing', reset_value = 0):
 
     '''Standardize a timeseries to intervals of time_int seconds
@@ -521,51 +838,17 @@ def distr_std_timeseries(timeseries, time_int = 900., monotony = 'increasing', r
  
     for ts in timeseries:
         
-        new_ts = []
         if len(ts) <= 1:
-            std_ts_list.append(new_ts)
+            std_ts_list.append([])
             continue
 
-        # Calculate the first standard moment after the beginning of the timeserie
-        # and insert it if there is a coincidence
-        epoch_pivot = int(ts[0][0]/time_int)*time_int
-        if epoch_pivot != ts[0][0]:
-            epoch_pivot += time_int
-
-        end_of_ts = False
-
-        i = 0
-
-        while not end_of_ts:
-
-            # If the pivot falls between two elements of the timeseries
-            # insert the interpolated value
-            if ts[i][0] <= epoch_pivot and ts[i + 1][0] > epoch_pivot:
+        epochs = [elem[0] for elem in ts]
+        values = [elem[1] for elem in ts]
 
-                t_1 = ts[i + 1][0] - ts[i][0]
-                t_2 = epoch_pivot - ts[i][0]
+        grid, new_values = linear_interpolation(epochs, values, time_int,
+            monotony = monotony, reset_value = reset_value)
 
-                # Handle the meter resets in an incremental meter
-                if ts[i][1] > ts[i + 1][1] and monotony == 'increasing':
-                    value = reset_value + (t_2/t_1)*(ts[i + 1][1] - reset_value)
-                # Handle the meter resets in a decremental meter
-                elif ts[i][1] < ts[i + 1][1] and monotony == 'decreasing':
-                    value = reset_value + (t_2/t_1)*(ts[i + 1][1] - reset_value)
-                else:
-                    value = ts[i][1] + (t_2/t_1)*(ts[i + 1][1] - ts[i][1]) 
-               
-                new_ts.append((epoch_pivot, value))
-                epoch_pivot += time_int
-
-            elif epoch_pivot >= ts[i + 1][0]:
-
-                if i == len(ts) - 2:
-                    end_of_ts = True
-                else:
-                    i += 1
-        
-            #print i, epoch_pivot, ts[i][0], ts[i+1][0]
-        std_ts_list.append(new_ts)
+        std_ts_list.append(zip(grid.tolist(), new_values.tolist()))
 
     return std_ts_list
 
@@ -591,97 +874,121 @@ def value_to_increments(timeseries, monotony = 'increasing', reset_value = 0.):
 
     for ts in timeseries:
 
-        new_ts = []
-        l = len(ts)
-        if l <= 1:
-            inc_ts_list.append(new_ts)
+        if len(ts) <= 1:
+            inc_ts_list.append([])
             continue
-        else:
 
-            for i in range(l - 1):
+        epochs, values = split_timeseries(ts)
 
-                # Handle the meter resets in an incremental meter
-                if ts[i][1] > ts[i + 1][1] and monotony == 'increasing':
-                    value = ts[i + 1][1] - reset_value
-                # Handle the meter resets in a decremental meter
-                elif ts[i][1] < ts[i + 1][1] and monotony == 'decreasing':
-                    value = ts[i + 1][1] - reset_value
-                else:
-                    value = ts[i + 1][1] - ts[i][1]
- 
-                new_ts.append([ts[i + 1][0], value])
+        # numpy does not subtract booleans, python does it as integers
+        if values.dtype.kind == 'b':
+            values = values.astype(np.int64)
+
+        new_values = values[1:]
+        old_values = values[:-1]
+        incs = new_values - old_values
+
+        # Handle the meter resets in incremental and decremental meters
+        if monotony == 'increasing':
+            resets = old_values > new_values
+        elif monotony == 'decreasing':
+            resets = old_values < new_values
+        else:
+            resets = np.zeros(len(incs), dtype = bool)
 
-        inc_ts_list.append(new_ts)
+        if resets.any():
+            incs = np.where(resets, new_values - reset_value, incs)
+
+        inc_ts_list.append([[e, inc] for e, inc in izip(epochs[1:], incs.tolist())])
 
     return inc_ts_list
 
 
 def clean_duplicated(timeseries):
 
+    ''' Keep only the elements of the timeseries whose value is
+        different from the value of the previous element
+
+    .. arguments:
+    - (list) timeseries: list of timeseries
+        [[(epoch_0_0, value_0_0),..., (epoch_0_n0, value_0_n0)], ... (n timeseries)]
+
+    .. returns:
+    - on success: list of timeseries without repeated consecutive values'''
+
     clean_ts_list = []
 
     for ts in timeseries:
     
-        new_ts = []
-
-        l = len(ts)
-
-        if l == 0:
-            clean_ts_list.append(new_ts)
-            continue
-        elif l == 1:
-            new_ts.append((ts[0][0], ts[0][1]))
-            clean_ts_list.append(new_ts)
+        if len(ts) <= 1:
+            clean_ts_list.append([tuple(elem) for elem in ts])
             continue
-        else:
 
-            pivot = 0
-            pivot_elem = ts[pivot]
-            new_ts.append(pivot_elem)
-            
-            for i in range(1, l):
-                if pivot_elem[1] != ts[i][1]:
-                    pivot = i
-                    pivot_elem = ts[i]
-                    new_ts.append(ts[i])
+        values = values_array([elem[1] for elem in ts])
 
-        clean_ts_list.append(new_ts)
+        changes = np.ones(len(values), dtype = bool)
+        changes[1:] = values[1:] != values[:-1]
+
+        clean_ts_list.append(list(compress(ts, changes)))
 
     return clean_ts_list
 
 
 def delete_critical_values(timeseries, critical_value):
 
-    deleted_ts_list = []
+    # The values are compared one by one, as python does, so that values
+    # of any type can be deleted
+    return [[elem for elem in ts if elem[1] != critical_value] for ts in timeseries]
 
-    for ts in timeseries:
+def gaussian(x,amp=1,mean=0,sigma=1):
+        return amp*np.exp(-(x-mean)**2/(2*sigma**2))
 
-        new_ts = []
+def gaussian_smooth(frec, p_width = 3):
 
-        for elem in ts:
-            if elem[1] != critical_value:
-                new_ts.append(elem)
+    ''' Smooth the frecuencies given by non_discrete_frecuencies with a
+        gaussian of standard deviation p_width times the interval length
 
-        deleted_ts_list.append(new_ts)
+    .. arguments:
+    - (list) frec: list of frecuencies
+        [(int_0, int_1, value_0), (int_1, int_2, value_1),..., (int_n_1, int_n, int_n_1)]
+    - (float) p_width: standard deviation of the gaussian, in number of intervals
 
-    return deleted_ts_list
+    .. returns:
+    - on success: list of smoothed frecuencies, with the same intervals'''
 
-def gaussian(x,amp=1,mean=0,sigma=1):
-        return amp*np.exp(-(x-mean)**2/(2*sigma**2))
+    y = np.array([elem[2] for elem in frec], dtype = np.float64)
 
-def gaussian_smooth(frec, p_width = 3):
+    w_avg = gaussian_kernel_smooth(y, p_width)
+
+    return [[elem[0], elem[1], w_avg[ind]] for ind, elem in enumerate(frec)]
+
+
+def gaussian_kernel_smooth(y, p_width = 3, truncate = 4.):
+
+    ''' Weighted average of each element of y and its neighbours, with
+        gaussian weights of standard deviation p_width elements. Neighbours
+        further than truncate standard deviations are not considered, their
+        weights are lower than exp(-truncate**2/2). At the edges only the
+        existing neighbours are averaged
+
+    .. arguments:
+    - (numpy array) y: values to smooth
+    - (float) p_width: standard deviation of the gaussian, in number of elements
+    - (float) truncate: width of the kernel, in standard deviations
+
+    .. returns:
+    - on success: numpy array with the smoothed values'''
+
+    n = len(y)
+    if n == 0:
+        return np.array([], dtype = np.float64)
 
-    gaussian_smooth = []
-    inc = frec[0][1] - frec[0][0]
-    width = inc * p_width
-    x = np.array([(float(elem[1]) + float(elem[0]))/2 for elem in frec])
-    y = np.array([elem[2] for elem in frec])
+    p_width = float(p_width)
+    radius = min([int(np.ceil(truncate*p_width)), n - 1])
+    kernel = gaussian(np.arange(-radius, radius + 1, dtype = np.float64), sigma = p_width)
 
-    for ind, elem in enumerate(frec):
-        gaussian_center = x[ind]
-        weights = gaussian(x, mean = gaussian_center, sigma = width)
-        w_avg = np.average(y, weights = weights)
-        gaussian_smooth.append([frec[ind][0], frec[ind][1], w_avg])
+    weighted_sum = np.convolve(y, kernel)[radius:radius + n]
+    weights = np.convolve(np.ones(n), kernel)[radius:radius + n]
 
-    return gaussian_smooth
+    return weighted_sum/weights
 
@@ -106,26 +106,8 @@ def column_range(params, tz_name = 'Europe/Madrid', now = None, int_type = 'left
         return {'column_start':('timeseries', now),
                 'column_finish': ('timeseries',now - TimeInSeconds.YEAR),
                 'column_count': np.minimum(TimeInSeconds.YEAR, qCount)}
-    elif qRange == 'this_hour':
-        return {'column_start':('timeseries', time_interval_end('hour', tz_name, now) - exc_r),
-                'column_finish': ('timeseries', time_interval_beginning('hour', tz_name, now) + exc_l),
-                'column_count': np.minimum(TimeInSeconds.HOUR, qCount)}
-    elif qRange == 'today':
-        return {'column_start':('timeseries', time_interval_end('day', tz_name, now) - exc_r),
-                'column_finish': ('timeseries', time_interval_beginning('day', tz_name, now) + exc_l),
-                'column_count': np.minimum(TimeInSeconds.DAY, qCount)}
-    elif qRange == 'this_week':
-        return {'column_start':('timeseries', time_interval_end('week', tz_name, now) - exc_r),
-                'column_finish': ('timeseries', time_interval_beginning('week', tz_name, now) + exc_l),
-                'column_count': np.minimum(TimeInSeconds.WEEK, qCount)}
-    elif qRange == 'this_month':
-        return {'column_start':('timeseries', time_interval_end('month', tz_name, now) - exc_r),
-                'column_finish': ('timeseries', time_interval_beginning('month', tz_name, now) + exc_l),
-                'column_count': np.minimum(TimeInSeconds.MONTH, qCount)}
-    elif qRange == 'this_year':
-        return {'column_start':('timeseries',  time_interval_end('month', tz_name, now) - exc_r),
-                'column_finish': ('timeseries', time_interval_beginning('year', tz_name, now) + exc_l),
-                'column_count': np.minimum(TimeInSeconds.YEAR, qCount)}
+    elif qRange in CALENDAR_RANGES:
+        return cached_calendar_column_range(qRange, tz_name, now, int_type, exc_l, exc_r, qCount)
     elif qRange:
         return {'error': 'unknown parameter range: {!s}'.format(qRange)}
 
@@ -162,12 +144,133 @@ def column_range(params, tz_name = 'Europe/Madrid', now = None, int_type = 'left
 
 
 
+# --------------------------------------------------------------------
+# Column ranges of the calendar intervals
+#
+# The column range of this_hour, today, this_week, this_month and this_year
+# is the same for any moment inside the interval, so it is computed once per
+# interval and kept in COLUMN_RANGES with the interval where it is valid.
+# The lookup only compares epochs, without asking for the interval again.
+
+# range: (time interval, its maximum length, interval where the range is valid)
+# this_year ends at the end of the current month, so it changes every month
+CALENDAR_RANGES = {'this_hour': ('hour', TimeInSeconds.HOUR, 'hour'),
+    'today': ('day', TimeInSeconds.DAY, 'day'),
+    'this_week': ('week', TimeInSeconds.WEEK, 'week'),
+    'this_month': ('month', TimeInSeconds.MONTH, 'month'),
+    'this_year': ('year', TimeInSeconds.YEAR, 'month')}
+
+COLUMN_RANGES = {}
+COLUMN_RANGES_SIZE = 1024
+COLUMN_RANGES_STATS = {'hits': 0, 'misses': 0}
+
+
+def cached_calendar_column_range(qRange, tz_name, now, int_type, exc_l, exc_r, qCount):
+
+    ''' Column range of a calendar interval, see column_range'''
+
+    key = (qRange, tz_name, int_type, qCount)
+    epoch = 60*int(now/60)
+
+    try:
+        cached = COLUMN_RANGES.get(key)
+    except TypeError:
+        # Counts that can not be hashed are not cached
+        key = None
+        cached = None
+
+    # Same convention as time_interval_beginning
+    if cached != None and cached[0] < epoch <= cached[1]:
+        COLUMN_RANGES_STATS['hits'] += 1
+        return dict(cached[2])
+
+    COLUMN_RANGES_STATS['misses'] += 1
+
+    time_int, length, valid_int = CALENDAR_RANGES[qRange]
+    beginning = time_interval_beginning(time_int, tz_name, now)
+    end = time_interval_end(valid_int, tz_name, now)
+    if type(beginning) == dict:
+        return beginning
+
+    columns = {'column_start': ('timeseries', end - exc_r),
+        'column_finish': ('timeseries', beginning + exc_l),
+        'column_count': np.minimum(length, qCount)}
+
+    if key != None:
+        if valid_int != time_int:
+            beginning = time_interval_beginning(valid_int, tz_name, now)
+        if len(COLUMN_RANGES) >= COLUMN_RANGES_SIZE:
+            COLUMN_RANGES.clear()
+        COLUMN_RANGES[key] = (beginning, end, columns)
+
+    return dict(columns)
+
+
+def column_range_cache_info():
+
+    ''' Return the hits and misses of the cache of calendar column ranges,
+        its hit rate and the number of ranges it keeps'''
+
+    hits = COLUMN_RANGES_STATS['hits']
+    misses = COLUMN_RANGES_STATS['misses']
+    hit_rate = float(hits)/(hits + misses) if hits + misses else 0.
+
+    return {'hits': hits, 'misses': misses, 'hit_rate': hit_rate, 'size': len(COLUMN_RANGES)}
+
+
+# --------------------------------------------------------------------
+# Boundary tables
+#
+# Sorted arrays with the epochs of the beginnings of the days, weeks, months
+# and years of a timezone in the range BOUNDARY_TABLE_RANGE. They are built
+# the first time they are needed and kept in BOUNDARY_TABLES, indexed by
+# (tz_name, time_int), so that the beginning and the end of an interval
+# can be found by binary search instead of asking pytz every time.
+
+BOUNDARY_TABLE_RANGE = [1262304000, 1893456000] # 1/1/2010 - 1/1/2030 UTC
+BOUNDARY_TABLES = {}
+
+CALENDAR_INTERVALS = ['year', 'month', 'week', 'day']
+
+
+def set_boundary_table_range(e_from, e_to):
+
+    ''' Change the range of epochs covered by the boundary tables.
+        The tables already built are discarded'''
+
+    BOUNDARY_TABLE_RANGE[:] = [int(e_from), int(e_to)]
+    BOUNDARY_TABLES.clear()
+
+
+def boundary_table(time_int, tz_name = 'Europe/Madrid'):
+
+    ''' Return the boundary table of time_int intervals in tz_name,
+        building it if it does not exist yet
+
+        .. arguments:
+            - (string) time_int : 'year', 'month', 'week' or 'day'
+            - (string) tz_name: name of a valid timezone
+
+        .. returns:
+            - sorted numpy array of int64 epochs covering BOUNDARY_TABLE_RANGE'''
+
+    key = (tz_name, time_int)
+
+    if key not in BOUNDARY_TABLES:
+        t_zone = pytz.timezone(tz_name)
+        [e_from, e_to] = BOUNDARY_TABLE_RANGE
+        first = tz_interval_beginning(time_int, t_zone, 60*int(e_from/60))
+        BOUNDARY_TABLES[key] = build_boundaries(time_int, t_zone, first, e_to)
+
+    return BOUNDARY_TABLES[key]
+
+
 # --------------------------------------------------------------------
 # Return the epoch corresponding to the beginning of the time interval
 # where the epoch is located
 #
 # .. arguments:
-#   - (string) time_int : 'year', 'month', 'week' or 'day'
+#   - (string) time_int : 'year', 'month', 'week', 'day' or 'hour'
 #   - (string) tz_name: name of the timezone of the locations we are working with
 #   - (integer) epoch_ref: epoch in utc, that references the time interval
 #       of which we want to get the beginning
@@ -189,10 +292,29 @@ def time_interval_beginning(time_int, tz_name = 'Europe/Madrid', epoch_ref = Non
     # part of the previous one
     epoch_ref = 60*int(epoch_ref/60)
 
-    # Get timezone object
-    if tz_name not in pytz.all_timezones:
+    if tz_name not in pytz.all_timezones_set:
         return {'error': json.dumps({'error': 'Invalid timezone given'})}
-    t_zone = pytz.timezone(tz_name)
+
+    if time_int == 'hour':
+        if epoch_ref % 3600 == 0:
+            return 3600*(int(epoch_ref/3600) - 1)
+        else:
+            return 3600*(int(epoch_ref/3600))
+    elif time_int not in CALENDAR_INTERVALS:
+        return {'error': json.dumps({'error': 'Invalid time interval given: %s' %str(time_int)})}
+
+    # Look for the beginning in the boundary table
+    table = boundary_table(time_int, tz_name)
+    if table[0] < epoch_ref <= table[-1]:
+        return int(table[np.searchsorted(table, epoch_ref) - 1])
+
+    return tz_interval_beginning(time_int, pytz.timezone(tz_name), epoch_ref)
+
+
+def tz_interval_beginning(time_int, t_zone, epoch_ref):
+
+    ''' Compute with pytz the beginning of the time interval where
+        epoch_ref is located. epoch_ref must be already truncated to minutes'''
 
     # Get datetime used as reference and localize it in the given timezone
     try:
@@ -201,32 +323,142 @@ def time_interval_beginning(time_int, tz_name = 'Europe/Madrid', epoch_ref = Non
         return {'error': json.dumps({'error': 'Invalid datetime given'})}
 
     # Get datetime of the beginning of the time_interval
-    '''y = dt_r.year
-    m = dt_r.month
-    d = dt_r.day
-    wd = dt_r.weekday()
-    h = dt_r.hour
-    mt = dt_r.minute'''
     dtt = dt_tuple(dt_r)
-    #print dtt.as_dict()
     dtt.shift()
-    #print dtt.as_dict()
     if time_int == 'year':
-        dt = t_zone.localize(datetime(dtt.y, 1, 1))
+        return local_date_epoch(t_zone, dtt.y, 1, 1)
     elif time_int == 'month':
-        dt = t_zone.localize(datetime(dtt.y, dtt.m, 1))
+        return local_date_epoch(t_zone, dtt.y, dtt.m, 1)
     elif time_int == 'week':
-        dt = t_zone.localize(datetime(dtt.y, dtt.m, dtt.d)) - timedelta(dtt.w)
-    elif time_int == 'day':
-        dt = t_zone.localize(datetime(dtt.y, dtt.m, dtt.d))
-    elif time_int == 'hour':
-        #dt = t_zone.localize(datetime(y, m, d, h))
-        if epoch_ref % 3600 == 0:
-            return 3600*(int(epoch_ref/3600) - 1)
-        else:
-            return 3600*(int(epoch_ref/3600))
+        d = datetime(dtt.y, dtt.m, dtt.d) - timedelta(dtt.w)
+        return local_date_epoch(t_zone, d.year, d.month, d.day)
     else:
-        return {'error': json.dumps({'error': 'Invalid time interval given: %s' %str(time_int)})}
+        return local_date_epoch(t_zone, dtt.y, dtt.m, dtt.d)
+
+
+def time_interval_beginnings(time_int, epochs, tz_name = 'Europe/Madrid'):
+
+    ''' Vectorized version of time_interval_beginning
+
+        .. arguments:
+            - (string) time_int : 'year', 'month', 'week', 'day' or 'hour'
+            - (array) epochs: epochs in utc
+            - (string) tz_name: name of the timezone of the locations we are working with
+
+        .. returns:
+            - on success: numpy array with the beginning of the interval of each epoch
+            - on error: dictionary with an error description'''
+
+    epochs = np.asarray(epochs, dtype = np.int64)
+    if len(epochs) == 0:
+        return np.array([], dtype = np.int64)
+
+    bounds = interval_boundaries(time_int, tz_name, epochs.min(), epochs.max())
+    if type(bounds) == dict:
+        return bounds
+
+    return bounds[np.searchsorted(bounds + 60, epochs, side = 'right') - 1]
+
+
+def time_interval_ends(time_int, epochs, tz_name = 'Europe/Madrid'):
+
+    ''' Vectorized version of time_interval_end
+
+        .. arguments:
+            - (string) time_int : 'year', 'month', 'week', 'day' or 'hour'
+            - (array) epochs: epochs in utc
+            - (string) tz_name: name of the timezone of the locations we are working with
+
+        .. returns:
+            - on success: numpy array with the end of the interval of each epoch
+            - on error: dictionary with an error description'''
+
+    epochs = np.asarray(epochs, dtype = np.int64)
+    if len(epochs) == 0:
+        return np.array([], dtype = np.int64)
+
+    bounds = interval_boundaries(time_int, tz_name, epochs.min(), epochs.max())
+    if type(bounds) == dict:
+        return bounds
+
+    return bounds[np.searchsorted(bounds + 60, epochs, side = 'right')]
+
+
+def interval_boundaries(time_int, tz_name = 'Europe/Madrid', e_from = None, e_to = None):
+
+    ''' Return the epochs of the beginnings of all the time intervals of
+        type time_int that contain some moment between e_from and e_to,
+        followed by the beginning of the next interval.
+
+        The boundaries follow the same convention as time_interval_beginning,
+        so an epoch x belongs to the interval starting at bounds[i] when
+        bounds[i] < 60*int(x/60) <= bounds[i + 1]
+
+        .. arguments:
+            - (string) time_int : 'year', 'month', 'week', 'day' or 'hour'
+            - (string) tz_name: name of the timezone of the locations we are working with
+            - (integer) e_from: first epoch of the range
+            - (integer) e_to: last epoch of the range
+
+        .. returns:
+            - on success: sorted numpy array of int64 epochs
+            - on error: dictionary with an error description'''
+
+    if e_to == None:
+        e_to = int(time.time())
+    if e_from == None:
+        e_from = e_to
+
+    e_from = int(e_from)
+    e_to = 60*int(int(e_to)/60)
+
+    first = time_interval_beginning(time_int, tz_name, e_from)
+    if type(first) == dict:
+        return first
+
+    if time_int == 'hour':
+        return np.arange(first, e_to + TimeInSeconds.HOUR, TimeInSeconds.HOUR, dtype = np.int64)
+
+    # Slice the boundary table when it covers the range
+    table = boundary_table(time_int, tz_name)
+    if table[0] <= first and e_to <= table[-1]:
+        i_from = np.searchsorted(table, first)
+        i_to = np.searchsorted(table, e_to)
+        return table[i_from:i_to + 1].copy()
+
+    return build_boundaries(time_int, pytz.timezone(tz_name), first, e_to)
+
+
+def build_boundaries(time_int, t_zone, first, e_to):
+
+    ''' Return the beginnings of the consecutive time_int intervals in t_zone
+        starting at the beginning first until one greater or equal than e_to'''
+
+    d = datetime.fromtimestamp(first, t_zone).date()
+
+    bounds = [first]
+    while bounds[-1] < e_to:
+        if time_int == 'year':
+            d = d.replace(year = d.year + 1)
+        elif time_int == 'month':
+            if d.month == 12:
+                d = d.replace(year = d.year + 1, month = 1)
+            else:
+                d = d.replace(month = d.month + 1)
+        elif time_int == 'week':
+            d = d + timedelta(7)
+        else:
+            d = d + timedelta(1)
+        bounds.append(local_date_epoch(t_zone, d.year, d.month, d.day))
+
+    return np.array(bounds, dtype = np.int64)
+
+
+def local_date_epoch(t_zone, y, m, d):
+
+    ''' Return the epoch of the midnight of day y-m-d in the timezone t_zone'''
+
+    dt = t_zone.localize(datetime(y, m, d))
 
     # Get offset of the t_zone in that moment of time
     offset_string = dt.strftime("%z")
@@ -240,7 +472,7 @@ def time_interval_beginning(time_int, tz_name = 'Europe/Madrid', epoch_ref = Non
 def from_epoch_obtain_ymwdh(epoch, ymwdh, tz_name = 'Europe/Madrid', shift = True):
 
     # Get timezone object
-    if tz_name not in pytz.all_timezones:
+    if tz_name not in pytz.all_timezones_set:
         return {'error': json.dumps({'error': 'Invalid timezone given'})}
     t_zone = pytz.timezone(tz_name)
 
@@ -344,10 +576,29 @@ def time_interval_end(time_int, tz_name = 'Europe/Madrid', epoch_ref = None):
     # part of the previous one
     epoch_ref = 60*int(epoch_ref/60)
 
-    # Get timezone object
-    if tz_name not in pytz.all_timezones:
+    if tz_name not in pytz.all_timezones_set:
         return {'error': json.dumps({'error': 'Invalid timezone given'})}
-    t_zone = pytz.timezone(tz_name)
+
+    if time_int == 'hour':
+        if epoch_ref % 3600 == 0:
+            return 3600*(int(epoch_ref/3600))
+        else:
+            return 3600*(int(epoch_ref/3600) + 1)
+    elif time_int not in CALENDAR_INTERVALS:
+        return {'error': json.dumps({'error': 'Invalid time interval given: %s' %str(time_int)})}
+
+    # Look for the end in the boundary table
+    table = boundary_table(time_int, tz_name)
+    if table[0] < epoch_ref <= table[-1]:
+        return int(table[np.searchsorted(table, epoch_ref)])
+
+    return tz_interval_end(time_int, pytz.timezone(tz_name), epoch_ref)
+
+
+def tz_interval_end(time_int, t_zone, epoch_ref):
+
+    ''' Compute with pytz the end of the time interval where
+        epoch_ref is located. epoch_ref must be already truncated to minutes'''
 
     # Get datetime used as reference and localize it in the given timezone
     try:
@@ -357,43 +608,344 @@ def time_interval_end(time_int, tz_name = 'Europe/Madrid', epoch_ref = None):
 
     # Get datetime of the end of the time_interval
     dtt = dt_tuple(dt_r)
-    #print dtt.as_dict()
     dtt.shift()
-    #print dtt.as_dict()
 
     if time_int == 'year':
-        y = dtt.y + 1
-        dt = t_zone.localize(datetime(y, 1, 1))
+        return local_date_epoch(t_zone, dtt.y + 1, 1, 1)
     elif time_int == 'month':
         if dtt.m == 12:
-            m = 1
-            y = dtt.y + 1
+            return local_date_epoch(t_zone, dtt.y + 1, 1, 1)
         else:
-            m = dtt.m + 1
-            y = dtt.y
-        dt = t_zone.localize(datetime(y, m, 1))
+            return local_date_epoch(t_zone, dtt.y, dtt.m + 1, 1)
     elif time_int == 'week':
-        wd = 7 - dtt.w
-        dt = t_zone.localize(datetime(dtt.y, dtt.m, dtt.d)) + timedelta(wd)
-    elif time_int == 'day':
-        dt = t_zone.localize(datetime(dtt.y, dtt.m, dtt.d)) + timedelta(1)
-    elif time_int == 'hour':
-        #dt = t_zone.localize(datetime(y, m, d, h)) + timedelta(hours = 1)
-        if epoch_ref % 3600 == 0:
-            return 3600*(int(epoch_ref/3600))
+        d = datetime(dtt.y, dtt.m, dtt.d) + timedelta(7 - dtt.w)
+    else:
+        d = datetime(dtt.y, dtt.m, dtt.d) + timedelta(1)
+
+    return local_date_epoch(t_zone, d.year, d.month, d.day)
+
+
+
+def linear_interpolation(epochs, values, time_int, monotony = 'increasing', reset_value = 0.):
+
+    ''' Interpolate linearly the values of a timeserie at the multiples of time_int
+        from its first epoch to its last one, the last one excluded.
+
+        When the timeserie comes from a meter, the interpolation between two
+        values across a reset of the meter starts from reset_value
+
+        .. arguments:
+            - (array) epochs: sorted epochs of the timeserie
+            - (array) values: numeric values of the timeserie
+            - (number) time_int: number of seconds between the new epochs
+            - (string) monotony: increasing / decreasing / non_monotonous
+            - (float) reset_value: value to which the meter is reseted
+
+        .. returns:
+            - (grid, new_values) numpy arrays with the new epochs and their values'''
+
+    epochs = np.asarray(epochs)
+    values = np.asarray(values, dtype = np.float64)
+
+    if len(epochs) <= 1:
+        return np.array([]), np.array([])
+
+    # First standard moment after the beginning of the timeserie
+    first = int(epochs[0]/time_int)*time_int
+    if first != epochs[0]:
+        first += time_int
+
+    grid = np.arange(first, epochs[-1], time_int)
+
+    # Interval of the timeserie in which falls each new epoch
+    k = np.searchsorted(epochs, grid, side = 'right') - 1
+    fraction = (grid - epochs[k]).astype(np.float64)/(epochs[k + 1] - epochs[k])
+
+    # Handle the meter resets in incremental and decremental meters
+    base = values[k]
+    if monotony == 'increasing':
+        base = np.where(values[k] > values[k + 1], reset_value, base)
+    elif monotony == 'decreasing':
+        base = np.where(values[k] < values[k + 1], reset_value, base)
+
+    return grid, base + fraction*(values[k + 1] - base)
+
+
+ALIGNMENTS = ['inner', 'outer', 'asof']
+ASOF_DIRECTIONS = ['backward', 'forward', 'nearest']
+
+
+def align_timeseries(epochs_1, values_1, epochs_2, values_2, align = 'inner', fill_value = 0.,
+    direction = 'backward', tolerance = None):
+
+    ''' Align the values of two timeseries on common epochs
+
+        .. arguments:
+            - (numpy array) epochs_1, values_1: epochs and values of the first timeserie
+            - (numpy array) epochs_2, values_2: epochs and values of the second timeserie
+            - (string) align: one of ALIGNMENTS
+                - inner: epochs present in both timeseries
+                - outer: epochs present in any of them, missing values are fill_value
+                - asof: epochs of the first timeserie, with the value of the
+                    second one paired with each epoch, see asof_positions.
+                    Epochs without a paired value are discarded
+            - (float) fill_value: value of the missing values in outer alignment
+            - (string) direction, (float) tolerance: pairing of the asof
+                alignment, see asof_positions
+
+        .. returns:
+            - on success: tuple (epochs, values_1, values_2) of sorted epochs and
+                the values of both timeseries on them
+            - on error: dictionary with an error description'''
+
+    if align not in ALIGNMENTS:
+        return {'error': 'Unknown alignment: %s' %str(align)}
+
+    epochs_1, values_1 = sort_epochs(epochs_1, values_1)
+    epochs_2, values_2 = sort_epochs(epochs_2, values_2)
+
+    if align == 'outer':
+        epochs = np.union1d(epochs_1, epochs_2)
+        new_values_1 = np.full(len(epochs), fill_value, dtype = np.float64)
+        new_values_1[np.searchsorted(epochs, epochs_1)] = values_1
+        new_values_2 = np.full(len(epochs), fill_value, dtype = np.float64)
+        new_values_2[np.searchsorted(epochs, epochs_2)] = values_2
+        return epochs, new_values_1, new_values_2
+
+    if align == 'asof':
+        r = asof_positions(epochs_1, epochs_2, direction = direction, tolerance = tolerance)
+        if type(r) == dict:
+            return r
+        pos, found = r
+    else:
+        pos = np.searchsorted(epochs_2, epochs_1)
+        found = pos < len(epochs_2)
+        found[found] = epochs_2[pos[found]] == epochs_1[found]
+
+    return epochs_1[found], values_1[found], values_2[pos[found]]
+
+
+def asof_positions(epochs_1, epochs_2, direction = 'backward', tolerance = None):
+
+    ''' Pair each epoch of epochs_1 with an epoch of epochs_2, both of them sorted.
+        All the epochs_1 are searched at once in epochs_2, which is the
+        vectorized form of walking both arrays with two pointers
+
+        .. arguments:
+            - (numpy array) epochs_1: sorted epochs to be paired
+            - (numpy array) epochs_2: sorted epochs to pair them with
+            - (string) direction: one of ASOF_DIRECTIONS
+                - backward: last epoch at or before each epoch
+                - forward: first epoch at or after each epoch
+                - nearest: closest epoch, the backward one on ties
+            - (float) tolerance: maximum distance between paired epochs,
+                no limit if it is None
+
+        .. returns:
+            - on success: tuple (pos, found) of numpy arrays with the position
+                in epochs_2 of the epoch paired with each of the epochs_1,
+                and whether it has been paired at all
+            - on error: dictionary with an error description'''
+
+    if direction not in ASOF_DIRECTIONS:
+        return {'error': 'Unknown direction: %s' %str(direction)}
+
+    n_2 = len(epochs_2)
+    if n_2 == 0:
+        return np.zeros(len(epochs_1), dtype = np.int64), np.zeros(len(epochs_1), dtype = bool)
+
+    backward = np.searchsorted(epochs_2, epochs_1, side = 'right') - 1
+
+    if direction == 'backward':
+        pos = backward
+        found = pos >= 0
+    else:
+        forward = np.searchsorted(epochs_2, epochs_1, side = 'left')
+        if direction == 'forward':
+            pos = forward
+            found = pos < n_2
         else:
-            return 3600*(int(epoch_ref/3600) + 1)
+            # Out of range positions fall on the other side, which is then the nearest
+            backward = np.clip(backward, 0, n_2 - 1)
+            forward = np.clip(forward, 0, n_2 - 1)
+            closer = np.abs(epochs_2[forward] - epochs_1) < np.abs(epochs_1 - epochs_2[backward])
+            pos = np.where(closer, forward, backward)
+            found = np.ones(len(epochs_1), dtype = bool)
+
+    pos = np.where(found, pos, 0)
+    if tolerance is not None:
+        found &= np.abs(epochs_2[pos] - epochs_1) <= tolerance
+
+    return pos, found
+
+
+def sort_epochs(epochs, values):
+
+    ''' Sort epochs and values by epoch, if they are not sorted yet'''
+
+    if len(epochs) > 1 and np.any(epochs[1:] < epochs[:-1]):
+        order = np.argsort(epochs, kind = 'mergesort')
+        return epochs[order], values[order]
+
+    return epochs, values
+
+
+def run_length_encoding(values):
+
+    ''' Return the positions where the runs of equal consecutive values
+        of a numpy array begin. The values of the runs are values[starts]
+        and their lengths np.diff(np.append(starts, len(values)))'''
+
+    if len(values) == 0:
+        return np.zeros(0, dtype = np.int64)
+
+    return np.append(0, np.flatnonzero(values[1:] != values[:-1]) + 1)
+
+
+def split_timeseries(ts):
+
+    ''' Split a timeserie given as a list of tuples
+        [(epoch_0, value_0), ..., (epoch_n, value_n)] in the list of its
+        epochs and the numpy array of its values, see values_array'''
+
+    if len(ts) == 0:
+        return [], np.array([])
+
+    # Unpacking with zip(*ts) is much slower on long timeseries
+    epochs = [elem[0] for elem in ts]
+    values = [elem[1] for elem in ts]
+
+    return epochs, values_array(values)
+
+
+def values_array(values):
+
+    ''' Return a numpy array with the given values. Numeric values
+        give a numeric array and any other kind of values an array
+        of python objects, so that comparisons behave as in python'''
+
+    arr = np.asarray(values)
+
+    if arr.dtype.kind not in 'biuf':
+        arr = np.empty(len(values), dtype = object)
+        arr[:] = values
+
+    return arr
+
+
+# --------------------------------------------------------------------
+# Streaming aggregates
+#
+# An accumulator is a dictionary with the count, sum, mean, sum of squared
+# deviations from the mean (m2), minimum, maximum and last epoch of the
+# values seen so far. It can be fed chunk by chunk with accumulate and
+# accumulators computed on different parts of a timeserie can be combined
+# with merge_accumulators, in any order. Accumulators only contain numbers
+# and None, so they can be sent between processes as json.
+
+AGGREGATES = ['sum', 'count', 'min', 'max', 'mean', 'std']
+
+
+def new_accumulator():
+
+    return {'count': 0, 'sum': 0., 'mean': 0., 'm2': 0., 'min': None, 'max': None, 'epoch': None}
+
+
+def accumulate(acc, values, epochs = None):
+
+    ''' Add a chunk of values to an accumulator. Null values are ignored
+
+        .. arguments:
+            - (dict) acc: accumulator, see new_accumulator
+            - (list or numpy array) values: numeric values
+            - (list or numpy array) epochs: epochs of the values
+
+        .. returns:
+            - on success: the updated accumulator
+            - on error: dictionary with an error description'''
+
+    try:
+        values = np.asarray(values, dtype = np.float64)
+    except:
+        return {'error': 'Non scalar values found'}
+
+    values = values[~np.isnan(values)]
+
+    if epochs is not None and len(epochs) > 0:
+        epoch = int(np.max(epochs))
+        if acc['epoch'] == None or epoch > acc['epoch']:
+            acc['epoch'] = epoch
+
+    if len(values) == 0:
+        return acc
+
+    mean = float(np.mean(values))
+    chunk = {'count': len(values), 'sum': float(np.sum(values)), 'mean': mean,
+        'm2': float(np.sum((values - mean)**2)), 'min': float(np.min(values)),
+        'max': float(np.max(values)), 'epoch': acc['epoch']}
+
+    acc.update(merge_accumulators(acc, chunk))
+
+    return acc
+
+
+def merge_accumulators(acc_1, acc_2):
+
+    ''' Combine the accumulators of two parts of a timeserie. The mean and
+        the m2 are combined with the parallel version of Welford's algorithm
+
+        .. arguments:
+            - (dict) acc_1, acc_2: accumulators, see new_accumulator
+
+        .. returns:
+            - the accumulator of the whole timeserie'''
+
+    n_1 = acc_1['count']
+    n_2 = acc_2['count']
+
+    if n_2 == 0:
+        merged = dict(acc_1)
+    elif n_1 == 0:
+        merged = dict(acc_2)
     else:
-        return {'error': json.dumps({'error': 'Invalid time interval given: %s' %str(time_int)})}
+        n = n_1 + n_2
+        delta = acc_2['mean'] - acc_1['mean']
+        merged = {'count': n, 'sum': acc_1['sum'] + acc_2['sum'],
+            'mean': acc_1['mean'] + delta*n_2/n,
+            'm2': acc_1['m2'] + acc_2['m2'] + delta**2*n_1*n_2/n,
+            'min': min([acc_1['min'], acc_2['min']]),
+            'max': max([acc_1['max'], acc_2['max']])}
 
-    # Get offset of the t_zone in that moment of time
-    offset_string = dt.strftime("%z")
-    offset = int(offset_string[1:3]) * 3600 + int(offset_string[3:5])*60
-    if offset_string[0] == '-': offset *= -1
+    epochs = [e for e in [acc_1['epoch'], acc_2['epoch']] if e != None]
+    merged['epoch'] = max(epochs) if epochs else None
 
-    # return the epoch with the offset
-    return calendar.timegm(dt.timetuple()) - offset
+    return merged
+
+
+def accumulator_value(acc, agg):
 
+    ''' Return the aggregate agg, one of AGGREGATES, of the values seen by
+        an accumulator. The standard deviation is the population one, as
+        numpy.std. Aggregates of no values are None, except the sum and
+        the count that are 0
+
+        .. returns:
+            - on success: the value of the aggregate
+            - on error: dictionary with an error description'''
+
+    if agg not in AGGREGATES:
+        return {'error': 'Unknown aggregate: %s' %str(agg)}
+
+    if agg == 'count':
+        return acc['count']
+    elif agg == 'sum':
+        return acc['sum']
+    elif acc['count'] == 0:
+        return None
+    elif agg == 'std':
+        return float(np.sqrt(acc['m2']/acc['count']))
+    else:
+        return acc[agg]
 
 
 def rearrange_timeseries(oDict):
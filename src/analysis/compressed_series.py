@@ -0,0 +1,183 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Compressed in memory timeseries. The epochs are stored as
+# delta-of-delta and the values XOR-ed with the previous one, in
+# chunks that are decoded with array operations
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+import struct
+import numpy as np
+
+from analysis_utils import sort_epochs
+
+# Each chunk is a string with:
+#   - header: number of values (uint32), first epoch (int64), first difference
+#       between epochs (int64), bits of the first value (uint64), bytes of each
+#       delta-of-delta, bytes of each XOR and trailing zero bits removed from
+#       the XORs (uint8), 1 padding byte
+#   - bitmap of the non zero delta-of-deltas, followed by them zigzag
+#       encoded, each one in its bytes
+#   - bitmap of the non zero XORs of each value with the previous one,
+#       followed by them without the trailing zero bits, each one in its bytes
+# Regular epochs and repeated values only take one bit for each value.
+CHUNK_HEADER = struct.Struct('<IqqQBBBx')
+CHUNK_SIZE = 1024
+
+# values are XOR-ed as the unsigned integers with the same bits
+VALUE_TYPES = {'f': np.dtype('<f8'), 'i': np.dtype('<i8')}
+
+
+class CompressedSeries(object):
+
+    ''' Immutable compressed timeserie of numeric values. The first and last
+        epochs of each chunk are kept uncompressed, so that a range of epochs
+        only decodes the chunks containing it
+
+    .. arguments:
+    - (epochs) array of epochs
+    - (values) array of float or integer values, of the same length
+    - (chunk_size) integer: number of values of each chunk'''
+
+    def __init__(self, epochs, values, chunk_size = CHUNK_SIZE):
+
+        chunk_size = int(chunk_size)
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be positive')
+
+        epochs, values = sort_epochs(np.asarray(epochs, dtype = np.int64), np.asarray(values))
+
+        kind = 'i' if values.dtype.kind in 'iub' else values.dtype.kind
+        if kind not in VALUE_TYPES:
+            raise TypeError('Only numeric values can be compressed')
+
+        self.dtype = VALUE_TYPES[kind]
+        self.length = len(epochs)
+
+        bits = values.astype(self.dtype).view('<u8')
+        bounds = range(0, self.length, chunk_size)
+
+        self.chunks = tuple(encode_chunk(epochs[s:s + chunk_size], bits[s:s + chunk_size])
+            for s in bounds)
+        self.firsts = epochs[bounds]
+        self.lasts = epochs[[min(s + chunk_size, self.length) - 1 for s in bounds]]
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        return sum(len(chunk) for chunk in self.chunks) + self.firsts.nbytes + self.lasts.nbytes
+
+    def decode(self, e_from = None, e_to = None):
+
+        ''' Epochs and values of the timeserie between e_from and e_to, both
+            included, the whole timeserie by default
+
+        .. returns:
+            (epochs, values) arrays'''
+
+        first = 0 if e_from == None else np.searchsorted(self.lasts, e_from)
+        last = len(self.chunks) if e_to == None else np.searchsorted(self.firsts, e_to, side = 'right')
+
+        if first >= last:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = self.dtype)
+
+        decoded = [decode_chunk(chunk) for chunk in self.chunks[first:last]]
+        epochs = np.concatenate([elem[0] for elem in decoded])
+        values = np.concatenate([elem[1] for elem in decoded]).view(self.dtype)
+
+        # only the first and last chunks may have epochs out of the range
+        start = 0 if e_from == None else np.searchsorted(epochs, e_from)
+        end = len(epochs) if e_to == None else np.searchsorted(epochs, e_to, side = 'right')
+
+        return epochs[start:end], values[start:end]
+
+
+def encode_chunk(epochs, bits):
+
+    n = len(epochs)
+    delta = int(epochs[1] - epochs[0]) if n > 1 else 0
+
+    # zigzag encoding of the delta-of-deltas, so that small negative ones are small too
+    dod = np.diff(epochs, 2)
+    dod_mask, dod_data, dod_width, shift = encode_words(((dod << 1) ^ (dod >> 63)).view('<u8'))
+
+    xor_mask, xor_data, xor_width, shift = encode_words(bits[1:] ^ bits[:-1], shift = True)
+
+    header = CHUNK_HEADER.pack(n, epochs[0], delta, bits[0], dod_width, xor_width, shift)
+
+    return ''.join([header, dod_mask, dod_data, xor_mask, xor_data])
+
+
+def encode_words(words, shift = False):
+
+    ''' Bitmap of the non zero words and their bytes, without the trailing
+        zero bits common to all of them if shift'''
+
+    mask = words != 0
+    non_zero = words[mask]
+
+    n_shift = 0
+    if shift and len(non_zero):
+        common = int(np.bitwise_or.reduce(non_zero))
+        n_shift = (common & -common).bit_length() - 1
+        non_zero = non_zero >> np.uint64(n_shift)
+
+    width = (int(non_zero.max()).bit_length() + 7)//8 if len(non_zero) else 0
+    data = non_zero.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :width].tostring()
+
+    return np.packbits(mask).tostring(), data, width, n_shift
+
+
+def decode_words(chunk, offset, n, width, shift = 0):
+
+    ''' Words encoded with encode_words from offset, and the offset after them'''
+
+    n_mask = (n + 7)//8
+    mask = np.unpackbits(np.frombuffer(chunk, dtype = np.uint8, count = n_mask,
+        offset = offset))[:n].astype(bool)
+    offset += n_mask
+
+    n_words = int(mask.sum())
+    data = np.zeros((n_words, 8), dtype = np.uint8)
+    data[:, :width] = np.frombuffer(chunk, dtype = np.uint8, count = n_words*width,
+        offset = offset).reshape(n_words, width)
+    offset += n_words*width
+
+    words = np.zeros(n, dtype = np.uint64)
+    words[mask] = data.view('<u8').ravel() << np.uint64(shift)
+
+    return words, offset
+
+
+def decode_chunk(chunk):
+
+    ''' Epochs and bits of the values of a chunk encoded with encode_chunk'''
+
+    n, first, delta, first_bits, dod_width, xor_width, shift = CHUNK_HEADER.unpack_from(chunk)
+    offset = CHUNK_HEADER.size
+
+    zigzag, offset = decode_words(chunk, offset, max(n - 2, 0), dod_width)
+    dod = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+
+    deltas = np.empty(n, dtype = np.int64)
+    deltas[0] = 0
+    deltas[1:] = delta
+    deltas[2:] += np.cumsum(dod)
+    epochs = first + np.cumsum(deltas)
+
+    xor, offset = decode_words(chunk, offset, n - 1, xor_width, shift)
+    xor = np.concatenate([np.array([first_bits], dtype = np.uint64), xor])
+
+    return epochs, np.bitwise_xor.accumulate(xor)
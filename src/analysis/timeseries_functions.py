@@ -18,12 +18,13 @@
 import pandas as pd
 import inspect as ip
 import numpy as np
-from copy import deepcopy
 import json
+import struct
 import time
 
 import analysis_functions as af
 import analysis_utils as au
+import compressed_series as cs
 from common.util import type_conversion
 from common.constants import TimeInSeconds
 
@@ -40,8 +41,10 @@ def ts_list_function():
                 if 'error' in cts:
                     return cts
 
+            argspec = ip.getargspec(func)
             for elem in kwargs:
-                if elem not in ip.getargspec(func)[0]:
+                # functions with **kwargs check their own keyword arguments
+                if elem not in argspec[0] and argspec[2] == None:
                     return {'error': 'unknown argument %s' %elem}
 
             result = func(*args, **kwargs)            
@@ -52,12 +55,16 @@ def ts_list_function():
 
 def check_ts_list(ts_list):
 
-    if type(ts_list) != list:
+    if not isinstance(ts_list, list):
         if 'error' in ts_list:
             return ts_list
         else:
             return {'error': 'Not a list of timeseries'}
 
+    # The timeseries of a block share the index, checking one is enough
+    if is_block(ts_list):
+        ts_list = ts_list[:1]
+
     for ts in ts_list:
         #check if it is a timeserie
         ct = check_ts(ts)
@@ -93,6 +100,11 @@ def check_ts(ts):
 def call_ts_func(ts_func):
 
     def call(ts_list, **kwargs):
+        # Scalar functions work on the whole block at once
+        if hasattr(ts_func, 'operation') and is_block(ts_list) and \
+                len(ts_list) > 0 and len(ts_list.epochs) > 0:
+            return block_scalar(ts_list, ts_func.operation, **kwargs)
+
         output = []
         for ts in ts_list:
             result = ts_func(ts, **kwargs)
@@ -104,10 +116,152 @@ def call_ts_func(ts_func):
         return output
     return call
 
+
+# ----------------------- Columnar timeseries lists -------------------------------
+
+class TsBlock(list):
+
+    ''' Timeseries list whose timeseries share the same epochs. The values
+        are kept in a 2-D float array with a column for each timeserie, and
+        each DataFrame of the list is a view of one column on a shared index,
+        so the list can be used as any other timeseries list.
+
+        Scalar and pair functions work on the whole block at once while the
+        list is not modified, see is_block. Aggregates are computed on the
+        values of a single timeserie block as they are, and fail at once for
+        several, as their aggregates share the epoch. The DataFrames must not
+        be modified in place, as the ones returned by the rest of functions'''
+
+    def __init__(self, epochs, values):
+        self.values = np.asfortranarray(values, dtype = np.float64)
+        list.__init__(self, block_to_ts_list(np.asarray(epochs, dtype = np.int64), self.values))
+        self.frames = tuple(self)
+        self.index = self.frames[0].index if self.frames else pd.Index(epochs)
+        self.epochs = self.index.values
+
+
+def is_block(ts_list):
+
+    ''' Check if ts_list is a TsBlock still holding the DataFrames it was built with'''
+
+    return type(ts_list) == TsBlock and len(ts_list) == len(ts_list.frames) and \
+        all(ts is frame for (ts, frame) in zip(ts_list, ts_list.frames))
+
+
+@ts_list_function()
+def columnar(ts_list):
+
+    ''' Return ts_list as a TsBlock when its timeseries have float values and
+        the same epochs, as the ones distributed between the same epochs do.
+        Otherwise ts_list is returned as it is'''
+
+    if is_block(ts_list) or len(ts_list) == 0:
+        return ts_list
+
+    epochs = ts_list[0].index.values
+    for ts in ts_list:
+        if ts['value'].dtype != np.float64:
+            return ts_list
+        if not (ts.index.values is epochs or np.array_equal(ts.index.values, epochs)):
+            return ts_list
+
+    values = np.empty((len(epochs), len(ts_list)), dtype = np.float64, order = 'F')
+    for (j, ts) in enumerate(ts_list):
+        values[:, j] = ts['value'].values
+
+    return TsBlock(epochs, values)
+
+
+def block_scalar(ts_block, operation, number):
+
+    ''' Apply the operation of a scalar function, see scalar_func, to all the
+        values of a TsBlock at once'''
+
+    try:
+        number = float(number)
+    except:
+        return {'error': 'number is not numeric'}
+
+    with np.errstate(all = 'ignore'):
+        values = operation({'value': ts_block.values}, number)
+
+    return block_or_list(ts_block.index, values, np.isfinite(values))
+
+
+def block_chain(ts_block, operations):
+
+    ''' Apply a chain of scalar functions, see scalar_chain, to all the
+        values of a TsBlock at once'''
+
+    values = ts_block.values
+    finite = np.ones(values.shape, dtype = bool)
+
+    for ind, (name, number) in enumerate(operations):
+
+        if name == 'scalar_power':
+            number = int(number)
+
+        # the timeseries left empty by the previous function are not scalar
+        if ind > 0 and not finite.any(axis = 0).all():
+            return {'error': 'Non scalar values found'}
+
+        try:
+            number = float(number)
+        except:
+            return {'error': 'number is not numeric'}
+
+        with np.errstate(all = 'ignore'):
+            values = SCALAR_FUNCTIONS[name][0].operation({'value': values}, number)
+        finite &= np.isfinite(values)
+
+    return block_or_list(ts_block.index, values, finite)
+
+
+def block_pair(ts_pair_func, ts_list_1, ts_list_2, **kwargs):
+
+    ''' Apply the operation of a pair function, see ts_pair_operation, to all
+        the values of two TsBlocks with the same epochs at once. Every
+        alignment keeps all the epochs then.
+
+    .. returns:
+    - on success: TsBlock, or timeseries list if some values are dropped
+    - on error: dictionary with an error description
+    - None if the timeseries lists are not such TsBlocks'''
+
+    if not (is_block(ts_list_1) and is_block(ts_list_2)):
+        return None
+
+    if len(ts_list_1) == 0 or len(ts_list_1.epochs) == 0 or \
+            not np.array_equal(ts_list_1.epochs, ts_list_2.epochs):
+        return None
+
+    r = check_alignment(**kwargs)
+    if type(r) == dict:
+        return r
+
+    with np.errstate(all = 'ignore'):
+        values = ts_pair_func.operation(pd.DataFrame(ts_list_1.values),
+            pd.DataFrame(ts_list_2.values)).values
+
+    return block_or_list(ts_list_1.index, values, ~np.isnan(values))
+
+
+def block_or_list(index, values, keep):
+
+    ''' TsBlock with values if all of them are kept, otherwise timeseries
+        list with the values to keep of each column'''
+
+    if keep.all():
+        return TsBlock(index.values, values)
+
+    return [pd.DataFrame({'value': values[keep[:, j], j]}, index = index[keep[:, j]])
+        for j in range(values.shape[1])]
+
 # ----------------------- Basic functionalities of timeseries -------------------------------
 
 def get_variable(id_variable, time_int = 300, expand = True, now = None, 
-        distr = True, int_type = 'left_open', fill_value = None, **kwargs):
+        distr = True, int_type = 'left_open', fill_value = None, agg = 'last',
+        compact = False, **kwargs):
 
     ''' Given the id of an eyecode variable return a list containing
         one timeseries DataFrame meeting the arguments and the kwargs
@@ -121,6 +275,9 @@ def get_variable(id_variable, time_int = 300, expand = True, now = None,
     - (distr) boolean: indicates if we want the data to be distributed among intervals
         of length time_int or not
     - (int_type) string: type of the interval of data we want to get
+    - (agg) string: how the data is distributed among intervals, one of DISTRIBUTION_MODES
+    - (compact) boolean: keep only the value changes while the data is read, see
+        clean_duplicated. Meant for long status timeseries with few changes
     - kwargs: arguments of the column_range function in analysis_utils
 
     .. returns:
@@ -129,6 +286,284 @@ def get_variable(id_variable, time_int = 300, expand = True, now = None,
 
     '''
     # Convert input parameters to their data formats
+    spec = query_spec(kwargs, time_int = time_int, expand = expand, distr = distr,
+        int_type = int_type)
+    if type(spec) == dict: return spec
+
+    try:
+        compact = type_conversion(compact, 'BOOLEAN')['success']
+    except:
+        return {'error': 'parameters do not have required format'}
+
+    if agg not in DISTRIBUTION_MODES:
+        return {'error': 'Unknown aggregation mode: %s' %str(agg)}
+
+    time_ref = spec.time_ref(now)
+    if type(time_ref) == dict: return time_ref
+
+    # translate the arguments given to column_start, column_finish, column_count format
+    column_range = spec.column_range(time_ref)
+    if 'error' in column_range: return column_range
+
+    # Get the data of the given variable in the time interval wanted. When a
+    # count is given only the tail of the values is read. The whole range
+    # is read if the tail has no data, or only null values when not distributed
+    data_list = None
+    tail = spec.tail_range(column_range, agg = agg, fill_value = fill_value, compact = compact)
+    if tail and not spec.distr:
+        data_list = af.get_variable_data(id_variable, tail[0])
+        if 'error' in data_list: return data_list
+
+        # The type of an all null tail depends on the values before it,
+        # which are read with the whole range
+        if all(elem[1] == None for elem in data_list[0]):
+            data_list = None
+        else:
+            column_range = tail[0]
+    elif tail:
+        tail_range, preceding = tail
+        data_list = get_variable_tail(id_variable, tail_range, column_range, preceding,
+            margin = spec.time_int)
+        if data_list != None:
+            column_range = tail_range
+
+    if data_list == None:
+        data_list = af.get_variable_data(id_variable, column_range, compact = compact)
+        if 'error' in data_list: return data_list
+
+    # Convert the cassandra timeserie to a list containing a panda's dataframe
+    ts_list = cassandra_to_ts_list(data_list, 'value')
+
+    # expand results to the whole range demanded
+    qFrom, qTo, cc = spec.data_range(column_range)
+
+    # Distribute the timeseries
+    if spec.distr:
+        ts_list = distribute_ts_list(ts_list, seconds = spec.time_int, e_to = qTo, e_from = qFrom,
+            fill_value = fill_value, agg = agg)
+    
+    # Return last cc number of values
+    if cc:
+        ts_list = last(ts_list, number = cc)
+
+    return ts_list
+
+
+def get_variable_tail(id_variable, tail_range, column_range, preceding = False, margin = 300):
+
+    ''' Data of the variable in tail_range, see QuerySpec.tail_range, preceded
+        by the value before it if preceding and it is in column_range
+
+    .. returns:
+    - on success: list containing a list with the timeserie, as get_variable_data
+    - None if there is no data in tail_range or it can not be read'''
+
+    if preceding:
+        data_list = af.get_variable_data_preceding(id_variable, tail_range, margin = margin)
+    else:
+        data_list = af.get_variable_data(id_variable, tail_range)
+
+    if type(data_list) == dict or not data_list[0]:
+        return None
+
+    data = data_list[0]
+    if preceding and data[0][0] < column_range['column_finish'][1]:
+        data = data[1:]
+
+    return [data] if data else None
+
+
+def get_variables(ids, time_int = 300, expand = True, now = None, distr = True,
+        int_type = 'left_open', fill_value = None, agg = 'last', block = False, **kwargs):
+
+    ''' Given the ids of several eyecode variables return a list containing
+        one timeseries DataFrame for each of them, placed on one shared grid
+        of epochs. The data of all of them is read at once, see
+        analysis_functions.get_variables_data
+
+    .. arguments:
+    - (ids) list of integers or string with the ids separated by commas
+    - (block) boolean: return a single DataFrame with a column of values for
+        each variable, named by its id, instead of a timeseries list
+    - rest of arguments and kwargs: see get_variable
+
+    .. returns:
+    - on success: list of timeseries DataFrames, in the order of ids, sharing
+        the same index, a TsBlock if the values are numeric. The variables
+        without data in the range have null values
+    - on error: dictionary with an error description
+    '''
+
+    if type(ids) in [str, unicode]:
+        ids = ids.strip('[]').split(',')
+
+    try:
+        ids = [int(id_variable) for id_variable in ids]
+    except:
+        return {'error': 'ids of the variables are not integers: %s' %str(ids)}
+
+    if not ids:
+        return {'error': 'No variables given'}
+
+    # Convert input parameters to their data formats
+    spec = query_spec(kwargs, time_int = time_int, expand = expand, distr = distr,
+        int_type = int_type)
+    if type(spec) == dict: return spec
+
+    try:
+        block = type_conversion(block, 'BOOLEAN')['success']
+    except:
+        return {'error': 'parameters do not have required format'}
+
+    if agg not in DISTRIBUTION_MODES:
+        return {'error': 'Unknown aggregation mode: %s' %str(agg)}
+
+    time_ref = spec.time_ref(now)
+    if type(time_ref) == dict: return time_ref
+
+    # translate the arguments given to column_start, column_finish, column_count format
+    column_range = spec.column_range(time_ref)
+    if 'error' in column_range: return column_range
+
+    # Get the data of all the variables in the time interval wanted
+    data_list = af.get_variables_data(ids, column_range)
+    if 'error' in data_list: return data_list
+
+    # Place them on the same epochs, expanded to the whole range demanded
+    qFrom, qTo, cc = spec.data_range(column_range)
+
+    grid = shared_grid(data_list, seconds = spec.time_int, e_to = qTo, e_from = qFrom,
+        distr = spec.distr, fill_value = fill_value, agg = agg)
+    if type(grid) == dict: return grid
+    epochs, values = grid
+
+    # Return last cc number of values
+    if cc:
+        epochs = epochs[-cc:]
+        values = values[-cc:]
+
+    if block:
+        return pd.DataFrame(values, index = epochs, columns = ids)
+
+    if values.dtype == np.float64:
+        return TsBlock(epochs, values)
+
+    return block_to_ts_list(epochs, values)
+
+
+def shared_grid(data_list, seconds = 300, e_to = False, e_from = False, distr = True,
+        fill_value = None, agg = 'last'):
+
+    ''' Place several cassandra timeseries on the same epochs
+
+        When distributing, each timeserie is distributed as in distribute_ts
+        between the same e_from and e_to, the first and last epochs of all
+        the timeseries if they are not given. Otherwise the epochs are the
+        union of the epochs of the timeseries.
+
+    .. arguments:
+    - (data_list) list of cassandra timeseries, [[(epoch, value),...],...]
+    - rest of arguments: see distribute_ts
+
+    .. returns:
+    - on success: (epochs, values) sorted int64 array of epochs and 2-D array
+        with the values of each timeserie in a column. Timeseries without
+        data have fill_value, or null values if it is not given
+    - on error: dictionary with an error description
+    '''
+
+    ts_list = cassandra_to_ts_list([data for data in data_list if data])
+
+    if distr:
+        if not e_from:
+            e_from = min(ts.index.values[0] for ts in ts_list)
+        if not e_to:
+            e_to = max(ts.index.values[-1] for ts in ts_list)
+        ts_list = distribute_ts_list(ts_list, seconds = seconds, e_to = e_to, e_from = e_from,
+            fill_value = fill_value, agg = agg)
+        if type(ts_list) == dict: return ts_list
+        epochs = ts_list[0].index.values
+        columns = [ts['value'].values for ts in ts_list]
+    else:
+        epochs = np.unique(np.concatenate([ts.index.values for ts in ts_list]))
+        if fill_value != None:
+            columns = [ts['value'].reindex(epochs, fill_value = fill_value).values
+                for ts in ts_list]
+        else:
+            columns = [ts['value'].reindex(epochs).values for ts in ts_list]
+
+    epochs = epochs.astype(np.int64)
+
+    # Numeric columns share a numeric dtype, any other makes them objects
+    if all(column.dtype.kind in 'iufc' for column in columns):
+        dtype = np.result_type(np.float64, *columns)
+    else:
+        dtype = object
+
+    # Columns are contiguous, each one is a view of the same 2-D array
+    values = np.empty((len(epochs), len(data_list)), dtype = dtype, order = 'F')
+    values.fill(np.nan if fill_value == None else fill_value)
+
+    columns = iter(columns)
+    for (j, data) in enumerate(data_list):
+        if data:
+            values[:, j] = next(columns)
+
+    return epochs, values
+
+
+def block_to_ts_list(epochs, values):
+
+    ''' Build a timeseries list with a DataFrame for each column of values,
+        sharing the index and without copying the values
+
+    .. arguments:
+    - (epochs) array of epochs
+    - (values) 2-D array of values, with a row for each epoch
+
+    .. returns:
+        timeseries list with as many timeseries as columns'''
+
+    index = pd.Index(epochs)
+
+    return [pd.DataFrame(values[:, j:j + 1], index = index, columns = ['value'])
+        for j in range(values.shape[1])]
+
+
+# Compiled query specs, indexed by the arguments they were built from
+QUERY_SPECS = {}
+QUERY_SPECS_SIZE = 1024
+
+
+def query_spec(params, time_int = 300, expand = True, distr = True, int_type = 'left_open',
+        clip_range = True):
+
+    ''' Convert the arguments of get_variable and get_increments to their
+        data formats and return them as a QuerySpec. Specs are kept in
+        QUERY_SPECS, so repeated queries reuse the same spec and the
+        column ranges it has already computed
+
+    .. arguments:
+    - (dict) params: arguments of the column_range function in analysis_utils
+    - time_int, expand, distr, int_type: see get_variable
+    - (boolean) clip_range: limit the range the timeseries are expanded to
+        between 1/1/2013 and a year from now
+
+    .. returns:
+    - on success: QuerySpec
+    - on error: dictionary with an error description'''
+
+    try:
+        key = (time_int, expand, distr, int_type, clip_range, tuple(sorted(params.items())))
+        spec = QUERY_SPECS.get(key)
+    except TypeError:
+        # Arguments that can not be hashed are not cached
+        key = None
+        spec = None
+
+    if spec != None:
+        return spec
+
     try:
         time_int = int(time_int)
         expand = type_conversion(expand, 'BOOLEAN')['success']
@@ -136,70 +571,146 @@ def get_variable(id_variable, time_int = 300, expand = True, now = None,
     except:
         return {'error': 'parameters do not have required format'}
 
-
     # the restriction to the number of values will be applied once we 
     # have the timeseries. We arrange the count parameter to a value
     # that we can be sure that is not restrictive.
-    cc = kwargs.get('count', False)
+    params = dict(params)
+    cc = params.get('count', False)
     if cc:
         try:
             cc = int(cc)
         except:
             return {'error': 'count argument is not an integer: {!s}'.format(cc)}
-        kwargs['count'] = cc*time_int
+        params['count'] = cc*time_int
 
-    if now == None:
-        now = int(time.time())
-    else:
-        try:
-            now = int(now)
-        except:
-            return {'error': 'time reference received is not an epoch'}
-    time_ref = time_int*int(now/time_int) #now - time_int
+    spec = QuerySpec(params, time_int, expand, distr, int_type, clip_range, cc)
 
-    # translate the arguments given to column_start, column_finish, column_count format
-    column_range = au.column_range(kwargs, now = time_ref, int_type = int_type)
-    
-    if 'error' in column_range: return column_range
+    if key != None:
+        if len(QUERY_SPECS) >= QUERY_SPECS_SIZE:
+            QUERY_SPECS.clear()
+        QUERY_SPECS[key] = spec
 
-    # Get the data of the given variable in the time interval wanted
-    data_list = af.get_variable_data(id_variable, column_range)
-    if 'error' in data_list: return data_list
+    return spec
 
-    # Convert the cassandra timeserie to a list containing a panda's dataframe
-    ts_list = cassandra_to_ts_list(data_list, 'value')
 
-    # expand results to the whole range demanded
-    cs = column_range.get('column_start', False)
-    if (not cs == False) and expand:
-        # Handle possible huge values
-        qTo = min(cs[1], time.time() + TimeInSeconds.YEAR)
-    else:
-        qTo = False
+class QuerySpec(object):
 
-    cf = column_range.get('column_finish', False)
-    if (not cf == False) and expand:
-        # Handle possible very small values
-        qFrom = max(cf[1], 1356994800) # 1/1/2013
-    else:
-        qFrom = False
+    ''' Arguments of a query already converted by query_spec. The column
+        range of each time reference is computed only once'''
 
-    # If we have not defined a column_count and there's 
-    # a column_count established by the column_range function
-    # we use it
-    ccount = column_range.get('column_count', False)
-    if cc == False and ccount != False:
-        cc = ccount
+    RANGES_SIZE = 64
 
-    # Distribute the timeseries
-    if distr:
-        ts_list = distribute_ts_list(ts_list, seconds = time_int, e_to = qTo, e_from = qFrom, fill_value = fill_value)
-    
-    # Return last cc number of values
-    if cc:
-        ts_list = last(ts_list, number = cc)
+    def __init__(self, params, time_int, expand, distr, int_type, clip_range, count):
+        self.params = params
+        self.time_int = time_int
+        self.expand = expand
+        self.distr = distr
+        self.int_type = int_type
+        self.clip_range = clip_range
+        self.count = count
+        self.ranges = {}
 
-    return ts_list
+    def time_ref(self, now = None):
+
+        ''' Truncate now, the current time by default, to the time intervals'''
+
+        if now == None:
+            now = int(time.time())
+        else:
+            try:
+                now = int(now)
+            except:
+                return {'error': 'time reference received is not an epoch'}
+
+        return self.time_int*int(now/self.time_int)
+
+    def column_range(self, time_ref):
+
+        ''' Return a copy of the column range of analysis_utils.column_range
+            at time_ref'''
+
+        if time_ref not in self.ranges:
+            if len(self.ranges) >= self.RANGES_SIZE:
+                self.ranges.clear()
+            self.ranges[time_ref] = au.column_range(self.params, now = time_ref,
+                int_type = self.int_type)
+
+        return dict(self.ranges[time_ref])
+
+    def data_range(self, column_range):
+
+        ''' Return the epochs (qFrom, qTo) the timeseries are expanded to,
+            False if they are not expanded, and the number of values to keep'''
+
+        cs = column_range.get('column_start', False)
+        if (not cs == False) and self.expand:
+            # Handle possible huge values
+            qTo = min(cs[1], time.time() + TimeInSeconds.YEAR) if self.clip_range else cs[1]
+        else:
+            qTo = False
+
+        cf = column_range.get('column_finish', False)
+        if (not cf == False) and self.expand:
+            # Handle possible very small values, before 1/1/2013
+            qFrom = max(cf[1], 1356994800) if self.clip_range else cf[1]
+        else:
+            qFrom = False
+
+        # If we have not defined a column_count and there's 
+        # a column_count established by the column_range function
+        # we use it
+        cc = self.count
+        ccount = column_range.get('column_count', False)
+        if cc == False and ccount != False:
+            cc = ccount
+
+        return qFrom, qTo, cc
+
+    def tail_range(self, column_range, agg = 'last', fill_value = None, compact = False):
+
+        ''' Column range reading only the values the last count values of the
+            timeseries depend on, instead of reading them all to keep the last
+            count ones:
+            - not distributed: the count newer values
+            - distributed and expanded to a column_finish: the values of the
+                last count intervals, which only depend on qTo. With agg 'last'
+                and no fill_value the value before them is needed too
+            Compacted and time_mean timeseries depend on older values
+
+        .. returns:
+        - (column_range, preceding): the narrowed column range, and whether
+            the value before it is needed
+        - None if the column range can not be narrowed'''
+
+        if not self.count or compact or self.time_int < 1:
+            return None
+
+        column_range = dict(column_range)
+
+        if not self.distr:
+            column_range['column_count'] = min(column_range.get('column_count', self.count),
+                self.count)
+            return column_range, False
+
+        qFrom, qTo, cc = self.data_range(column_range)
+        if qFrom == False or qTo == False or agg == 'time_mean':
+            return None
+
+        # last epoch of the distributed timeserie, as in distribute_ts
+        seconds = self.time_int
+        e_last = seconds*int(qTo/seconds)
+        if (qTo % seconds) != 0: e_last += seconds
+        e_first = e_last - (self.count - 1)*seconds
+
+        # the aggregations take the values in (epoch - seconds, epoch]
+        finish = e_first if agg == 'last' else e_first - seconds + 1
+
+        cf = column_range['column_finish']
+        if finish <= cf[1]:
+            return None
+        column_range['column_finish'] = (cf[0], finish)
+
+        return column_range, agg == 'last' and fill_value == None
 
 
 def cassandra_to_ts_list(ts, column_name = 'value'):
@@ -221,8 +732,11 @@ def cassandra_to_ts_list(ts, column_name = 'value'):
 
 # --------------------------------- Timeseries distribution -----------------------------------
 
+DISTRIBUTION_MODES = ['last', 'mean', 'time_mean', 'min', 'max', 'sum', 'count']
+
 @ts_list_function()
-def distribute_ts_list(ts_list, seconds = 300, e_to = False, e_from = False, fill_value = None):
+def distribute_ts_list(ts_list, seconds = 300, e_to = False, e_from = False, fill_value = None,
+        agg = 'last'):
 
     ''' Apply distribute_ts to each of the timeseries in ts_list'''
     if e_to:
@@ -242,17 +756,25 @@ def distribute_ts_list(ts_list, seconds = 300, e_to = False, e_from = False, fil
     except:
         return {'error': 'seconds must be an integer'}        
 
+    if agg not in DISTRIBUTION_MODES:
+        return {'error': 'Unknown aggregation mode: %s' %str(agg)}
+
     distributed_ts_list = []
     for elem in ts_list:
-        new_elem = distribute_ts(elem, seconds, e_to, e_from, fill_value)
+        new_elem = distribute_ts(elem, seconds, e_to, e_from, fill_value, agg)
         if 'error' in new_elem:
             return new_elem
         distributed_ts_list.append(new_elem)
 
+    # Distributed between the same epochs, they can be operated as a block
+    if e_to and e_from and len(distributed_ts_list) > 1:
+        return columnar(distributed_ts_list)
+
     return distributed_ts_list
 
 
-def distribute_ts(ts, seconds = 300, e_to = False, e_from = False, fill_value = None):
+def distribute_ts(ts, seconds = 300, e_to = False, e_from = False, fill_value = None,
+        agg = 'last'):
 
     ''' Given a timeseries Dataframe we will reindex it to epochs 
         that are multiples of "seconds" the values will be in 
@@ -265,6 +787,9 @@ def distribute_ts(ts, seconds = 300, e_to = False, e_from = False, fill_value =
         not given we will use the first epoch of the timeserie
     - (e_from) integer: epoch of the last moment to which expand the timeserie.
         If not given we will use the last epoch of the timeserie
+    - (agg) string: value given to each epoch. 'last' distributes the values
+        forward and backwards. The rest of modes aggregate the values received
+        in the interval of "seconds" ending at the epoch, see aggregate_ts
 
     .. returns:
     - (new_ts) Pandas DataFrame containing a timeserie distributed to "seconds" intervals
@@ -272,14 +797,18 @@ def distribute_ts(ts, seconds = 300, e_to = False, e_from = False, fill_value =
 
     '''
 
-    new_ts = ts.copy()
+    # sort the timeseries only if it is needed
+    if not ts.index.is_monotonic_increasing:
+        ts = ts.sort_index()
+
+    epochs = ts.index.values
 
     # pick initial and final epochs if given
     if not e_from:
-        e_from = new_ts.index.values[0]
+        e_from = epochs[0]
     
     if not e_to:
-        e_to = new_ts.index.values[-1]
+        e_to = epochs[-1]
 
     # truncate them to multiples of seconds
     new_e_from = seconds*(int(e_from/seconds))
@@ -288,20 +817,433 @@ def distribute_ts(ts, seconds = 300, e_to = False, e_from = False, fill_value =
     if (e_to % seconds) != 0: new_e_to += seconds
 
     # build new index
-    new_index = [i for i in range(new_e_from, new_e_to, seconds)]
+    new_index = np.arange(new_e_from, new_e_to, seconds, dtype = np.int64)
+
+    if agg != 'last':
+        return aggregate_ts(ts, new_index, seconds, agg, fill_value)
 
-    # apply new index, forward
+    # apply new index, only on coincident epochs
     if fill_value != None:
-        new_ts = new_ts.reindex(index = new_index, fill_value = fill_value)
+        return ts.reindex(index = new_index, fill_value = fill_value)
+
+    # forward: position of the last epoch lower or equal than each new epoch
+    pos = np.searchsorted(epochs, new_index, side = 'right') - 1
+    values = ts['value'].values
+
+    # and backwards: new epochs before the first one take the value of the
+    # first new epoch after it. As in a reindex, this makes integer values float
+    n_before = np.searchsorted(pos, 0)
+    if n_before > 0 and values.dtype.kind in 'iu':
+        values = values.astype(np.float64)
+
+    if n_before < len(pos):
+        pos[:n_before] = pos[n_before]
+        new_values = values.take(pos)
+    elif n_before == 0:
+        new_values = values[:0]
     else:
-        new_ts = new_ts.reindex(index = new_index, method= 'pad')
-    
-        # and backwards
+        if values.dtype.kind not in 'fc':
+            values = values.astype(object)
+        new_values = np.empty(len(pos), dtype = values.dtype)
+        new_values.fill(np.nan)
+
+    new_ts = pd.DataFrame({'value': new_values}, index = new_index)
+
+    # null values received are filled backwards too
+    if new_values.dtype.kind in 'fcO' and pd.isnull(new_values).any():
         new_ts.fillna(method = 'bfill', inplace = True)
-    
+
     return new_ts
 
 
+def aggregate_ts(ts, new_index, seconds, agg = 'mean', fill_value = None):
+
+    ''' Aggregate the values of a timeseries in the intervals of length
+        "seconds" ending at each of the epochs of new_index. A value
+        received at epoch t belongs to the interval (g - seconds, g] 
+
+    .. arguments:
+    - (ts) DataFrame : timeseries DataFrame sorted by epoch
+    - (new_index) array: evenly spaced epochs of the new timeserie
+    - (seconds) integer: distance between the epochs of new_index
+    - (agg) string: mean, time_mean, min, max, sum or count. time_mean is the mean 
+        of the values weighted by the time they have been held in the interval
+    - (fill_value): value of the intervals without data. If not given
+        sum and count are 0 and the rest NaN
+
+    .. returns:
+    - on success: timeseries DataFrame with float values indexed by new_index
+    - on error: dictionary with an error description
+    '''
+
+    try:
+        values = ts['value'].values.astype(np.float64)
+    except:
+        return {'error': 'Non scalar values found'}
+
+    if fill_value != None:
+        try:
+            fill_value = float(fill_value)
+        except:
+            return {'error': 'fill_value is not numeric'}
+    elif agg in ['sum', 'count']:
+        fill_value = 0.
+    else:
+        fill_value = np.nan
+
+    epochs = ts.index.values
+    valid = ~np.isnan(values)
+    epochs = epochs[valid]
+    values = values[valid]
+
+    n = len(new_index)
+    new_values = np.empty(n, dtype = np.float64)
+    new_values.fill(fill_value)
+
+    if n == 0 or len(epochs) == 0:
+        return pd.DataFrame({'value': new_values}, index = new_index)
+
+    if agg == 'time_mean':
+        # integral of the values held from the first epoch
+        rel = (epochs - epochs[0]).astype(np.float64)
+        cum = np.concatenate(([0.], np.cumsum(values[:-1]*np.diff(rel))))
+
+        g = (new_index - epochs[0]).astype(np.float64)
+        covered = g >= 0
+        g = g[covered]
+        l = np.maximum(g - seconds, 0.)
+
+        k_g = np.searchsorted(rel, g, side = 'right') - 1
+        k_l = np.searchsorted(rel, l, side = 'right') - 1
+        integral = cum[k_g] + values[k_g]*(g - rel[k_g]) - cum[k_l] - values[k_l]*(l - rel[k_l])
+        duration = g - l
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            new_values[covered] = np.where(duration > 0, integral/duration, values[k_g])
+
+        return pd.DataFrame({'value': new_values}, index = new_index)
+
+    # position of the interval of each value, ignoring the ones out of new_index
+    buckets = -((new_index[0] - epochs)//seconds)
+    inside = (buckets >= 0) & (buckets < n)
+    buckets = buckets[inside]
+    values = values[inside]
+
+    if len(buckets) == 0:
+        return pd.DataFrame({'value': new_values}, index = new_index)
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    filled = buckets[starts]
+
+    if agg == 'count':
+        new_values[filled] = np.diff(np.append(starts, len(buckets)))
+    elif agg == 'sum':
+        new_values[filled] = np.add.reduceat(values, starts)
+    elif agg == 'mean':
+        new_values[filled] = np.add.reduceat(values, starts)/np.diff(np.append(starts, len(buckets)))
+    elif agg == 'min':
+        new_values[filled] = np.minimum.reduceat(values, starts)
+    elif agg == 'max':
+        new_values[filled] = np.maximum.reduceat(values, starts)
+
+    return pd.DataFrame({'value': new_values}, index = new_index)
+
+
+# --------------------------------- Timeseries interpolation -----------------------------------
+
+@ts_list_function()
+def interpolate(ts_list, seconds = 900, monotony = 'increasing', reset_value = 0.):
+
+    ''' Apply ts_interpolate to each of the timeseries in ts_list'''
+
+    try:
+        seconds = int(seconds)
+    except:
+        return {'error': 'seconds must be an integer'}
+
+    if seconds <= 0:
+        return {'error': 'seconds must be positive'}
+
+    try:
+        reset_value = float(reset_value)
+    except:
+        return {'error': 'reset_value is not a number'}
+
+    return call_ts_func(ts_interpolate)(ts_list, seconds = seconds, monotony = monotony,
+        reset_value = reset_value)
+
+
+def ts_interpolate(ts, seconds = 900, monotony = 'increasing', reset_value = 0.):
+
+    ''' Standardize a timeserie to epochs that are multiples of "seconds"
+        by linear interpolation of its values. The new epochs go from the
+        first epoch of the timeserie to the last one, the last one excluded.
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+    - (integer) seconds: number of seconds between the epochs of the new timeserie
+    - (string) monotony: increasing / decreasing / non_monotonous. Meter resets
+        are interpolated from reset_value
+    - (float) reset_value: value to which the meter is reseted
+
+    .. returns:
+    - on success: timeseries with the interpolated values'''
+
+    try:
+        values = ts['value'].values.astype(np.float64)
+    except:
+        return {'error': 'Non scalar values found'}
+
+    if not ts.index.is_monotonic_increasing:
+        order = np.argsort(ts.index.values)
+        epochs = ts.index.values[order]
+        values = values[order]
+    else:
+        epochs = ts.index.values
+
+    grid, new_values = au.linear_interpolation(epochs, values, seconds,
+        monotony = monotony, reset_value = reset_value)
+
+    return pd.DataFrame({'value': new_values}, index = grid.astype(np.int64))
+
+
+# --------------------------------- Frecuencies of the values -----------------------------------
+
+@ts_list_function()
+def frecuencies(ts_list, lower_limit = 0, upper_limit = None, n_ints = 100):
+
+    ''' Apply ts_frecuencies to each of the timeseries in ts_list'''
+
+    return call_ts_func(ts_frecuencies)(ts_list, lower_limit = lower_limit,
+        upper_limit = upper_limit, n_ints = n_ints)
+
+
+def ts_frecuencies(ts, lower_limit = 0, upper_limit = None, n_ints = 100):
+
+    ''' Count the values of a timeserie falling in each of the n_ints intervals
+        of equal length between lower_limit and upper_limit. The intervals are
+        closed on the left and open on the right, as in
+        analysis_functions.non_discrete_frecuencies
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+    - (float) lower_limit: lower limit of the first interval
+    - (float) upper_limit: upper limit of the last interval, the maximum
+        value of the timeserie if it is None
+    - (integer) n_ints: number of intervals
+
+    .. returns:
+    - on success: timeserie indexed by the number of the interval, from
+        0 to n_ints - 1, with the count of values in each interval'''
+
+    try:
+        values = ts['value'].values.astype(np.float64)
+    except:
+        return {'error': 'Non scalar values found'}
+
+    frec = af.non_discrete_frecuencies(values, lower_limit = lower_limit,
+        upper_limit = upper_limit, n_ints = n_ints)
+
+    if 'error' in frec:
+        return frec
+
+    return pd.DataFrame({'value': [elem[2] for elem in frec]},
+        index = np.arange(len(frec), dtype = np.int64))
+
+
+@ts_list_function()
+def gaussian_smooth(ts_list, p_width = 3):
+
+    ''' Apply ts_gaussian_smooth to each of the timeseries in ts_list'''
+
+    try:
+        p_width = float(p_width)
+    except:
+        return {'error': 'p_width is not a number'}
+
+    if p_width <= 0:
+        return {'error': 'p_width must be positive'}
+
+    return call_ts_func(ts_gaussian_smooth)(ts_list, p_width = p_width)
+
+
+def ts_gaussian_smooth(ts, p_width = 3):
+
+    ''' Replace each value of a timeserie by the average of its neighbours
+        weighted by a gaussian of standard deviation p_width positions.
+        It is meant to smooth the output of ts_frecuencies
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+    - (float) p_width: standard deviation of the gaussian, in number of positions
+
+    .. returns:
+    - on success: timeserie with the smoothed values'''
+
+    try:
+        values = ts['value'].values.astype(np.float64)
+    except:
+        return {'error': 'Non scalar values found'}
+
+    return pd.DataFrame({'value': af.gaussian_kernel_smooth(values, p_width)},
+        index = ts.index.values)
+
+
+# --------------------------------- State analytics -----------------------------------
+# The state of a sample lasts until the next sample, the last one only closes
+# the timeserie. With a period, the results are given for each of the calendar
+# periods of the timeserie, indexed by their beginnings, and the runs of a
+# state are cut at the period boundaries.
+
+STATE_PERIODS = [None, 'year', 'month', 'week', 'day', 'hour']
+
+
+@ts_list_function()
+def state_changes(ts_list, state_value = 1, period = None):
+
+    ''' Count the changes from any other value to state_value,
+        see ts_state_runs'''
+
+    if period not in STATE_PERIODS:
+        return {'error': 'Invalid period given: %s' %str(period)}
+
+    return call_ts_func(ts_state_changes)(ts_list, state_value = state_value, period = period)
+
+
+@ts_list_function()
+def state_duration(ts_list, state_value = 1, period = None):
+
+    ''' Seconds spent in state_value, see ts_state_runs'''
+
+    if period not in STATE_PERIODS:
+        return {'error': 'Invalid period given: %s' %str(period)}
+
+    return call_ts_func(ts_state_duration)(ts_list, state_value = state_value, period = period)
+
+
+@ts_list_function()
+def longest_state_run(ts_list, state_value = 1, period = None):
+
+    ''' Seconds of the longest run in state_value, see ts_state_runs'''
+
+    if period not in STATE_PERIODS:
+        return {'error': 'Invalid period given: %s' %str(period)}
+
+    return call_ts_func(ts_longest_state_run)(ts_list, state_value = state_value, period = period)
+
+
+def ts_state_changes(ts, state_value = 1, period = None):
+
+    r = ts_state_runs(ts, state_value, period)
+    if type(r) == dict:
+        return r
+
+    return pd.DataFrame({'value': r[1]}, index = r[0])
+
+
+def ts_state_duration(ts, state_value = 1, period = None):
+
+    r = ts_state_runs(ts, state_value, period)
+    if type(r) == dict:
+        return r
+
+    return pd.DataFrame({'value': r[2]}, index = r[0])
+
+
+def ts_longest_state_run(ts, state_value = 1, period = None):
+
+    r = ts_state_runs(ts, state_value, period)
+    if type(r) == dict:
+        return r
+
+    return pd.DataFrame({'value': r[3]}, index = r[0])
+
+
+def ts_state_runs(ts, state_value = 1, period = None):
+
+    ''' Compute from the run length encoding of a timeserie the changes
+        to a state, the time spent in it and its longest run. Values are
+        in state_value when their string representations are equal,
+        as in analysis_functions.count_state_change
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+    - state_value: value of the state
+    - (string) period: year, month, week, day, hour or None for the whole timeserie
+
+    .. returns:
+    - on success: tuple of numpy arrays (epochs, changes, durations, longest runs)
+        with the beginning of each period, or the first epoch of the timeserie
+    - on error: dictionary with an error description'''
+
+    if len(ts) == 0:
+        empty = np.zeros(0, dtype = np.int64)
+        return empty, empty, empty, empty
+
+    epochs, values = au.sort_epochs(ts.index.values, ts['value'].values)
+    in_state = af.state_mask(values, str(state_value))
+
+    if period == None:
+        bounds = np.array([epochs[0], epochs[-1] + 1], dtype = np.int64)
+    else:
+        # The first and last epochs fall in [bounds[0], bounds[-1])
+        bounds = au.interval_boundaries(period, e_from = epochs[0] + 60, e_to = epochs[-1] + 60)
+        if type(bounds) == dict:
+            return bounds
+
+    starts = au.run_length_encoding(in_state)
+    run_epochs = epochs[starts]
+    run_in_state = in_state[starts]
+
+    # The runs are cut in segments by the period boundaries
+    points = np.union1d(run_epochs, bounds[1:-1])
+    points = np.append(points, epochs[-1])
+    lengths = np.diff(points)
+    segment_in_state = run_in_state[np.searchsorted(run_epochs, points[:-1], side = 'right') - 1]
+    segment_period = np.searchsorted(bounds, points[:-1], side = 'right') - 1
+
+    n_periods = len(bounds) - 1
+
+    # The first sample does not change to its state
+    change_period = np.searchsorted(bounds, run_epochs[1:][run_in_state[1:]], side = 'right') - 1
+    changes = np.bincount(change_period, minlength = n_periods)
+
+    durations = np.bincount(segment_period[segment_in_state],
+        weights = lengths[segment_in_state], minlength = n_periods).astype(np.int64)
+
+    longest = np.zeros(n_periods, dtype = np.int64)
+    np.maximum.at(longest, segment_period[segment_in_state], lengths[segment_in_state])
+
+    return bounds[:-1], changes, durations, longest
+
+
+# --------------------------------- Duplicated values -----------------------------------
+
+@ts_list_function()
+def clean_duplicated(ts_list):
+
+    ''' Apply ts_clean_duplicated to each of the timeseries in ts_list'''
+
+    return call_ts_func(ts_clean_duplicated)(ts_list)
+
+
+def ts_clean_duplicated(ts):
+
+    ''' Keep only the values of a timeserie that are different from the
+        previous value, as analysis_functions.clean_duplicated does
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+
+    .. returns:
+    - timeserie with the first value of each run of equal values'''
+
+    if not ts.index.is_monotonic_increasing:
+        ts = ts.sort_index(kind = 'mergesort')
+
+    return ts.iloc[au.run_length_encoding(ts['value'].values)]
+
+
 # --------------------------------- Timeseries increments -----------------------------------
 
 @ts_list_function()
@@ -397,6 +1339,10 @@ def single_inc(row, monotony = 'increasing', max_value = None, reset_value = 0.)
 
 def ts_to_float(ts):
 
+    # Numeric values are converted at once, as float() would do one by one
+    if len(ts) > 0 and ts['value'].dtype.kind in 'biuf':
+        return pd.DataFrame({'value': ts['value'].values.astype(np.float64)}, index = ts.index)
+
     new_ts = pd.DataFrame()
     try:
         new_ts['value'] = ts.apply(lambda x: float(x['value']), axis = 1)
@@ -427,25 +1373,59 @@ def aggregate_func():
             output_ts = pd.DataFrame([value], columns = ['value'], index = [epoch])
 
             return output_ts
+
+        # keep the aggregation of the values, used by merge_agg_func
+        call.aggregation = agg_func
         return call
     return wrapper
 
 def merge_agg_func(func):
 
     def call(ts_list, *args, **kwargs):
-        output = pd.DataFrame(columns = ['value'], dtype = 'float64')
+        # The aggregates of the timeseries of a block are placed at the
+        # same epoch, so only the one of a single timeserie is computed,
+        # on its float values as they are
+        if hasattr(func, 'aggregation') and is_block(ts_list) and len(ts_list.epochs) > 0:
+            if len(ts_list) > 1:
+                return {'error': 'Non unique index'}
+
+            value = func.aggregation(ts_list[0])
+            return [pd.DataFrame([value], columns = ['value'], index = [ts_list.epochs[-1]])]
+
+        results = []
         for elem in ts_list:
             result = func(elem, *args, **kwargs)
             if 'error' in result:
                 return result
-            output = output.append(result)
+            results.append(result)
+
+        # A single float timeserie is returned as it is, so that the views
+        # of ts_last are not copied. The rest are concatenated at once
+        if len(results) == 1 and len(results[0]) > 0 and \
+                list(results[0].columns) == ['value'] and \
+                results[0]['value'].dtype == np.float64:
+            output = results[0]
+        else:
+            output = pd.concat([pd.DataFrame(columns = ['value'], dtype = 'float64')] + results)
 
-        if not output.index.is_unique:
+        if not unique_index(output.index):
             return {'error': 'Non unique index'}
 
         return [output]
     return call
 
+
+def unique_index(index):
+
+    ''' Same as index.is_unique, without building a hash table for the
+        indexes of increasing epochs'''
+
+    epochs = index.values
+    if epochs.dtype.kind in 'iu' and (epochs[1:] > epochs[:-1]).all():
+        return True
+
+    return index.is_unique
+
             
 
 # --------------------------------- inner_sum -----------------------------------
@@ -542,16 +1522,111 @@ def inner_std(ts_list):
 @aggregate_func()
 def ts_std(ts):
 
-    '''Perform the mean of the elements in a timeserie
+    '''Perform the mean of the elements in a timeserie
+
+    .. arguments:
+    - (DataFrame) ts: pandas DataFrame containing a timeserie
+
+    .. returns:
+    - on success: timeseries with only one row, with the index of
+        the last element of the original serie and the value of the mean'''
+
+    return np.std(ts['value'])
+
+
+# ------------------------- streaming aggregates -----------------------------------
+
+def get_accumulator(id_variable, now = None, int_type = 'left_open', chunk_size = 100000,
+        time_int = 300, **kwargs):
+
+    ''' Read the data of an eyecode variable chunk by chunk and accumulate
+        it, see analysis_utils.accumulate. The data is never loaded at once,
+        and the accumulators of different variables or time ranges can be
+        combined with analysis_utils.merge_accumulators. The values read are
+        the ones get_variable returns with distr = False: now is truncated to
+        the time intervals and count is the number of values
+
+    .. arguments:
+    - (id_variable) integer : id of the eyecode variable
+    - (now) integer: epoch that represents the moment when the query is performed
+    - (int_type) string: type of the interval of data we want to get
+    - (chunk_size) integer: number of values read from cassandra at once
+    - (time_int) integer: length of the time intervals now is truncated to
+    - kwargs: arguments of the column_range function in analysis_utils
+
+    .. returns:
+    - on success: accumulator of the values of the variable
+    - on error: dictionary with an error description'''
+
+    try:
+        chunk_size = int(chunk_size)
+    except:
+        return {'error': 'parameters do not have required format'}
+
+    if chunk_size <= 0:
+        return {'error': 'chunk_size must be positive'}
+
+    spec = query_spec(kwargs, time_int = time_int, distr = False, int_type = int_type)
+    if type(spec) == dict: return spec
+
+    time_ref = spec.time_ref(now)
+    if type(time_ref) == dict: return time_ref
+
+    column_range = spec.column_range(time_ref)
+    if 'error' in column_range: return column_range
+
+    # the last count values, as get_variable keeps
+    tail = spec.tail_range(column_range)
+    if tail:
+        column_range = tail[0]
+
+    chunks = af.get_variable_data_chunks(id_variable, column_range, chunk_size = chunk_size)
+    if type(chunks) == dict: return chunks
+
+    acc = au.new_accumulator()
+    for chunk in chunks:
+        epochs, values = au.split_timeseries(chunk)
+        acc = au.accumulate(acc, values, epochs)
+        if 'error' in acc:
+            return acc
+
+    return acc
+
+
+def get_aggregate(id_variable, agg = 'mean', now = None, int_type = 'left_open',
+        chunk_size = 100000, time_int = 300, **kwargs):
+
+    ''' Aggregate the data of an eyecode variable without loading it at once,
+        see get_accumulator. The output is the same as applying inner_sum,
+        inner_max, inner_min, inner_mean or inner_std to get_variable with
+        distr = False and the same arguments, up to the rounding of the
+        sums, which are added chunk by chunk
+
+    .. arguments:
+    - (id_variable) integer : id of the eyecode variable
+    - (agg) string: one of analysis_utils.AGGREGATES
+    - the rest of arguments are those of get_accumulator
+
+    .. returns:
+    - on success: list containing a timeseries with only one row, with the
+        index of the last element of the data and the value of the aggregate
+    - on error: dictionary with an error description'''
+
+    if agg not in au.AGGREGATES:
+        return {'error': 'Unknown aggregate: %s' %str(agg)}
 
-    .. arguments:
-    - (DataFrame) ts: pandas DataFrame containing a timeserie
+    acc = get_accumulator(id_variable, now = now, int_type = int_type,
+        chunk_size = chunk_size, time_int = time_int, **kwargs)
+    if 'error' in acc: return acc
 
-    .. returns:
-    - on success: timeseries with only one row, with the index of
-        the last element of the original serie and the value of the mean'''
+    if acc['epoch'] == None:
+        return {'error': json.dumps({'error': 'No data found'})}
 
-    return np.std(ts['value'])
+    value = au.accumulator_value(acc, agg)
+    if value == None:
+        value = np.nan
+
+    return [pd.DataFrame([value], columns = ['value'], index = [acc['epoch']])]
 
 
 # ------------------------- last -----------------------------------
@@ -569,16 +1644,17 @@ def ts_last(ts, number = 1):
     - (DataFrame) ts: pandas DataFrame containing a timeserie
 
     .. returns:
-    - on success: timeseries with only one row, with the last element of the original timeserie'''
+    - on success: timeseries with only one row, with the last element of the original timeserie.
+        Its values and epochs are views of the ones of ts, not copies'''
 
     if len(ts) < number:
         return ts
 
-    value = ts.iloc[-number:]['value'].values
+    value = ts['value'].values[-number:]
 
     epoch = ts.index.values[-number:]
 
-    output_ts = pd.DataFrame(value, columns = ['value'], index = epoch)
+    output_ts = pd.DataFrame(value, columns = ['value'], index = epoch, copy = False)
 
     return output_ts
 
@@ -606,6 +1682,9 @@ def scalar_func():
             new_ts.dropna(inplace = True)
 
             return new_ts
+
+        # keep the operation on the values, used by scalar_chain
+        call.operation = func
         return call
     return wrapper
 
@@ -721,13 +1800,131 @@ def ts_scalar_power(ts, number = 1.):
     return np.power(ts['value'], number)
 
 
+# ----------------------------- Chains of scalar functions -------------------------------
+
+# Scalar functions that can be chained in scalar_chain, with the
+# default value of their number
+SCALAR_FUNCTIONS = {
+    'scalar_product': (ts_scalar_product, 1.),
+    'scalar_sum': (ts_scalar_sum, 0.),
+    'scalar_division': (ts_scalar_division, 1.),
+    'scalar_sub': (ts_scalar_sub, 0.),
+    'scalar_power': (ts_scalar_power, 1.)}
+
+
+@ts_list_function()
+def scalar_chain(ts_list, operations = ()):
+
+    ''' Apply a chain of scalar functions to each of the timeseries in ts_list
+        at once. The values are converted to float only once, and the infinite
+        and null values are deleted only at the end of the chain. The output
+        is the same as calling the scalar functions one inside the other
+
+    .. arguments:
+    - (list) ts_list: list of timeseries
+    - (list) operations: list of (function name, number) tuples, from the
+        first function applied to the last one. The function names are the
+        keys of SCALAR_FUNCTIONS
+
+    .. returns:
+    - on success: list of timeseries
+    - on error: dictionary with an error description'''
+
+    output = []
+    for (name, number) in operations:
+        if name not in SCALAR_FUNCTIONS:
+            return {'error': 'Unknown scalar function: %s' %str(name)}
+
+    # The values of a block are operated at once
+    if is_block(ts_list) and len(ts_list) > 0 and len(ts_list.epochs) > 0:
+        return block_chain(ts_list, operations)
+
+    for ind, (name, number) in enumerate(operations):
+
+        if name == 'scalar_power':
+            number = int(number)
+
+        try:
+            number = float(number)
+        except:
+            number = None
+
+        for i, ts in enumerate(ts_list):
+            if ind == 0:
+                new_ts = ts_to_float(ts)
+                if 'error' in new_ts:
+                    return new_ts
+
+                # values and positions of the values that are still finite
+                output.append([new_ts['value'], np.ones(len(new_ts), dtype = bool)])
+
+            # ts_to_float fails on the timeseries left empty by the previous function
+            elif not output[i][1].any():
+                return {'error': 'Non scalar values found'}
+
+            if number == None:
+                return {'error': 'number is not numeric'}
+
+        operation = SCALAR_FUNCTIONS[name][0].operation
+        for elem in output:
+            elem[0] = operation({'value': elem[0]}, number)
+            elem[1] &= np.isfinite(elem[0].values)
+
+    return [pd.DataFrame({'value': values.values[finite]}, index = values.index[finite])
+        for (values, finite) in output]
+
+
 # -------------------- Basic mathematical operations between timeseries lists -----------------
 # ---------------------- Addition, subtraction, product and division --------------------------
 
+def check_alignment(align = 'inner', fill_value = 0., direction = 'backward', tolerance = None):
+
+    ''' Check the alignment arguments of an operation between two timeseries
+
+    .. returns:
+    - on success: tuple (fill_value, tolerance) converted to numbers
+    - on error: dictionary with an error description'''
+
+    if align not in au.ALIGNMENTS:
+        return {'error': 'Unknown alignment: %s' %str(align)}
+
+    if direction not in au.ASOF_DIRECTIONS:
+        return {'error': 'Unknown direction: %s' %str(direction)}
+
+    try:
+        fill_value = float(fill_value)
+    except:
+        return {'error': 'fill_value is not numeric'}
+
+    if tolerance is not None:
+        try:
+            tolerance = float(tolerance)
+        except:
+            return {'error': 'tolerance is not numeric'}
+
+        if tolerance < 0:
+            return {'error': 'tolerance must be positive'}
+
+    return fill_value, tolerance
+
+
+# Wrapper of the operations between two timeseries. The timeseries are
+# aligned with analysis_utils.align_timeseries according to align:
+#   - inner: only the common epochs are kept (default)
+#   - outer: all the epochs are kept, filling the missing values with fill_value
+#   - asof: the epochs of the first timeserie are kept, with the value of the
+#       second timeserie paired with each of them according to direction
+#       (backward, forward or nearest) within tolerance seconds
+# A timeserie of length 1 is treated as a scalar, whatever the alignment.
 def ts_pair_operation():
 
     def wrapper(func):
-        def f(ts_1, ts_2):
+        def f(ts_1, ts_2, align = 'inner', fill_value = 0., direction = 'backward', tolerance = None):
+
+            r = check_alignment(align, fill_value, direction, tolerance)
+            if type(r) == dict:
+                return r
+            fill_value, tolerance = r
 
             ts_1 = ts_to_float(ts_1)
             if 'error' in ts_1: return ts_1
@@ -741,7 +1938,15 @@ def ts_pair_operation():
             l_2 = len(ts_2['value'])
 
             if (l_1 == 1 and l_2 == 1) or (l_1 != 1 and l_2 != 1):
-                new_ts['value'] = func(ts_1['value'], ts_2['value'])
+                # Both values are aligned on the same index, so that pandas
+                # does not build the union of the indexes
+                epochs, values_1, values_2 = au.align_timeseries(ts_1.index.values,
+                    ts_1['value'].values, ts_2.index.values, ts_2['value'].values,
+                    align = align, fill_value = fill_value, direction = direction,
+                    tolerance = tolerance)
+                index = pd.Index(epochs)
+                new_ts['value'] = func(pd.Series(values_1, index = index),
+                    pd.Series(values_2, index = index))
             elif l_1 == 1:
                 number = ts_1['value'].iloc[0]
                 new_ts['value'] = func(number, ts_2['value']) 
@@ -752,13 +1957,16 @@ def ts_pair_operation():
             new_ts.dropna(inplace = True)
 
             return new_ts
+
+        # keep the operation on the values, used by block_pair
+        f.operation = func
         return f
     return wrapper
 
 
 # --------------------------------- addition -----------------------------------
 @ts_list_function()
-def addition(*ts_lists):
+def addition(*ts_lists, **kwargs):
 
     ''' Perform a sum of timeseries lists
 
@@ -767,7 +1975,8 @@ def addition(*ts_lists):
         is the sum of the timeseries of each input timeseries list
         placed in the same position of the list
         
-        Rows with non-coincident indexes will be discarded
+        Rows with non-coincident indexes will be discarded, unless
+        they are aligned otherwise with the align argument
 
     .. arguments:
         ts_lists = ts_list_1, ..., ts_list_n a list of timeseries lists 
@@ -775,31 +1984,176 @@ def addition(*ts_lists):
             ts_list_1 = [ts_1_1, ..., ts_1_m]
             ...
             ts_list_n = [ts_n_1, ..., ts_n_m]
+        align, fill_value, direction, tolerance: alignment of the timeseries,
+            see ts_pair_operation
     
     .. returns:
         on success: ts_list = [ts_1_1 + ... + ts_n_1, ..., ts_1_m + ... + ts_n_m]
     '''
 
+    for elem in kwargs:
+        if elem not in ['align', 'fill_value', 'direction', 'tolerance']:
+            return {'error': 'unknown argument %s' %elem}
+
     l = len(ts_lists)
 
     if l <= 1:
         return {'error': 'Addition requires at least two arguments'}
-    else:
-        ts_list_ref = deepcopy(ts_lists[0])
-        l_ref = len(ts_list_ref)
 
+    l_ref = len(ts_lists[0])
+
+    # Only the inner alignment is summed at once, the others are folded
+    # pairwise, as well as invalid arguments so that ts_addition reports them
+    valid_alignment = type(check_alignment(**kwargs)) != dict
+    n_ary = kwargs.get('align', 'inner') == 'inner' and valid_alignment
+
+    # Blocks sharing the same epochs are summed at once, whatever the alignment
+    if valid_alignment:
+        new_ts_list = block_addition(ts_lists)
+        if new_ts_list is not None:
+            return new_ts_list
+
+    if not n_ary:
+        ts_list_ref = list(ts_lists[0])
         for i in range(1, l):
             if len(ts_lists[i]) != l_ref:
                 return {'error': 'Timeseries lists must have the same dimension'}
-            else:
-                for j in range(l_ref):
-                    r = ts_addition(ts_list_ref[j], ts_lists[i][j])
-                    if 'error' in r:
-                        return r
-                    ts_list_ref[j] = r
+            for j in range(l_ref):
+                r = ts_addition(ts_list_ref[j], ts_lists[i][j], **kwargs)
+                if 'error' in r:
+                    return r
+                ts_list_ref[j] = r
 
         return ts_list_ref
 
+    # Each timeserie is converted once, checking the dimensions
+    # in the same order as the pairwise fold does
+    float_ts_lists = [[] for j in range(l_ref)]
+    for i in range(1, l):
+        if len(ts_lists[i]) != l_ref:
+            return {'error': 'Timeseries lists must have the same dimension'}
+        for j in range(l_ref):
+            for ts in (ts_lists[0][j], ts_lists[i][j]) if i == 1 else (ts_lists[i][j],):
+                new_ts = ts_to_float(ts)
+                if 'error' in new_ts:
+                    return new_ts
+                float_ts_lists[j].append(new_ts)
+
+    output = []
+    for float_ts_list in float_ts_lists:
+        new_ts = ts_n_addition(float_ts_list)
+        if new_ts is None:
+            new_ts = float_ts_list[0]
+            for ts in float_ts_list[1:]:
+                new_ts = ts_addition(new_ts, ts)
+                if 'error' in new_ts:
+                    return new_ts
+        output.append(new_ts)
+
+    return output
+
+
+def block_addition(ts_lists):
+
+    ''' Sum of TsBlocks with the same epochs, adding the blocks one after
+        another as the pairwise fold does.
+
+    .. returns:
+        TsBlock with the sum, or None when the timeseries lists are not
+        such TsBlocks or the fold would drop some value'''
+
+    ts_block = ts_lists[0]
+    for elem in ts_lists:
+        if not is_block(elem) or len(elem) != len(ts_block):
+            return None
+
+    if len(ts_block) == 0 or len(ts_block.epochs) == 0:
+        return None
+
+    for elem in ts_lists[1:]:
+        if not np.array_equal(elem.epochs, ts_block.epochs):
+            return None
+
+    with np.errstate(invalid = 'ignore'):
+        values = ts_block.values + ts_lists[1].values
+        for elem in ts_lists[2:]:
+            values += elem.values
+
+    # NaN propagates, so the values dropped by the fold are still NaN at the end
+    if np.isnan(values).any():
+        return None
+
+    return TsBlock(ts_block.epochs, values)
+
+
+def ts_n_addition(ts_list):
+
+    ''' Sum of several timeseries in a single pass, equal to
+        folding them pairwise with ts_addition
+
+        The epochs common to the timeseries of length != 1 are found
+        first, and their values are stacked in a 2-D array along with
+        the timeseries of length 1, which are treated as scalars. The
+        rows of the array are added in order, so the floats are the
+        same as the ones of the pairwise sums.
+
+    .. arguments:
+    - (list) ts_list: list of DataFrames with float values
+
+    .. returns:
+        DataFrame with the sum, or None when the pairwise fold may
+        give another result: less than two timeseries of length != 1,
+        or a running sum left with less than two values, which 
+        ts_addition would then treat as a scalar
+    '''
+
+    longs = [i for (i, ts) in enumerate(ts_list) if len(ts) != 1]
+    if len(longs) < 2 or longs[0] > 1:
+        return None
+
+    sorted_ts = {}
+    for i in longs:
+        sorted_ts[i] = au.sort_epochs(ts_list[i].index.values, ts_list[i]['value'].values)
+
+    # Rows of the first timeserie whose epochs are found in all the others
+    epochs_0, values_0 = sorted_ts[longs[0]]
+    rows = np.arange(len(epochs_0))
+    for i in longs[1:]:
+        epochs = epochs_0[rows]
+        epochs_i = sorted_ts[i][0]
+        # Timeseries sampled on the same epochs are the usual case
+        if np.array_equal(epochs_i, epochs):
+            continue
+        pos = np.searchsorted(epochs_i, epochs)
+        found = pos < len(epochs_i)
+        found[found] = epochs_i[pos[found]] == epochs[found]
+        rows = rows[found]
+    epochs = epochs_0[rows]
+
+    block = np.empty((len(ts_list), len(rows)), dtype = np.float64)
+    for (i, ts) in enumerate(ts_list):
+        if i == longs[0]:
+            block[i] = values_0[rows]
+        elif i in sorted_ts:
+            epochs_i, values_i = sorted_ts[i]
+            if np.array_equal(epochs_i, epochs):
+                block[i] = values_i
+            else:
+                block[i] = values_i[np.searchsorted(epochs_i, epochs)]
+        else:
+            block[i] = ts['value'].values[0]
+
+    # The reduction along the first axis adds the rows one after another
+    with np.errstate(invalid = 'ignore'):
+        total = np.add.reduce(block, axis = 0)
+
+    # The values dropped by the fold are the NaN of the total, as NaN propagates
+    keep = ~np.isnan(total)
+    if keep.sum() < 2:
+        return None
+
+    return pd.DataFrame({'value': total[keep]}, index = pd.Index(epochs[keep]))
+
 
 @ts_pair_operation()
 def ts_addition(ts_1, ts_2):
@@ -820,7 +2174,8 @@ def ts_addition(ts_1, ts_2):
 
 # --------------------------------- subtraction -----------------------------------
 @ts_list_function()
-def subtraction(ts_list_1, ts_list_2):
+def subtraction(ts_list_1, ts_list_2, align = 'inner', fill_value = 0., direction = 'backward',
+    tolerance = None):
 
     ''' Perform a subtraction of two timeseries lists: ts_list_1 - ts_list_2
 
@@ -829,11 +2184,14 @@ def subtraction(ts_list_1, ts_list_2):
         is the difference between the timeseries
         placed in the same position of the list
         
-        Rows with non-coincident indexes will be discarded
+        Rows with non-coincident indexes will be discarded, unless
+        they are aligned otherwise with the align argument
 
     .. arguments: two timeseries lists with the same length
         ts_list_1 = [ts_1_1, ..., ts_1_m]
         ts_list_2 = [ts_2_1, ..., ts_2_m]
+        align, fill_value, direction, tolerance: alignment of the timeseries,
+            see ts_pair_operation
     
     .. returns:
         on success: ts_list = [ts_1_1 - ts_2_1, ..., ts_1_m - ts_2_m]
@@ -845,11 +2203,18 @@ def subtraction(ts_list_1, ts_list_2):
 
     if l_1 != l_2:
         return {'error': 'Subtraction - Timeseries list must have same dimension'}
+
+    # Timeseries sharing the same epochs are operated at once
+    r = block_pair(ts_subtraction, ts_list_1, ts_list_2, align = align, fill_value = fill_value,
+        direction = direction, tolerance = tolerance)
+    if r is not None:
+        return r
     
     new_ts_list = []
 
     for i in range(l_1):
-        r = ts_subtraction(ts_list_1[i], ts_list_2[i])
+        r = ts_subtraction(ts_list_1[i], ts_list_2[i], align = align, fill_value = fill_value,
+            direction = direction, tolerance = tolerance)
         if 'error' in r:
             return r
         new_ts_list.append(r)
@@ -874,7 +2239,8 @@ def ts_subtraction(ts_1, ts_2):
 
 # --------------------------------- product -----------------------------------
 @ts_list_function()
-def product(ts_list_1, ts_list_2):
+def product(ts_list_1, ts_list_2, align = 'inner', fill_value = 0., direction = 'backward',
+    tolerance = None):
 
     ''' Perform a product of two timeseries lists
 
@@ -883,11 +2249,14 @@ def product(ts_list_1, ts_list_2):
         is the sum of the timeseries of each input timeseries list
         placed in the same position of the list
         
-        Rows with non-coincident indexes will be discarded
+        Rows with non-coincident indexes will be discarded, unless
+        they are aligned otherwise with the align argument
 
     .. arguments: two timeseries lists with the same length
         ts_list_1 = [ts_1_1, ..., ts_1_m]
         ts_list_2 = [ts_2_1, ..., ts_2_m]
+        align, fill_value, direction, tolerance: alignment of the timeseries,
+            see ts_pair_operation
     
     .. returns:
         on success: ts_list = [ts_1_1 * ts_2_1, ..., ts_1_m * ts_2_m]
@@ -899,11 +2268,18 @@ def product(ts_list_1, ts_list_2):
 
     if l_1 != l_2:
         return {'error': 'Product - Timeseries list must have same dimension'}
+
+    # Timeseries sharing the same epochs are operated at once
+    r = block_pair(ts_product, ts_list_1, ts_list_2, align = align, fill_value = fill_value,
+        direction = direction, tolerance = tolerance)
+    if r is not None:
+        return r
     
     new_ts_list = []
 
     for i in range(l_1):
-        r = ts_product(ts_list_1[i], ts_list_2[i])
+        r = ts_product(ts_list_1[i], ts_list_2[i], align = align, fill_value = fill_value,
+            direction = direction, tolerance = tolerance)
         if 'error' in r:
             return r
         new_ts_list.append(r)
@@ -928,7 +2304,8 @@ def ts_product(ts_1, ts_2):
 
 # --------------------------------- division -----------------------------------
 @ts_list_function()
-def division(ts_list_1, ts_list_2):
+def division(ts_list_1, ts_list_2, align = 'inner', fill_value = 0., direction = 'backward',
+    tolerance = None):
 
     ''' Perform a division of two timeseries lists
 
@@ -937,12 +2314,15 @@ def division(ts_list_1, ts_list_2):
         is the division of the timeseries of each input timeseries list
         placed in the same position of the list
         
-        Rows with non-coincident indexes will be discarded
+        Rows with non-coincident indexes will be discarded, unless
+        they are aligned otherwise with the align argument
         Rows with NaN values because ts_list_2 is zero will be discarded
 
     .. arguments: two timeseries lists with the same length
         ts_list_1 = [ts_1_1, ..., ts_1_m]
         ts_list_2 = [ts_2_1, ..., ts_2_m]
+        align, fill_value, direction, tolerance: alignment of the timeseries,
+            see ts_pair_operation
     
     .. returns:
         on success: ts_list = [ts_1_1 / ts_2_1, ..., ts_1_m / ts_2_m]
@@ -954,11 +2334,18 @@ def division(ts_list_1, ts_list_2):
 
     if l_1 != l_2:
         return {'error': 'Division - Timeseries list must have same dimension'}
+
+    # Timeseries sharing the same epochs are operated at once
+    r = block_pair(ts_division, ts_list_1, ts_list_2, align = align, fill_value = fill_value,
+        direction = direction, tolerance = tolerance)
+    if r is not None:
+        return r
     
     new_ts_list = []
 
     for i in range(l_1):
-        r = ts_division(ts_list_1[i], ts_list_2[i])
+        r = ts_division(ts_list_1[i], ts_list_2[i], align = align, fill_value = fill_value,
+            direction = direction, tolerance = tolerance)
         if 'error' in r:
             return r
         new_ts_list.append(r)
@@ -986,6 +2373,59 @@ def ts_division(ts_1, ts_2):
     return ts_3
 
 
+# --------------------------------- as-of join -----------------------------------
+@ts_list_function()
+def asof_join(ts_list_1, ts_list_2, direction = 'backward', tolerance = None):
+
+    ''' Pair the epochs of the timeseries of ts_list_1 with the samples
+        of the timeserie placed in the same position of ts_list_2
+
+        Irregular timeseries are combined this way without distributing
+        both of them on a common grid
+
+    .. arguments: two timeseries lists with the same length
+        ts_list_1 = [ts_1_1, ..., ts_1_m]
+        ts_list_2 = [ts_2_1, ..., ts_2_m]
+        direction: backward, forward or nearest sample of ts_list_2
+        tolerance: maximum distance in seconds to the paired sample
+
+    .. returns:
+        on success: ts_list with the epochs of each ts_1_i that have been
+            paired and the values of ts_2_i paired with them
+    '''
+
+    r = check_alignment('asof', direction = direction, tolerance = tolerance)
+    if type(r) == dict:
+        return r
+    tolerance = r[1]
+
+    if len(ts_list_1) != len(ts_list_2):
+        return {'error': 'As-of join - Timeseries list must have same dimension'}
+
+    return [ts_asof_join(ts_1, ts_2, direction = direction, tolerance = tolerance)
+        for (ts_1, ts_2) in zip(ts_list_1, ts_list_2)]
+
+
+def ts_asof_join(ts_1, ts_2, direction = 'backward', tolerance = None):
+
+    '''Pair each epoch of ts_1 with a sample of ts_2, see analysis_utils.asof_positions
+
+    .. arguments:
+    - (DataFrame) ts_1: pandas DataFrame containing a timeserie
+    - (DataFrame) ts_2: pandas DataFrame containing a timeserie
+    - (string) direction: backward, forward or nearest
+    - (float) tolerance: maximum distance to the paired sample
+
+    .. returns:
+    - timeserie with the paired epochs of ts_1 and the values of ts_2'''
+
+    epochs, values_1, values_2 = au.align_timeseries(ts_1.index.values, ts_1['value'].values,
+        ts_2.index.values, ts_2['value'].values, align = 'asof', direction = direction,
+        tolerance = tolerance)
+
+    return pd.DataFrame({'value': values_2}, index = epochs)
+
+
 # -------------------------------------------------------------------------------------
 # ------------------------------------- Timeseries splitting function ------------------
 
@@ -1035,23 +2475,40 @@ def ts_split(ts, period = 'day'):
     .. returns:
     - on success: timeseries list containing the splitted timeseries'''
 
-    splitted_ts = []
+    if len(ts) == 0:
+        return []
+
+    epochs = ts.index.values
+
+    # Compute the boundaries of the periods once for the whole range
+    bounds = au.interval_boundaries(period, e_from = epochs.min(), e_to = epochs.max())
+    if type(bounds) == dict:
+        return bounds
 
-    ts['split'] = ts.index.map(lambda x: au.time_interval_beginning(period, epoch_ref = x))
+    # An epoch x belongs to the period starting at bound when
+    # bound < 60*int(x/60), that is, when bound + 60 <= x
+    if not ts.index.is_monotonic_increasing:
+        keys = np.searchsorted(bounds + 60, epochs, side = 'right')
+        ts = ts.iloc[np.argsort(keys, kind = 'mergesort')]
+        epochs = ts.index.values
 
-    grouped_ts = ts.groupby(['split'])
+    cuts = np.searchsorted(epochs, bounds + 60, side = 'left')
+    cuts = np.append(cuts, len(epochs))
+    cuts = np.unique(cuts)
 
-    for name, group in grouped_ts:
-        help_ts = pd.DataFrame(group)
-        help_ts = help_ts.drop('split', axis = 1)
-        splitted_ts.append(help_ts)
+    starts = cuts[:-1]
+    ends = cuts[1:]
 
-    return splitted_ts
+    return [ts.iloc[s:e] for s, e in zip(starts, ends)]
     
 
 # --------------------------- Data generation for testing purposes ------------------------------
 def generate_ts_list(data):
 
+    # timeseries lists encoded with ts_list_to_bytes
+    if type(data) in [str, bytearray, buffer] and str(data[:4]) == BINARY_MAGIC:
+        return bytes_to_ts_list(data)
+
     ts_list = []
 
     try:
@@ -1103,10 +2560,309 @@ def df_to_list(df):
     l1 = df.index.values.tolist()
     l2 = df['value'].values.tolist()
 
-    l = [[l1[i], l2[i]] for i in range(len(l1))]
+    return map(list, zip(l1, l2))
+
+
+# ---------------------------- timeseries list to json ------------------------
+@ts_list_function()
+def ts_list_to_json(ts_list, chunk_size = 10000):
+
+    ''' JSON text of ts_list_to_list(ts_list), without building the lists,
+        see iter_ts_list_json'''
+
+    pieces = iter_ts_list_json(ts_list, chunk_size = chunk_size)
+    if type(pieces) == dict: return pieces
+
+    return ''.join(pieces)
+
+
+def iter_ts_list_json(ts_list, chunk_size = 10000):
+
+    ''' Pieces of the JSON text of ts_list_to_list(ts_list), the same text
+        json.dumps gives. The timeseries are encoded by chunks of chunk_size
+        rows straight from their arrays, so the pieces can be streamed
+        without holding the whole text, nor the lists, in memory
+
+    .. arguments:
+    - (list) ts_list: list of timeseries
+    - (integer) chunk_size: number of rows encoded at once
+
+    .. returns:
+    - on success: generator of the pieces of the JSON text
+    - on error: dictionary with an error description'''
+
+    try:
+        chunk_size = int(chunk_size)
+    except:
+        return {'error': 'chunk_size must be an integer'}
+
+    if chunk_size <= 0:
+        return {'error': 'chunk_size must be positive'}
+
+    return json_pieces(ts_list, chunk_size)
+
+
+def json_pieces(ts_list, chunk_size):
+
+    yield '['
+    for (i, ts) in enumerate(ts_list):
+        yield ', [' if i else '['
+
+        epochs = ts.index.values
+        values = ts['value'].values
+        for start in range(0, len(epochs), chunk_size):
+            if start:
+                yield ', '
+            yield json_rows(epochs[start:start + chunk_size], values[start:start + chunk_size])
+
+        yield ']'
+    yield ']'
+
+
+def json_rows(epochs, values):
+
+    ''' JSON text of the [epoch, value] rows of the arrays, without the brackets
+        of the list containing them'''
+
+    epochs_text = json_texts(epochs)
+    values_text = json_texts(values)
+
+    texts = [None]*(2*len(epochs))
+    texts[0::2] = epochs_text
+    texts[1::2] = values_text
+
+    return ('[%s, %s], '*len(epochs) %tuple(texts))[:-2]
+
+
+def json_texts(values):
+
+    ''' JSON text of each of the values of an array. The numbers are encoded by
+        json at once, and when they are repeated, as distributed values usually
+        are, each different value is encoded only once'''
+
+    if values.dtype.kind not in 'iuf':
+        return map(json.dumps, values.tolist())
+
+    if len(values) == 0:
+        return []
+
+    # unique does not tell 0. from -0.
+    if values.dtype.kind == 'f' and np.signbit(values[values == 0]).any():
+        return json.dumps(values.tolist())[1:-1].split(', ')
+
+    unique, inverse = np.unique(values, return_inverse = True)
+    if 2*len(unique) <= len(values):
+        texts = np.array(json.dumps(unique.tolist())[1:-1].split(', '), dtype = object)
+        return texts[inverse].tolist()
+
+    return json.dumps(values.tolist())[1:-1].split(', ')
+
+# ---------------------------- timeseries list to bytes ------------------------
+# Binary columnar encoding of timeseries lists, little endian:
+#   - header: BINARY_MAGIC, number of timeseries (uint32)
+#   - for each timeserie: number of rows (uint32), epochs encoding (uint8),
+#     values encoding (uint8), 2 padding bytes, followed by the epochs and
+#     the values, each one padded to a multiple of 8 bytes
+#   - epochs encodings:
+#       0 raw: int64 epochs
+#       1 step: int64 first epoch and int64 step between epochs
+#       2, 3, 4: int64 first epoch followed by the differences between
+#           consecutive epochs as int8, int16 or int32
+#   - values encodings: 'f' float64, 'i' int64, 'b' bool, and 'j' for any
+#       other values, uint32 length of the JSON text of the list of values
+#       followed by the text
+# The arrays are decoded as views of the data received, without copying them.
+
+BINARY_MAGIC = 'TSL\x01'
+EPOCH_DELTA_TYPES = {2: '<i1', 3: '<i2', 4: '<i4'}
+
+
+@ts_list_function()
+def ts_list_to_bytes(ts_list):
+
+    ''' Encode ts_list in the binary format above, see bytes_to_ts_list
+
+    .. arguments:
+    - (list) ts_list: list of timeseries
+
+    .. returns:
+        string with the encoded timeseries list'''
+
+    pieces = [BINARY_MAGIC, struct.pack('<I', len(ts_list))]
+
+    for ts in ts_list:
+        epochs = ts.index.values.astype('<i8')
+        values = ts['value'].values
+
+        epochs_kind, epochs_data = encode_epochs(epochs)
+
+        if values.dtype.kind == 'f':
+            values_kind, values_data = 'f', values.astype('<f8').tostring()
+        elif values.dtype.kind in 'iu':
+            values_kind, values_data = 'i', values.astype('<i8').tostring()
+        elif values.dtype.kind == 'b':
+            values_kind, values_data = 'b', values.tostring()
+        else:
+            try:
+                text = json.dumps(values.tolist())
+            except TypeError:
+                return {'error': 'Values can not be encoded'}
+            values_kind, values_data = 'j', struct.pack('<I', len(text)) + text
+
+        pieces.append(struct.pack('<IBc2x', len(epochs), epochs_kind, values_kind))
+        pieces.append(padded(epochs_data))
+        pieces.append(padded(values_data))
+
+    return ''.join(pieces)
+
+
+def encode_epochs(epochs):
+
+    ''' Shortest encoding of an int64 array of epochs, see ts_list_to_bytes'''
+
+    if len(epochs) < 2:
+        return 0, epochs.tostring()
+
+    deltas = np.diff(epochs)
+    first = struct.pack('<q', epochs[0])
+
+    if (deltas == deltas[0]).all():
+        return 1, first + struct.pack('<q', deltas[0])
+
+    for (kind, dtype) in sorted(EPOCH_DELTA_TYPES.items()):
+        limits = np.iinfo(dtype)
+        if deltas.min() >= limits.min and deltas.max() <= limits.max:
+            return kind, first + deltas.astype(dtype).tostring()
+
+    return 0, epochs.tostring()
+
+
+def padded(data):
+
+    return data + '\x00'*(-len(data) % 8)
+
+
+def bytes_to_ts_list(data):
+
+    ''' Decode a timeseries list encoded with ts_list_to_bytes. The float, int
+        and bool values, and the raw epochs, are views of data. Read only when
+        data is a string, so that data must not be modified afterwards if it
+        is a bytearray
+
+    .. arguments:
+    - (data) string, bytearray or buffer with the encoded timeseries list
+
+    .. returns:
+    - on success: list of timeseries
+    - on error: dictionary with an error description'''
+
+    error = {'error': 'Invalid binary timeseries list'}
+
+    try:
+        if str(data[:4]) != BINARY_MAGIC:
+            return error
+
+        n_ts = struct.unpack_from('<I', data, 4)[0]
+        offset = 8
+
+        ts_list = []
+        for i in range(n_ts):
+            n, epochs_kind, values_kind = struct.unpack_from('<IBc2x', data, offset)
+            offset += 8
+
+            if epochs_kind == 0:
+                epochs = np.frombuffer(data, dtype = '<i8', count = n, offset = offset)
+                size = 8*n
+            elif epochs_kind == 1:
+                first, step = struct.unpack_from('<qq', data, offset)
+                epochs = first + step*np.arange(n, dtype = np.int64)
+                size = 16
+            elif epochs_kind in EPOCH_DELTA_TYPES:
+                dtype = np.dtype(EPOCH_DELTA_TYPES[epochs_kind])
+                epochs = np.empty(n, dtype = np.int64)
+                epochs[0] = struct.unpack_from('<q', data, offset)[0]
+                np.cumsum(np.frombuffer(data, dtype = dtype, count = n - 1, offset = offset + 8),
+                    out = epochs[1:])
+                epochs[1:] += epochs[0]
+                size = 8 + dtype.itemsize*(n - 1)
+            else:
+                return error
+            offset += size + (-size % 8)
+
+            if values_kind in ['f', 'i', 'b']:
+                dtype = np.dtype({'f': '<f8', 'i': '<i8', 'b': '?'}[values_kind])
+                values = np.frombuffer(data, dtype = dtype, count = n, offset = offset)
+                size = dtype.itemsize*n
+            elif values_kind == 'j':
+                size = struct.unpack_from('<I', data, offset)[0]
+                values = np.empty(n, dtype = object)
+                values[:] = json.loads(str(data[offset + 4:offset + 4 + size]))
+                size += 4
+            else:
+                return error
+            offset += size + (-size % 8)
+
+            ts_list.append(pd.DataFrame(values.reshape(n, 1), index = pd.Index(epochs),
+                columns = ['value']))
+    except (struct.error, ValueError, TypeError, IndexError):
+        return error
+
+    if offset != len(data):
+        return error
+
+    return ts_list
+
+
+# ---------------------------- compressed timeseries ------------------------
+@ts_list_function()
+def compress_ts_list(ts_list, chunk_size = cs.CHUNK_SIZE):
+
+    ''' Compress the timeseries of ts_list, meant for the ones kept in memory
+        for long. Regular epochs and repeated values take a bit each, see
+        compressed_series.CompressedSeries
+
+    .. arguments:
+    - (list) ts_list: list of timeseries with numeric values
+    - (integer) chunk_size: number of values of each chunk, the minimum
+        number of values decoded at once
+
+    .. returns:
+    - on success: list of CompressedSeries
+    - on error: dictionary with an error description'''
+
+    try:
+        chunk_size = int(chunk_size)
+    except:
+        return {'error': 'chunk_size must be an integer'}
+
+    if chunk_size <= 0:
+        return {'error': 'chunk_size must be positive'}
+
+    try:
+        return [cs.CompressedSeries(ts.index.values, ts['value'].values, chunk_size = chunk_size)
+            for ts in ts_list]
+    except TypeError:
+        return {'error': 'Only numeric timeseries can be compressed'}
+
+
+def decompress_ts_list(compressed_list, e_from = None, e_to = None):
+
+    ''' Timeseries list with the values of each CompressedSeries of compressed_list
+        between the epochs e_from and e_to, both included. Only the chunks
+        containing them are decoded
+
+    .. returns:
+        list of timeseries, with float64 or int64 values'''
+
+    ts_list = []
+    for compressed in compressed_list:
+        epochs, values = compressed.decode(e_from = e_from, e_to = e_to)
+        ts_list.append(pd.DataFrame(values.reshape(-1, 1), index = pd.Index(epochs),
+            columns = ['value']))
+
+    return ts_list
+
 
-    return l
-    
 # ---------------------------- usage ------------------------
 # --------------------------------------------------------------------
 def get_increments(id_variable, time_int = 300, expand = True, now = None, 
@@ -1132,78 +2888,32 @@ def get_increments(id_variable, time_int = 300, expand = True, now = None,
 
     '''
     # Convert input parameters to their data formats
-    try:
-        time_int = int(time_int)
-        expand = type_conversion(expand, 'BOOLEAN')['success']
-        distr = type_conversion(distr, 'BOOLEAN')['success']
-    except:
-        return {'error': 'parameters do not have required format'}
-
-
-    # the restriction to the number of values will be applied once we 
-    # have the timeseries. We arrange the count parameter to a value
-    # that we can be sure that is not restrictive.
-    cc = kwargs.get('count', False)
-    if cc:
-        try:
-            cc = int(cc)
-        except:
-            return {'error': 'count argument is not an integer: {!s}'.format(cc)}
-        kwargs['count'] = cc*time_int
+    spec = query_spec(kwargs, time_int = time_int, expand = expand, distr = distr,
+        int_type = 'closed', clip_range = False)
+    if type(spec) == dict: return spec
 
-    if now == None:
-        now = int(time.time())
-    else:
-        try:
-            now = int(now)
-        except:
-            return {'error': 'time reference received is not an epoch'}
-    time_ref = time_int*int(now/time_int) #now - time_int
+    time_ref = spec.time_ref(now)
+    if type(time_ref) == dict: return time_ref
 
     # translate the arguments given to column_start, column_finish, column_count format
-    column_range = au.column_range(kwargs, now = time_ref, int_type = 'closed')
+    column_range = spec.column_range(time_ref)
     if 'error' in column_range: return column_range
 
-    # Get the data of the given variable in the time interval wanted
-    data_list = af.get_variable_data(id_variable, column_range)
-    if 'error' in data_list: return data_list
-
-    # Get extra value when first value is not coincident with column_finish
+    # Get the data of the given variable in the time interval wanted, with an
+    # extra value before it when the first value is not coincident with column_finish.
     # If we did it always we might get an extra increment when not distributing
-    extra_cf = data_list[0][0][0]
-    if extra_cf != column_range.get('column_finish', ('timeseries', False))[1]:
-        extra_cf -= 1
-        extra_column_range = {'column_start':('timeseries', extra_cf), 'column_count': 1}
-        extra_value = af.get_variable_data(id_variable, extra_column_range)
-        if not 'error' in extra_value:
-            data_list[0].insert(0, extra_value[0][0])
+    data_list = af.get_variable_data_preceding(id_variable, column_range, margin = spec.time_int)
+    if 'error' in data_list: return data_list
 
     # Convert the cassandra timeserie to a list containing a panda's dataframe
     ts_list = cassandra_to_ts_list(data_list, 'value')
 
     # expand results to the whole range demanded
-    cs = column_range.get('column_start', False)
-    if (not cs == False) and expand:
-        qTo = cs[1]
-    else:
-        qTo = False
-
-    cf = column_range.get('column_finish', False)
-    if (not cf == False) and expand:
-        qFrom = cf[1]
-    else:
-        qFrom = False
-
-    # If we have not defined a column_count and there's 
-    # a column_count established by the column_range function
-    # we use it
-    ccount = column_range.get('column_count', False)
-    if cc == False and ccount != False:
-        cc = ccount
+    qFrom, qTo, cc = spec.data_range(column_range)
 
     # Distribute the timeseries
-    if distr:
-        ts_list = distribute_ts_list(ts_list, seconds = time_int, e_to = qTo, e_from = qFrom)
+    if spec.distr:
+        ts_list = distribute_ts_list(ts_list, seconds = spec.time_int, e_to = qTo, e_from = qFrom)
 
     # Compute the increments
     ts_list = increments(ts_list)
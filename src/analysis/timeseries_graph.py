@@ -0,0 +1,288 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Lazy evaluation of the functions of timeseries_functions. The calls
+# build a graph of nodes, which is optimized and computed at once
+# by the collect method of its outer node
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# Imports and defines.
+
+import timeseries_functions as tf
+from common.util import type_conversion
+
+
+# ----------------------------------- Nodes ---------------------------------------
+
+class Node(object):
+
+    ''' Deferred call to the function "name" of timeseries_functions. The args
+        may be nodes themselves, the kwargs are passed as they are. Two nodes
+        calling the same function with the same arguments have the same key'''
+
+    def __init__(self, name, args = (), kwargs = None):
+        self.name = name
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.key = (name, tuple(arg_key(arg) for arg in self.args),
+            tuple(sorted((k, arg_key(v)) for (k, v) in self.kwargs.items())))
+
+    def __repr__(self):
+        args = [repr(arg) if isinstance(arg, Node) else str(arg) for arg in self.args]
+        args += ['%s = %s' %(k, v) for (k, v) in sorted(self.kwargs.items())]
+        return '%s(%s)' %(self.name, '; '.join(args))
+
+    def collect(self):
+
+        ''' Optimize the graph of the node and compute it, see optimize and evaluate'''
+
+        return evaluate(optimize(self))
+
+
+def arg_key(arg):
+
+    # Values that can not be hashed, like timeseries lists, are
+    # identified by the object itself
+    if isinstance(arg, Node):
+        return arg.key
+
+    try:
+        hash(arg)
+        return ('value', type(arg).__name__, arg)
+    except TypeError:
+        return ('object', id(arg))
+
+
+class LazyFunctions(object):
+
+    ''' Deferred version of the functions of timeseries_functions, which return
+        nodes instead of computing the function, for instance:
+
+        lazy.addition(lazy.get_variable(1), lazy.get_variable(2)).collect()'''
+
+    def __getattr__(self, name):
+        if not callable(getattr(tf, name)):
+            raise AttributeError(name)
+
+        def deferred(*args, **kwargs):
+            return Node(name, args, kwargs)
+
+        return deferred
+
+
+lazy = LazyFunctions()
+
+
+# --------------------------------- Optimization -------------------------------------
+
+def optimize(node):
+
+    ''' Return an optimized graph computing the same as the graph of node,
+        which is not modified:
+        - equal subtrees are replaced by a single node, computed once
+        - chains of scalar functions are fused into scalar_chain calls
+        - the number of values of last is pushed down to the get_variable
+            it is applied to, when that reads less data giving the same output
+
+    .. arguments:
+    - (node) Node: outer node of the graph
+
+    .. returns:
+        Node: outer node of the optimized graph'''
+
+    node = share_subtrees(node, {})
+    node = fuse_scalar_functions(node, count_consumers(node), {})
+    node = push_down_last(node, count_consumers(node), {})
+
+    return share_subtrees(node, {})
+
+
+def rebuild(node, transform, done):
+
+    ''' Node with the same function as node and its args transformed'''
+
+    args = []
+    for arg in node.args:
+        if isinstance(arg, Node):
+            if arg.key not in done:
+                done[arg.key] = transform(arg)
+            arg = done[arg.key]
+        args.append(arg)
+
+    return Node(node.name, args, node.kwargs)
+
+
+def share_subtrees(node, nodes):
+
+    ''' Graph where the nodes with the same key are the same object'''
+
+    new_node = rebuild(node, lambda arg: share_subtrees(arg, nodes), {})
+
+    return nodes.setdefault(new_node.key, new_node)
+
+
+def count_consumers(node):
+
+    ''' Number of nodes using the result of each node of the graph, by key.
+        The outer node counts as used once'''
+
+    counts = {node.key: 1}
+    pending = [node]
+    while pending:
+        elem = pending.pop()
+        for arg in elem.args:
+            if isinstance(arg, Node):
+                if arg.key not in counts:
+                    counts[arg.key] = 0
+                    pending.append(arg)
+                counts[arg.key] += 1
+
+    return counts
+
+
+def scalar_operations(node):
+
+    ''' Operations of node as in scalar_chain if it is a scalar function of a
+        single timeseries list, None otherwise'''
+
+    if len(node.args) != 1:
+        return None
+
+    if node.name in tf.SCALAR_FUNCTIONS and set(node.kwargs) <= set(['number']):
+        return [(node.name, node.kwargs.get('number', tf.SCALAR_FUNCTIONS[node.name][1]))]
+
+    if node.name == 'scalar_chain' and set(node.kwargs) <= set(['operations']):
+        try:
+            operations = [(name, number) for (name, number) in node.kwargs.get('operations', ())]
+        except (TypeError, ValueError):
+            return None
+        if all(name in tf.SCALAR_FUNCTIONS for (name, number) in operations):
+            return operations
+
+    return None
+
+
+def fuse_scalar_functions(node, counts, done):
+
+    ''' Graph where the scalar functions applied one inside the other are
+        computed with a single scalar_chain. The inner functions used by
+        other nodes too are not fused, so that they are still computed once'''
+
+    new_node = rebuild(node, lambda arg: fuse_scalar_functions(arg, counts, done), done)
+
+    outer = scalar_operations(new_node)
+    inner = new_node.args[0] if outer else None
+    if not isinstance(inner, Node) or counts.get(node.args[0].key) != 1:
+        return new_node
+
+    operations = scalar_operations(inner)
+    if not operations:
+        return new_node
+
+    return Node('scalar_chain', inner.args, {'operations': tuple(operations + outer)})
+
+
+def push_down_last(node, counts, done):
+
+    ''' Graph where the get_variable inside a last reads only the values last
+        keeps. That is only the same when get_variable does not distribute nor
+        compact the values, and its range does not depend on the count'''
+
+    new_node = rebuild(node, lambda arg: push_down_last(arg, counts, done), done)
+
+    if new_node.name != 'last' or len(new_node.args) != 1 or \
+            set(new_node.kwargs) - set(['number']):
+        return new_node
+
+    # as in ts_last, only integer numbers are applied
+    number = new_node.kwargs.get('number', 1)
+    if type(number) not in [int, long] or number < 1:
+        return new_node
+
+    fetch = new_node.args[0]
+    if not isinstance(fetch, Node) or fetch.name != 'get_variable' or \
+            len(fetch.args) != 1 or counts.get(node.args[0].key) != 1:
+        return new_node
+
+    kwargs = fetch.kwargs
+    if not ('range' in kwargs or 'from' in kwargs or 'to' in kwargs):
+        return new_node
+
+    if boolean(kwargs.get('distr', True)) != False or boolean(kwargs.get('compact', False)) != False:
+        return new_node
+
+    count = number
+    if 'count' in kwargs:
+        try:
+            count = min(int(kwargs['count']), number)
+        except:
+            return new_node
+
+    fetch = Node(fetch.name, fetch.args, dict(kwargs, count = count))
+
+    return Node(new_node.name, [fetch], new_node.kwargs)
+
+
+def boolean(value):
+
+    ''' Boolean value of a boolean argument, None if it is not valid'''
+
+    try:
+        return type_conversion(value, 'BOOLEAN')['success']
+    except:
+        return None
+
+
+# --------------------------------- Evaluation -------------------------------------
+
+def evaluate(node):
+
+    ''' Compute the graph of node. The result of each node is computed once,
+        and released as soon as all the nodes using it have been computed.
+        As in the parser, the errors of the args are returned as they are
+        and failed calls return an error
+
+    .. arguments:
+    - (node) Node: outer node of the graph
+
+    .. returns:
+    - on success: result of the function of node
+    - on error: dictionary with an error description'''
+
+    return compute(node, count_consumers(node), {})
+
+
+def compute(node, counts, results):
+
+    if node.key in results:
+        result = results[node.key]
+    else:
+        args = []
+        for arg in node.args:
+            if isinstance(arg, Node):
+                arg = compute(arg, counts, results)
+                if type(arg) == dict and 'error' in arg:
+                    return arg
+            args.append(arg)
+
+        try:
+            result = getattr(tf, node.name)(*args, **node.kwargs)
+        except:
+            result = {'error': 'Unable to compute function'}
+
+        results[node.key] = result
+
+    # release the result once its last consumer has it
+    counts[node.key] -= 1
+    if counts[node.key] <= 0:
+        del results[node.key]
+
+    return result
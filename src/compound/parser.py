@@ -21,6 +21,7 @@
 import re
 
 import analysis.timeseries_functions as tu
+import analysis.timeseries_graph as tg
 
 # ------------------------------ Function parser -------------------------------------
 def parser(text):
@@ -65,6 +66,19 @@ def parser(text):
     if args == 'error':
         return {args: kwargs}
 
+    # Chains of scalar functions are computed at once
+    chain = find_scalar_chain(val_1, args, kwargs)
+    if chain:
+        arg, operations = chain
+        a = parser(arg)
+        if type(a) == dict and 'error' in a:
+            return a
+
+        try:
+            return tu.scalar_chain(a, operations = operations)
+        except:
+            return {'error': 'Unable to compute function'}
+
     # Recursive call to parser for computing the args
     new_args = []
     for arg in args:
@@ -83,6 +97,98 @@ def parser(text):
 
 
 
+def plan(text):
+
+    ''' Same as parser, but instead of calling the functions, build the graph
+        of calls of the formula, reading its text only once. The graph is
+        computed with its collect method, see analysis.timeseries_graph
+
+    .. arguments:
+    - (text) string : string containing the formula, see parser
+
+    .. returns:
+    - on success: analysis.timeseries_graph.Node, or text if it does not
+        call any function
+    - on error: dictionary with an error description
+
+    '''
+
+    if not text:
+        return {'error': 'Not valid formula'}
+
+    # Delete blanks
+    text = text.replace(' ', '')
+
+    # Identify the text representing the outer function being called
+    out, val_1, val_2 = find_func(text)
+    if out == 'error':
+        return {'error': val_1}
+    elif val_1 == '':
+        return text
+
+    if not callable(getattr(tu, val_1, None)):
+        return {'error': 'Unknown function: %s' %val_1}
+
+    # Get the args and kwargs of the function
+    args, kwargs = parse_args(val_2)
+
+    if args == 'error':
+        return {args: kwargs}
+
+    new_args = []
+    for arg in args:
+        a = plan(arg)
+        if type(a) == dict and 'error' in a:
+            return a
+        new_args.append(a)
+
+    return tg.Node(val_1, new_args, kwargs)
+
+
+def find_scalar_chain(func_name, args, kwargs):
+
+    ''' Given a function call already parsed, find if it is a chain of
+        scalar functions, each one with a single argument and at most the
+        number kwarg, like scalar_sum(scalar_product(x;number=2);number=5)
+
+    .. arguments:
+    - (func_name) string : name of the outer function
+    - (args) list : args of the outer function
+    - (kwargs) dict : kwargs of the outer function
+
+    .. returns:
+    - (arg, operations) if the chain has at least two functions:
+        (arg): text of the argument of the inner function
+        (operations): list of (function name, number) from the inner
+            to the outer function, see timeseries_functions.scalar_chain
+    - None otherwise
+
+    '''
+
+    operations = []
+    arg = None
+
+    while func_name in tu.SCALAR_FUNCTIONS and len(args) == 1 and \
+            set(kwargs.keys()) <= set(['number']):
+
+        number = kwargs.get('number', tu.SCALAR_FUNCTIONS[func_name][1])
+        operations.insert(0, (func_name, number))
+        arg = args[0]
+
+        out, func_name, args_text = find_func(arg)
+        if out == 'error':
+            break
+
+        args, kwargs = parse_args(args_text)
+        if args == 'error':
+            break
+
+    if len(operations) < 2:
+        return None
+
+    return arg, operations
+
+
 def find_func(text):
 
     ''' Given a string representing a call to a function with the structure:
@@ -0,0 +1,65 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Throughput of the analysis_functions.py family on a 10M sample
+# timeseries. Not collected by nose, run it with:
+#
+#     python analysis_functions_bench.py [n_samples]
+#
+# The input and output timeseries are lists of tuples, so 10M samples
+# need several GB of memory.
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+import sys
+sys.path.append('../../src')
+import time
+import numpy as np
+
+from analysis.analysis_functions import *
+
+N_SAMPLES = 10000000
+
+
+def bench(name, func, *args, **kwargs):
+
+    t0 = time.time()
+    func(*args, **kwargs)
+    elapsed = time.time() - t0
+    print '%-26s %8.2f s %10.2f Msamples/s' %(name, elapsed, N_SAMPLES/elapsed/1e6)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        N_SAMPLES = int(sys.argv[1])
+
+    random = np.random.RandomState(1393628400)
+    epochs = (1388530800 + 60*np.arange(N_SAMPLES)).tolist()
+    meter = np.cumsum(random.randint(0, 10, N_SAMPLES)).astype(float)
+    meter[random.rand(N_SAMPLES) < 0.001] = 0.
+    states = random.randint(0, 3, N_SAMPLES).tolist()
+
+    float_ts = [zip(epochs, meter.tolist())]
+    state_ts = [zip(epochs, states)]
+    del meter, states
+
+    print 'Throughput on %d samples' %N_SAMPLES
+    bench('timeseries_to_float', timeseries_to_float, state_ts)
+    bench('compute_meter_increments', compute_meter_increments, float_ts)
+    bench('scalar_product', scalar_product, float_ts, 0.5)
+    bench('truncate_timeseries', truncate_timeseries, float_ts, 10)
+    bench('round_timeseries', round_timeseries, float_ts, 10)
+    bench('value_to_increments', value_to_increments, float_ts)
+    bench('clean_duplicated', clean_duplicated, state_ts)
+    bench('delete_critical_values', delete_critical_values, state_ts, 1)
+    bench('count_state_change', count_state_change, state_ts, 1)
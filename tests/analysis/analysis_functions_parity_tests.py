@@ -0,0 +1,277 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Parity tests between the vectorized functions of analysis_functions.py
+# and the element by element implementations they replaced
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+from nose.tools import *
+import sys
+sys.path.append('../../src')
+import json
+import numpy as np
+
+from analysis.analysis_functions import *
+
+RANDOM = np.random.RandomState(1393628400)
+
+# --------------------------------------------------------------------
+# Element by element implementations
+
+def ref_count_state_change(time_series, state_value):
+
+    output = []
+    for ts in time_series:
+        state_count = 0
+        in_state = True
+        epoch = ts[0][0]
+        for element in ts:
+            if str(element[1]) == str(state_value):
+                if not in_state:
+                    state_count += 1
+                    in_state = True
+            else:
+                in_state = False
+        output.append((epoch, state_count))
+
+    return [output]
+
+
+def ref_timeseries_to_float(timeseries):
+
+    output = []
+    for ts in timeseries:
+        new_ts = []
+        for (epoch, value) in ts:
+            if value == None:
+                new_ts.append((epoch, value))
+            else:
+                try:
+                    new_ts.append((epoch, float(value)))
+                except:
+                    return {'error': json.dumps({'error': 'Invalid value %s received' %str(value)})}
+        output.append(new_ts)
+
+    return output
+
+
+def ref_compute_meter_increments(time_series, reset_value = 0):
+
+    output = []
+    for ts in time_series:
+        epoch = ts[0][0]
+        inc = 0
+        if len(ts) > 1:
+            t0 = float(ts[0][1])
+            t1 = float(ts[1][1])
+            for i in range(1, len(ts) - 1):
+                if t1 >= t0:
+                    inc = inc + t1 - t0
+                else:
+                    inc = inc + t1 - reset_value
+                t0 = t1
+                t1 = float(ts[i + 1][1])
+        output.append((epoch, inc))
+
+    return [output]
+
+
+def ref_scalar_product(timeseries, scalar):
+
+    return [[(e[0], float(scalar)*e[1]) for e in ts] for ts in timeseries]
+
+
+def ref_truncate_timeseries(timeseries, truncate_unit = 1):
+
+    u = float(truncate_unit)
+    return [[(e[0], u*int(e[1]/u)) for e in ts] for ts in timeseries]
+
+
+def ref_round_timeseries(timeseries, round_unit = 1):
+
+    u = float(round_unit)
+    return [[(e[0], u*round(e[1]/u)) for e in ts] for ts in timeseries]
+
+
+def ref_value_to_increments(timeseries, monotony = 'increasing', reset_value = 0.):
+
+    inc_ts_list = []
+    for ts in timeseries:
+        new_ts = []
+        for i in range(len(ts) - 1):
+            if ts[i][1] > ts[i + 1][1] and monotony == 'increasing':
+                value = ts[i + 1][1] - reset_value
+            elif ts[i][1] < ts[i + 1][1] and monotony == 'decreasing':
+                value = ts[i + 1][1] - reset_value
+            else:
+                value = ts[i + 1][1] - ts[i][1]
+            new_ts.append([ts[i + 1][0], value])
+        inc_ts_list.append(new_ts)
+
+    return inc_ts_list
+
+
+def ref_clean_duplicated(timeseries):
+
+    clean_ts_list = []
+    for ts in timeseries:
+        new_ts = []
+        for elem in ts:
+            if new_ts == [] or new_ts[-1][1] != elem[1]:
+                new_ts.append(elem)
+        clean_ts_list.append(new_ts)
+
+    return clean_ts_list
+
+
+def ref_delete_critical_values(timeseries, critical_value):
+
+    return [[elem for elem in ts if elem[1] != critical_value] for ts in timeseries]
+
+
+# --------------------------------------------------------------------
+# Random timeseries
+
+def random_timeseries(n_ts = 3, kind = 'float'):
+
+    timeseries = []
+    for i in range(n_ts):
+        n = RANDOM.randint(1, 200)
+        epochs = np.cumsum(RANDOM.randint(1, 900, n)) + 1388530800
+        if kind == 'float':
+            values = np.round(RANDOM.rand(n)*100, 2).tolist()
+        elif kind == 'meter':
+            values = np.cumsum(RANDOM.randint(0, 10, n)).astype(float)
+            values[RANDOM.rand(n) < 0.05] = 0.
+            values = values.tolist()
+        elif kind == 'state':
+            values = RANDOM.randint(0, 3, n).tolist()
+        else:
+            values = [[u'on', u'off', None, 1][j] for j in RANDOM.randint(0, 4, n)]
+        timeseries.append(zip(epochs.tolist(), values))
+
+    return timeseries
+
+
+@nottest
+def assert_ts_almost_equal(ts_list_1, ts_list_2):
+
+    assert_equal(len(ts_list_1), len(ts_list_2))
+    for ts_1, ts_2 in zip(ts_list_1, ts_list_2):
+        assert_equal([e[0] for e in ts_1], [e[0] for e in ts_2])
+        assert_true(np.allclose([e[1] for e in ts_1], [e[1] for e in ts_2]))
+
+
+# --------------------------------------------------------------------
+# Parity tests
+
+def test_parity_count_state_change():
+    for i in range(20):
+        for kind in ['state', 'mixed']:
+            ts = random_timeseries(kind = kind)
+            for state in [0, 1, '1', 'on', None]:
+                assert_equal(count_state_change(ts, state), ref_count_state_change(ts, state))
+
+    # Mixed types, the values are compared by their representation
+    ts = [[(1, 1), (2, np.float64(1.)), (3, 1), (4, 1.), (5, True), (6, None), (7, 1L)]]
+    for state in [1, 1., '1.0', True, None]:
+        assert_equal(count_state_change(ts, state), ref_count_state_change(ts, state))
+
+
+def test_parity_timeseries_to_float():
+    for i in range(20):
+        for kind in ['float', 'state']:
+            ts = random_timeseries(kind = kind)
+            assert_equal(timeseries_to_float(ts), ref_timeseries_to_float(ts))
+
+    ts = [[(1388530800, u'1.5'), (1388531100, None), (1388531400, 2)]]
+    assert_equal(timeseries_to_float(ts), ref_timeseries_to_float(ts))
+
+    ts = [[(1388530800, u'1.5'), (1388531100, u'on')]]
+    assert_equal(timeseries_to_float(ts), ref_timeseries_to_float(ts))
+
+
+def test_parity_compute_meter_increments():
+    for i in range(20):
+        ts = random_timeseries(kind = 'meter')
+        real_output = compute_meter_increments(ts, reset_value = 1)
+        expected_output = ref_compute_meter_increments(ts, reset_value = 1)
+        assert_equal(real_output, expected_output)
+
+    # Values not exact in binary: the increments are added in order
+    values = (np.cumsum(RANDOM.rand(5000))*1e3/7).tolist()
+    ts = [zip(range(5000), values)]
+    incs = [values[i + 1] - values[i] for i in range(4998)]
+    total = 0.
+    for inc in incs:
+        total += inc
+    assert_equal(compute_meter_increments(ts), [[(0, total)]])
+    assert_ts_almost_equal(compute_meter_increments(ts), ref_compute_meter_increments(ts))
+
+
+def test_parity_scalar_product():
+    for i in range(20):
+        ts = random_timeseries()
+        assert_equal(scalar_product(ts, 0.12), ref_scalar_product(ts, 0.12))
+
+
+def test_parity_truncate_round():
+    for i in range(20):
+        ts = random_timeseries()
+        for unit in [0.5, 1, 7]:
+            assert_equal(truncate_timeseries(ts, unit), ref_truncate_timeseries(ts, unit))
+            assert_equal(round_timeseries(ts, unit), ref_round_timeseries(ts, unit))
+
+    ts = [[(1388530800, 2.5), (1388531100, -2.5), (1388531400, 0.49999999999999994)]]
+    assert_equal(round_timeseries(ts), ref_round_timeseries(ts))
+
+
+def test_parity_value_to_increments():
+    for i in range(20):
+        ts = random_timeseries(kind = 'meter')
+        for monotony in ['increasing', 'decreasing', 'non_monotonous']:
+            real_output = value_to_increments(ts, monotony = monotony, reset_value = 2.)
+            expected_output = ref_value_to_increments(ts, monotony = monotony, reset_value = 2.)
+            assert_ts_almost_equal(real_output, expected_output)
+
+    # Booleans are subtracted as integers
+    ts = [[(1, True), (2, False), (3, True), (4, True)]]
+    for monotony in ['increasing', 'decreasing', 'non_monotonous']:
+        assert_equal(value_to_increments(ts, monotony = monotony),
+            ref_value_to_increments(ts, monotony = monotony))
+
+
+def test_parity_clean_duplicated():
+    for i in range(20):
+        for kind in ['state', 'mixed']:
+            ts = random_timeseries(kind = kind)
+            assert_equal(clean_duplicated(ts), ref_clean_duplicated(ts))
+
+
+def test_parity_compact_columns():
+    # compact_columns receives the columns from newer to older
+    for i in range(20):
+        for kind in ['state', 'mixed']:
+            for ts in random_timeseries(kind = kind):
+                real_output = list(compact_columns(reversed(ts)))[::-1]
+                assert_equal(real_output, ref_clean_duplicated([ts])[0])
+
+
+def test_parity_delete_critical_values():
+    for i in range(20):
+        for kind in ['state', 'mixed']:
+            ts = random_timeseries(kind = kind)
+            for critical_value in [0, 1, 'on', None]:
+                real_output = delete_critical_values(ts, critical_value)
+                expected_output = ref_delete_critical_values(ts, critical_value)
+                assert_equal(real_output, expected_output)
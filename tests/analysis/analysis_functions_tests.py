@@ -67,6 +67,33 @@ def test_tsgb_year():
     ts_2 = timeseries_group_by(TS_1, 'year')
     assert_equal(ts_2, result)
 
+# Test time_series_group_by, grouping by day with points out of the borders
+TS_GB = [[(1391212800, 1), #1/2/2014 1:0:0
+(1391295600, 2), #2/2/2014 0:0:0
+(1391302800, 3), #2/2/2014 2:0:0
+(1391469000, 4)]] #4/2/2014 0:10:0
+
+def test_tsgb_day():
+    result = [[(1391212800, 1), (1391295600, 2)], [(1391295600, 2), (1391302800, 3)],
+        [[1391468400, 4]], [[1391468400, 4], (1391469000, 4)]]
+
+    ts_2 = timeseries_group_by(TS_GB, 'day')
+    assert_equal(ts_2, result)
+
+# Test time_series_group_by, grouping by day in a range wider than the data
+def test_tsgb_day_range():
+    result = [[(1391126400, None)], [(1391212800, 1), (1391295600, 2)],
+        [(1391295600, 2), (1391302800, 3)], [[1391468400, 4]],
+        [[1391468400, 4], (1391469000, 4)], [(1391554800, None)]]
+
+    ts_2 = timeseries_group_by(TS_GB, 'day', [1391126400, 1391554860])
+    assert_equal(ts_2, result)
+
+def test_tsgb_error():
+    expected_output = {'error': json.dumps({'error': 'Invalid time interval given: decade'})}
+
+    assert_equal(timeseries_group_by(TS_GB, 'decade'), expected_output)
+
 
 # --------------------------------------------------------------------
 # count_state_change
@@ -186,3 +213,61 @@ def test_sp_4():
 
     assert_equal(scalar_product(TS_9, 1000), expected_result)
 
+
+# --------------------------------------------------------------------
+# distr_std_timeseries
+def test_dst_1():
+
+    ts = [[(1393628000, 10.), (1393628400, 30.), (1393628800, 10.)]]
+    expected_result = [[(1393628000., 10.), (1393628200., 20.), (1393628400., 2.),
+        (1393628600., 6.)]]
+
+    assert_equal(distr_std_timeseries(ts, 200., reset_value = 2.), expected_result)
+
+def test_dst_2():
+
+    assert_equal(distr_std_timeseries([[(1393628000, 10.)], []]), [[], []])
+
+
+# --------------------------------------------------------------------
+# non_discrete_frecuencies and gaussian_smooth
+
+def test_ndf_1():
+    expected_output = [[0., 0.5, 2], [0.5, 1., 1], [1., 1.5, 0], [1.5, 2., 1]]
+
+    real_output = non_discrete_frecuencies([0, 0.2, 0.5, 1.9999, 2., -1, None], upper_limit = 2, n_ints = 4)
+
+    assert_equal(real_output, expected_output)
+
+def test_ndf_2():
+    # The maximum value is the upper limit, so it is not counted
+    expected_output = [[0., 1.5, 2], [1.5, 3., 1]]
+
+    real_output = non_discrete_frecuencies([0, 1, 2, 3], n_ints = 2)
+
+    assert_equal(real_output, expected_output)
+
+def test_ndf_3():
+    expected_output = {'error': json.dumps({'error': 'values are not numeric'})}
+
+    assert_equal(non_discrete_frecuencies(['on', 'off']), expected_output)
+
+def test_gs_1():
+    frec = [[0., 1., 0], [1., 2., 4], [2., 3., 0]]
+    w = np.exp(-0.5)
+    expected_output = [[0., 1., 4*w/(1 + w + w**4)], [1., 2., 4/(1 + 2*w)], [2., 3., 4*w/(1 + w + w**4)]]
+
+    real_output = gaussian_smooth(frec, p_width = 1)
+
+    assert_equal([elem[:2] for elem in real_output], [elem[:2] for elem in expected_output])
+    assert_true(np.allclose([elem[2] for elem in real_output], [elem[2] for elem in expected_output]))
+
+def test_gs_2():
+    # Far away neighbours are not taken into account
+    y = np.zeros(100)
+    y[0] = 1.
+
+    real_output = gaussian_kernel_smooth(y, p_width = 2)
+
+    assert_true(real_output[8] > 0)
+    assert_equal(real_output[9:].tolist(), [0.]*91)
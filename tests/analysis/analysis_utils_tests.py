@@ -0,0 +1,231 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Tests on analysis_utils.py
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+from nose.tools import *
+import sys
+sys.path.append('../../src')
+import json
+
+from analysis.analysis_utils import *
+import numpy as np
+import pytz
+
+# Epochs every 3 hours and 17 minutes from 1/1/2014 to 1/1/2015, crossing both
+# daylight saving changes
+EPOCHS = [i for i in range(1388530800, 1420066800, 11820)]
+
+
+# --------------------------------------------------------------------
+# time_interval_beginning and time_interval_end
+
+def test_tib_1():
+
+    t_zone = pytz.timezone('Europe/Madrid')
+
+    for time_int in CALENDAR_INTERVALS:
+        for epoch in EPOCHS:
+            expected_output = tz_interval_beginning(time_int, t_zone, 60*int(epoch/60))
+            real_output = time_interval_beginning(time_int, epoch_ref = epoch)
+            assert_equal(real_output, expected_output)
+
+
+def test_tie_1():
+
+    t_zone = pytz.timezone('Europe/Madrid')
+
+    for time_int in CALENDAR_INTERVALS:
+        for epoch in EPOCHS:
+            expected_output = tz_interval_end(time_int, t_zone, 60*int(epoch/60))
+            real_output = time_interval_end(time_int, epoch_ref = epoch)
+            assert_equal(real_output, expected_output)
+
+
+def test_tie_2():
+
+    # 30/3/2014 has only 23 hours in Europe/Madrid
+    assert_equal(time_interval_beginning('day', epoch_ref = 1396180800), 1396134000)
+    assert_equal(time_interval_end('day', epoch_ref = 1396180800), 1396216800)
+
+    # 26/10/2014 has 25 hours
+    assert_equal(time_interval_beginning('day', epoch_ref = 1414339200), 1414274400)
+    assert_equal(time_interval_end('day', epoch_ref = 1414339200), 1414364400)
+
+
+def test_tie_3():
+
+    # Out of the boundary tables the beginning is computed with pytz
+    assert_equal(time_interval_beginning('month', epoch_ref = 946684800 + 86400), 946681200)
+    assert_equal(time_interval_end('month', epoch_ref = 946684800 + 86400), 949359600)
+
+
+def test_tib_errors():
+
+    expected_output = {'error': json.dumps({'error': 'Invalid timezone given'})}
+    assert_equal(time_interval_beginning('day', tz_name = 'Europe/Nowhere'), expected_output)
+
+    expected_output = {'error': json.dumps({'error': 'Invalid time interval given: decade'})}
+    assert_equal(time_interval_end('decade'), expected_output)
+
+
+def test_tib_vectorized():
+
+    for time_int in CALENDAR_INTERVALS + ['hour']:
+        expected_output = [time_interval_beginning(time_int, epoch_ref = e) for e in EPOCHS]
+        real_output = time_interval_beginnings(time_int, EPOCHS)
+        assert_equal(real_output.tolist(), expected_output)
+
+        expected_output = [time_interval_end(time_int, epoch_ref = e) for e in EPOCHS]
+        real_output = time_interval_ends(time_int, EPOCHS)
+        assert_equal(real_output.tolist(), expected_output)
+
+
+def test_interval_boundaries():
+
+    expected_output = [1388530800, 1391209200, 1393628400, 1396303200]
+
+    real_output = interval_boundaries('month', e_from = 1388534400, e_to = 1396303200)
+
+    assert_equal(real_output.tolist(), expected_output)
+
+
+def test_column_range_cache():
+
+    params = {'range': 'today', 'count': 10}
+    COLUMN_RANGES.clear()
+    info = column_range_cache_info()
+
+    # 1/3/2014 1:00, 23:59 and 2/3/2014 0:00, still part of the first day
+    columns = column_range(params, now = 1393632000, int_type = 'closed')
+    assert_equal(columns, {'column_start': ('timeseries', 1393714800),
+        'column_finish': ('timeseries', 1393628400), 'column_count': 10})
+    assert_equal(column_range(params, now = 1393714740, int_type = 'closed'), columns)
+    assert_equal(column_range(params, now = 1393714800, int_type = 'closed'), columns)
+
+    # 2/3/2014 0:01
+    columns = column_range(params, now = 1393714860, int_type = 'closed')
+    assert_equal(columns['column_finish'], ('timeseries', 1393714800))
+
+    new_info = column_range_cache_info()
+    assert_equal((new_info['hits'] - info['hits'], new_info['misses'] - info['misses']), (2, 2))
+
+
+def test_run_length_encoding():
+
+    assert_equal(run_length_encoding(np.array([1, 1, 0, 0, 0, 1])).tolist(), [0, 2, 5])
+    assert_equal(run_length_encoding(np.array(['on'], dtype = object)).tolist(), [0])
+    assert_equal(run_length_encoding(np.array([])).tolist(), [])
+
+
+# --------------------------------------------------------------------
+# accumulators
+
+VALUES = np.random.RandomState(0).rand(1000)*100 + 1e6
+
+def test_acc_1():
+
+    acc = new_accumulator()
+    for i in range(0, 1000, 300):
+        acc = accumulate(acc, VALUES[i:i + 300], range(i, min([i + 300, 1000])))
+
+    assert_equal(accumulator_value(acc, 'count'), 1000)
+    assert_equal(accumulator_value(acc, 'min'), np.min(VALUES))
+    assert_equal(accumulator_value(acc, 'max'), np.max(VALUES))
+    assert_almost_equal(accumulator_value(acc, 'sum'), np.sum(VALUES), places = 4)
+    assert_almost_equal(accumulator_value(acc, 'mean'), np.mean(VALUES), places = 8)
+    assert_almost_equal(accumulator_value(acc, 'std'), np.std(VALUES), places = 8)
+    assert_equal(acc['epoch'], 999)
+
+
+def test_acc_2():
+
+    # Partial accumulators can be merged in any order
+    partials = [accumulate(new_accumulator(), VALUES[i:i + 100]) for i in range(0, 1000, 100)]
+
+    acc_1 = reduce(merge_accumulators, partials)
+    acc_2 = reduce(merge_accumulators, partials[::-1])
+
+    for agg in AGGREGATES:
+        assert_almost_equal(accumulator_value(acc_1, agg), accumulator_value(acc_2, agg), places = 6)
+    assert_almost_equal(accumulator_value(acc_1, 'std'), np.std(VALUES), places = 8)
+
+
+def test_acc_3():
+
+    # Null values are ignored
+    acc = accumulate(new_accumulator(), [1., None, 3., np.nan], [10, 20, 30, 40])
+
+    assert_equal(accumulator_value(acc, 'count'), 2)
+    assert_equal(accumulator_value(acc, 'mean'), 2.)
+    assert_equal(accumulator_value(acc, 'std'), 1.)
+    assert_equal(acc['epoch'], 40)
+
+    acc = new_accumulator()
+    assert_equal(accumulator_value(acc, 'sum'), 0.)
+    assert_equal(accumulator_value(acc, 'mean'), None)
+
+
+def test_acc_errors():
+
+    assert_equal(accumulate(new_accumulator(), ['on', 'off']), {'error': 'Non scalar values found'})
+    assert_equal(accumulator_value(new_accumulator(), 'median'), {'error': 'Unknown aggregate: median'})
+
+
+# --------------------------------------------------------------------
+# align_timeseries
+
+def test_align_timeseries():
+
+    epochs_1 = np.array([900, 300, 600])
+    values_1 = np.array([3., 1., 2.])
+    epochs_2 = np.array([0, 600, 1200])
+    values_2 = np.array([10., 20., 30.])
+
+    epochs, new_1, new_2 = align_timeseries(epochs_1, values_1, epochs_2, values_2)
+    assert_equal((epochs.tolist(), new_1.tolist(), new_2.tolist()), ([600], [2.], [20.]))
+
+    epochs, new_1, new_2 = align_timeseries(epochs_1, values_1, epochs_2, values_2, 'asof')
+    assert_equal((epochs.tolist(), new_1.tolist(), new_2.tolist()),
+        ([300, 600, 900], [1., 2., 3.], [10., 20., 20.]))
+
+    epochs, new_1, new_2 = align_timeseries(epochs_1, values_1, epochs_2, values_2, 'outer', -1)
+    assert_equal((epochs.tolist(), new_1.tolist(), new_2.tolist()),
+        ([0, 300, 600, 900, 1200], [-1., 1., 2., 3., -1.], [10., -1., 20., -1., 30.]))
+
+    assert_equal(align_timeseries(epochs_1, values_1, epochs_2, values_2, 'left'),
+        {'error': 'Unknown alignment: left'})
+
+
+def test_asof_positions():
+
+    epochs_1 = np.array([-100, 0, 250, 500, 1300])
+    epochs_2 = np.array([0, 600, 1200])
+
+    pos, found = asof_positions(epochs_1, epochs_2)
+    assert_equal((pos[found].tolist(), found.tolist()), ([0, 0, 0, 2], [False, True, True, True, True]))
+
+    pos, found = asof_positions(epochs_1, epochs_2, 'forward')
+    assert_equal((pos[found].tolist(), found.tolist()), ([0, 0, 1, 1], [True, True, True, True, False]))
+
+    pos, found = asof_positions(epochs_1, epochs_2, 'nearest')
+    assert_equal((pos[found].tolist(), found.tolist()), ([0, 0, 0, 1, 2], [True]*5))
+
+    pos, found = asof_positions(epochs_1, epochs_2, 'nearest', tolerance = 100)
+    assert_equal((pos[found].tolist(), found.tolist()), ([0, 0, 1, 2], [True, True, False, True, True]))
+
+    pos, found = asof_positions(epochs_1, np.array([], dtype = np.int64), 'nearest')
+    assert_equal(found.tolist(), [False]*5)
+
+    assert_equal(asof_positions(epochs_1, epochs_2, 'closest'), {'error': 'Unknown direction: closest'})
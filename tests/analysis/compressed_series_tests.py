@@ -0,0 +1,93 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Tests on compressed_series.py
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+from nose.tools import *
+import sys
+sys.path.append('../../src')
+import numpy as np
+import pandas as pd
+
+from analysis.compressed_series import *
+import analysis.timeseries_functions as tf
+from timeseries_functions_tests import test_ts_list_equality
+
+
+# --------------------------------------------------------------------
+# CompressedSeries
+def test_cs_1():
+    # Unsorted and irregular epochs, floats with NaN, infinities and -0.
+    epochs = np.array([900, 0, 300, 601, 1200, 2000, 2001, -50])
+    values = np.array([1.5, -0., np.nan, np.inf, 1e300, -3.25, 0., 7.])
+
+    compressed = CompressedSeries(epochs, values, chunk_size = 3)
+    assert_equal(len(compressed), 8)
+
+    order = np.argsort(epochs)
+    e, v = compressed.decode()
+    assert_true(np.array_equal(e, epochs[order]))
+    assert_true(np.array_equal(v.view('<u8'), values[order].view('<u8')))
+
+    # integer values keep their type
+    e, v = CompressedSeries([0, 1, 2], [3, -2**62, 5]).decode()
+    assert_equal(v.dtype, np.int64)
+    assert_equal(list(v), [3, -2**62, 5])
+
+    assert_raises(TypeError, CompressedSeries, [0, 1], ['a', 'b'])
+    assert_raises(ValueError, CompressedSeries, [0, 1], [1., 2.], chunk_size = 0)
+    assert_raises(ValueError, CompressedSeries, [0, 1], [1., 2.], chunk_size = -5)
+
+def test_cs_2():
+    # Ranges of epochs, both ends included
+    epochs = np.arange(0, 3000, 300)
+    compressed = CompressedSeries(epochs, epochs*0.5, chunk_size = 4)
+
+    e, v = compressed.decode(e_from = 600, e_to = 1500)
+    assert_equal(list(e), [600, 900, 1200, 1500])
+    assert_equal(list(v), [300., 450., 600., 750.])
+
+    assert_equal(list(compressed.decode(e_from = 601, e_to = 899)[0]), [])
+    assert_equal(list(compressed.decode(e_from = 2700)[0]), [2700])
+    assert_equal(list(compressed.decode(e_to = 0)[0]), [0])
+    assert_equal(len(CompressedSeries([], []).decode()[0]), 0)
+
+def test_cs_3():
+    # Regular epochs and repeated values take about a bit each
+    epochs = np.arange(100000)*300
+    values = np.repeat(np.arange(100.), 1000)
+
+    compressed = CompressedSeries(epochs, values)
+    assert_true(compressed.nbytes < (epochs.nbytes + values.nbytes)/20)
+    assert_true(np.array_equal(compressed.decode()[1], values))
+
+
+# --------------------------------------------------------------------
+# compress_ts_list
+def test_cs_4():
+    ts_list = [pd.DataFrame({'value': [1., 2., 2.5]}, index = [0, 300, 600]),
+        pd.DataFrame({'value': [1, 2]}, index = [5, 7])]
+
+    compressed = tf.compress_ts_list(ts_list, chunk_size = '2')
+    test_ts_list_equality(tf.decompress_ts_list(compressed), ts_list)
+    test_ts_list_equality(tf.decompress_ts_list(compressed, e_from = 300, e_to = 600),
+        [ts_list[0].iloc[1:], ts_list[1].iloc[:0]])
+
+    assert_equal(tf.compress_ts_list([pd.DataFrame({'value': ['a']}, index = [0])]),
+        {'error': 'Only numeric timeseries can be compressed'})
+    assert_equal(tf.compress_ts_list(ts_list, chunk_size = 'a'),
+        {'error': 'chunk_size must be an integer'})
+    for chunk_size in [0, -5, '-1']:
+        assert_equal(tf.compress_ts_list(ts_list, chunk_size = chunk_size),
+            {'error': 'chunk_size must be positive'})
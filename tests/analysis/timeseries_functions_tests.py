@@ -122,6 +122,242 @@ def test_cttl():
 
     test_ts_list_equality(ts_2, result)
 
+# --------------------------------------------------------------------
+# query_spec
+def test_qs_1():
+
+    spec = query_spec({'range': 'today', 'count': '3'}, time_int = '900')
+
+    assert_equal((spec.time_int, spec.count, spec.params['count']), (900, 3, 2700))
+    assert_true(query_spec({'count': '3', 'range': 'today'}, time_int = '900') is spec)
+    assert_equal(spec.time_ref(1393632500), 1393632000)
+
+    column_range = spec.column_range(1393632000)
+    assert_equal(column_range, {'column_start': ('timeseries', 1393714800),
+        'column_finish': ('timeseries', 1393628401), 'column_count': 2700})
+
+    # The column range is computed once and a copy is returned
+    column_range['column_count'] = 0
+    assert_equal(spec.ranges.keys(), [1393632000])
+    assert_equal(spec.column_range(1393632000)['column_count'], 2700)
+
+    assert_equal(spec.data_range(column_range), (1393628401, 1393714800, 3))
+
+
+def test_qs_2():
+
+    assert_equal(query_spec({}, time_int = 'a'), {'error': 'parameters do not have required format'})
+    assert_equal(query_spec({'count': 'a'}), {'error': 'count argument is not an integer: a'})
+    assert_equal(query_spec({}).time_ref('a'), {'error': 'time reference received is not an epoch'})
+
+
+def test_qs_3():
+    # Column ranges reading only the tail of the values
+    column_range = {'column_start': ('timeseries', 1393632000),
+        'column_finish': ('timeseries', 1393545601), 'column_count': 8100}
+
+    spec = query_spec({'range': 'last_day', 'count': 3}, time_int = 2700, distr = False)
+    assert_equal(spec.tail_range(column_range), (dict(column_range, column_count = 3), False))
+    assert_equal(spec.tail_range(column_range, compact = True), None)
+
+    # distributed: the last 3 intervals end at 1393632000
+    spec = query_spec({'range': 'last_day', 'count': 3}, time_int = 2700)
+    assert_equal(spec.tail_range(column_range), (dict(column_range,
+        column_finish = ('timeseries', 1393626600)), True))
+    assert_equal(spec.tail_range(column_range, fill_value = 0)[1], False)
+    assert_equal(spec.tail_range(column_range, agg = 'sum'), (dict(column_range,
+        column_finish = ('timeseries', 1393623901)), False))
+    assert_equal(spec.tail_range(column_range, agg = 'time_mean'), None)
+
+    # nothing to narrow
+    assert_equal(query_spec({'range': 'last_day', 'count': 40}, time_int = 2700).
+        tail_range(column_range), None)
+    assert_equal(query_spec({'range': 'last_day'}).tail_range(column_range), None)
+
+
+# --------------------------------------------------------------------
+# get_aggregate
+STORED = [(1393545600 + 97*i, float((i*7919) % 1000)/8) for i in range(2000)]
+
+def stored_columns(columns, stored = STORED):
+
+    # cassandra columns from newer to older, in the range of columns
+    start = columns.get('column_start', ('timeseries', np.inf))[1]
+    finish = columns.get('column_finish', ('timeseries', -np.inf))[1]
+    data = [elem for elem in reversed(stored) if finish <= elem[0] <= start]
+
+    return data[:int(columns.get('column_count', 100))]
+
+
+def test_ga_1():
+    # Same values as get_variable without distribution
+    get_data, get_chunks = af.get_variable_data, af.get_variable_data_chunks
+    af.get_variable_data = lambda id_variable, columns, compact = False: \
+        [stored_columns(columns)[::-1]]
+    af.get_variable_data_chunks = lambda id_variable, columns, chunk_size = 100000: \
+        [stored_columns(columns)[i:i + chunk_size] for i in
+            range(0, len(stored_columns(columns)), chunk_size)]
+
+    try:
+        for kwargs in [{'range': 'last_day'}, {'range': 'last_day', 'count': 7},
+                {'from': 1393600000, 'count': '30'}, {'range': 'last_hour'}]:
+            for (agg, func) in [('sum', inner_sum), ('max', inner_max), ('min', inner_min),
+                    ('mean', inner_mean), ('std', inner_std)]:
+                expected_output = func(get_variable(1, now = 1393739999, distr = False,
+                    time_int = 900, **kwargs))
+                real_output = get_aggregate(1, agg = agg, now = 1393739999, time_int = 900,
+                    chunk_size = 50, **kwargs)
+
+                assert_equal(list(real_output[0].index), list(expected_output[0].index))
+                assert_almost_equal(real_output[0]['value'].iloc[0],
+                    expected_output[0]['value'].iloc[0])
+    finally:
+        af.get_variable_data, af.get_variable_data_chunks = get_data, get_chunks
+
+
+# --------------------------------------------------------------------
+# get_variable
+def test_gv_1():
+    # An all null tail has the type of the values of the whole range
+    stored = [(1393732800 + 300*i, [1.5, 2., None, None][i]) for i in range(4)]
+    get_data = af.get_variable_data
+    af.get_variable_data = lambda id_variable, columns, compact = False: \
+        [stored_columns(columns, stored)[::-1]]
+
+    try:
+        real_output = get_variable(1, now = 1393739999, distr = False, count = 2)
+        expected_output = [pd.DataFrame({'value': [np.nan, np.nan]},
+            index = [1393733400, 1393733700])]
+        test_ts_list_equality(real_output, expected_output)
+        assert_equal(type(scalar_sum(real_output, number = 1)), list)
+
+        real_output = get_variable(1, now = 1393739999, distr = False, count = 3)
+        expected_output = [pd.DataFrame({'value': [2., np.nan, np.nan]},
+            index = [1393733100, 1393733400, 1393733700])]
+        test_ts_list_equality(real_output, expected_output)
+    finally:
+        af.get_variable_data = get_data
+
+
+# --------------------------------------------------------------------
+# shared_grid
+DATA_GRID = [[(1393628400, 1), (1393629000, 3)], [], [(1393628700, 'on'), (1393629300, 'off')]]
+
+def test_grid_1():
+    epochs, values = shared_grid(DATA_GRID[:2], seconds = 300, e_from = 1393628100)
+
+    assert_equal(epochs.tolist(), [1393628100, 1393628400, 1393628700, 1393629000])
+    assert_equal(values.dtype, np.float64)
+    assert_equal(values[:, 0].tolist(), [1., 1., 1., 3.])
+    assert_true(np.isnan(values[:, 1]).all())
+
+    # Values that are not numeric make the whole block of objects
+    epochs, values = shared_grid(DATA_GRID, seconds = 300)
+
+    assert_equal(epochs.tolist(), [1393628400, 1393628700, 1393629000, 1393629300])
+    assert_equal(values[:, 2].tolist(), ['on', 'on', 'on', 'off'])
+
+def test_grid_2():
+    # Without distributing, the epochs are the union of epochs
+    epochs, values = shared_grid(DATA_GRID[:2] + [[(1393628700, 2.5)]], distr = False,
+        fill_value = 0)
+
+    assert_equal(epochs.tolist(), [1393628400, 1393628700, 1393629000])
+    assert_equal(values.tolist(), [[1., 0., 0.], [0., 0., 2.5], [3., 0., 0.]])
+
+    assert_equal(shared_grid(DATA_GRID, agg = 'first'), {'error': 'Unknown aggregation mode: first'})
+
+def test_grid_3():
+    values = np.array([[1., 2.], [3., 4.]], order = 'F')
+    ts_list = block_to_ts_list(np.array([0, 300]), values)
+
+    assert_equal(len(ts_list), 2)
+    assert_true(ts_list[0].index is ts_list[1].index)
+    assert_equal(ts_list[1]['value'].tolist(), [2., 4.])
+
+    # the values are not copied
+    values[0, 1] = 5.
+    assert_equal(ts_list[1]['value'].iloc[0], 5.)
+
+    assert_equal(get_variables('a, 2'), {'error': "ids of the variables are not integers: ['a', ' 2']"})
+
+
+# --------------------------------------------------------------------
+# TsBlock
+TS_BLOCK_1 = [pd.DataFrame({'value': [1., 2., 3.]}, index = [0, 300, 600]),
+    pd.DataFrame({'value': [4., 0., 6.]}, index = [0, 300, 600])]
+TS_BLOCK_2 = [pd.DataFrame({'value': [2., 2., 2.]}, index = [0, 300, 600]),
+    pd.DataFrame({'value': [1., 0., np.nan]}, index = [0, 300, 600])]
+
+@nottest
+def assert_ts_list_equal(ts_list_1, ts_list_2):
+    assert_equal(len(ts_list_1), len(ts_list_2))
+    for (ts_1, ts_2) in zip(ts_list_1, ts_list_2):
+        assert_equal(ts_1.index.tolist(), ts_2.index.tolist())
+        assert_equal(ts_1['value'].tolist(), ts_2['value'].tolist())
+
+def test_block_1():
+    ts_block = columnar(TS_BLOCK_1)
+
+    assert_equal(type(ts_block), TsBlock)
+    assert_equal(ts_block.values.tolist(), [[1., 4.], [2., 0.], [3., 6.]])
+    assert_equal(len(ts_block), 2)
+    assert_ts_list_equal(ts_block, TS_BLOCK_1)
+    assert_true(is_block(ts_block))
+
+    # Replacing one of the timeseries turns it into a plain list
+    ts_block[0] = TS_BLOCK_2[0]
+    assert_false(is_block(ts_block))
+
+    # Timeseries with different epochs or not float values are left as they are
+    ts_list = [TS_BLOCK_1[0], TS_BLOCK_1[1].iloc[:2]]
+    assert_true(columnar(ts_list) is ts_list)
+    ts_list = [pd.DataFrame({'value': [1, 2]}, index = [0, 300])]*2
+    assert_true(columnar(ts_list) is ts_list)
+
+def test_block_2():
+    ts_block_1 = columnar(TS_BLOCK_1)
+    ts_block_2 = columnar(TS_BLOCK_2)
+
+    # All the values are kept
+    result = product(ts_block_1, ts_block_1)
+    assert_equal(type(result), TsBlock)
+    assert_ts_list_equal(result, product(TS_BLOCK_1, TS_BLOCK_1))
+
+    result = scalar_sum(scalar_product(ts_block_1, number = 2), number = 1)
+    assert_equal(type(result), TsBlock)
+    assert_equal(result.values.tolist(), [[3., 9.], [5., 1.], [7., 13.]])
+
+    # The values dropped make it a list again
+    result = division(ts_block_1, ts_block_2)
+    assert_equal(type(result), list)
+    assert_ts_list_equal(result, division(TS_BLOCK_1, TS_BLOCK_2))
+    assert_ts_list_equal(scalar_division(ts_block_2, number = 0), scalar_division(TS_BLOCK_2, number = 0))
+
+    operations = [('scalar_division', '0'), ('scalar_sum', '1')]
+    assert_equal(scalar_chain(ts_block_1, operations = operations), {'error': 'Non scalar values found'})
+    assert_equal(scalar_chain(TS_BLOCK_1, operations = operations), {'error': 'Non scalar values found'})
+
+def test_block_3():
+    ts_block_1 = columnar(TS_BLOCK_1)
+    ts_block_2 = columnar(TS_BLOCK_2)
+
+    result = addition(ts_block_1, ts_block_1, ts_block_1, align = 'outer')
+    assert_equal(type(result), TsBlock)
+    assert_equal(result.values.tolist(), [[3., 12.], [6., 0.], [9., 18.]])
+
+    assert_ts_list_equal(addition(ts_block_1, ts_block_2), addition(TS_BLOCK_1, TS_BLOCK_2))
+
+    # The aggregates of all the timeseries are placed at the same epoch
+    assert_equal(inner_sum(ts_block_1), {'error': 'Non unique index'})
+    assert_equal(inner_sum(columnar(TS_BLOCK_1[:1]))[0]['value'].tolist(), [6.])
+
+    # The aggregate of a single timeserie block is the one of the list
+    ts_block = columnar(TS_BLOCK_1[1:])
+    for func in [inner_sum, inner_max, inner_min, inner_mean, inner_std]:
+        assert_ts_list_equal(func(ts_block), func(list(TS_BLOCK_1[1:])))
+
+
 # --------------------------------------------------------------------
 # distribute_ts_list
 def test_dttsl_1():
@@ -173,6 +409,241 @@ def test_dttsl_4():
 
     test_ts_list_equality(real_output, expected_output)
 
+def test_dttsl_5():
+
+    # Integer values are backfilled as floats, as in a reindex
+    argument = [pd.DataFrame([1, 2, 3], columns = ['value'],
+        index = [1393628150, 1393628250, 1393628500])]
+    expected_output = [pd.DataFrame([2, 2, 2, 3], columns = ['value'], dtype = 'float64',
+        index = [1393627800 + 300* i for i in range(4)])]
+
+    real_output = distribute_ts_list(argument, e_from = 1393627700, e_to = 1393628700)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_dttsl_6():
+
+    # Null values received are filled backwards
+    argument = [pd.DataFrame([u'on', None, u'off'], columns = ['value'],
+        index = [1393628100, 1393628400, 1393628700])]
+    expected_output = [pd.DataFrame([u'on', u'off', u'off'], columns = ['value'],
+        index = [1393628100 + 300* i for i in range(3)])]
+
+    real_output = distribute_ts_list(argument)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_dttsl_7():
+
+    argument = [pd.DataFrame([5., 6.], columns = ['value'], index = [1393628450, 1393628500])]
+    expected_output = [pd.DataFrame([0., 6., 0., 0.], columns = ['value'],
+        index = [1393628400 + 100* i for i in range(4)])]
+
+    real_output = distribute_ts_list(argument, seconds = 100, e_from = 1393628400,
+        e_to = 1393628700, fill_value = 0.)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+TS_AGG = [pd.DataFrame([1, 3, 5, 2, 4], columns = ['value'],
+    index = [1393628100, 1393628250, 1393628400, 1393628500, 1393628900])]
+
+
+def test_dttsl_agg_1():
+
+    index = [1393628100 + 300*i for i in range(4)]
+    expected_outputs = {
+        'mean': [1., 4., 2., 4.],
+        'sum': [1., 8., 2., 4.],
+        'count': [1., 2., 1., 1.],
+        'min': [1., 3., 2., 4.],
+        'max': [1., 5., 2., 4.],
+        'time_mean': [1., 2., 3., 8./3]}
+
+    for agg in expected_outputs:
+        expected_output = [pd.DataFrame(expected_outputs[agg], columns = ['value'], index = index)]
+
+        real_output = distribute_ts_list(TS_AGG, agg = agg)
+
+        test_ts_list_equality(real_output, expected_output)
+
+
+def test_dttsl_agg_2():
+
+    # Intervals without data
+    index = [1393628100 + 300*i for i in range(6)]
+    expected_outputs = {
+        'mean': [1., 4., 2., 4., np.nan, np.nan],
+        'sum': [1., 8., 2., 4., 0., 0.],
+        'time_mean': [1., 2., 3., 8./3, 4., 4.]}
+
+    for agg in expected_outputs:
+        expected_output = [pd.DataFrame(expected_outputs[agg], columns = ['value'], index = index)]
+
+        real_output = distribute_ts_list(TS_AGG, agg = agg, e_to = 1393629600)
+
+        test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([1., 5., 2., 4., -1., -1.], columns = ['value'], index = index)]
+
+    real_output = distribute_ts_list(TS_AGG, agg = 'max', e_to = 1393629600, fill_value = -1)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_dttsl_agg_3():
+
+    expected_output = {'error': 'Unknown aggregation mode: median'}
+
+    real_output = distribute_ts_list(TS_AGG, agg = 'median')
+
+    assert_equal(real_output, expected_output)
+
+
+# --------------------------------------------------------------------
+# interpolate
+def test_interp_1():
+
+    argument = [pd.DataFrame([10., 40., 50.], columns = ['value'],
+        index = [1393628100, 1393628700, 1393629300])]
+    expected_output = [pd.DataFrame([10., 25., 40., 45.], columns = ['value'],
+        index = [1393628100 + 300*i for i in range(4)])]
+
+    real_output = interpolate(argument, seconds = 300)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_interp_2():
+
+    # Meter reseted between the second and the third values. As in
+    # distr_std_timeseries, the second epoch is the start of the reset interval
+    argument = [pd.DataFrame([10., 40., 20.], columns = ['value'],
+        index = [1393628100, 1393628700, 1393629300])]
+    expected_output = [pd.DataFrame([10., 25., -4., 8.], columns = ['value'],
+        index = [1393628100 + 300*i for i in range(4)])]
+
+    real_output = interpolate(argument, seconds = 300, reset_value = -4)
+
+    test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([10., 25., 40., 30.], columns = ['value'],
+        index = [1393628100 + 300*i for i in range(4)])]
+
+    real_output = interpolate(argument, seconds = 300, monotony = 'non_monotonous')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+# --------------------------------------------------------------------
+# frecuencies and gaussian_smooth
+def test_frec_1():
+
+    argument = [pd.DataFrame([0.5, 1., 1.5, 2.9, 3., 7., None], columns = ['value'],
+        index = [1393628100 + 300*i for i in range(7)])]
+    expected_output = [pd.DataFrame([2, 1, 0, 1], columns = ['value'], index = range(4))]
+
+    # The upper limit is not included in the last interval
+    real_output = frecuencies(argument, lower_limit = '0.5', upper_limit = '3', n_ints = '4')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_frec_2():
+
+    argument = [pd.DataFrame([0.5, 1.], columns = ['value'], index = [1393628100, 1393628400])]
+    expected_output = {'error': json.dumps({'error': 'upper_limit lower than lower_limit'})}
+
+    real_output = frecuencies(argument, lower_limit = 2)
+
+    assert_equal(real_output, expected_output)
+
+
+def test_gsmooth_1():
+
+    argument = [pd.DataFrame([0., 4., 0.], columns = ['value'], index = range(3))]
+    w = np.exp(-0.5)
+    expected_output = [pd.DataFrame([4*w/(1 + w + w**4), 4/(1 + 2*w), 4*w/(1 + w + w**4)],
+        columns = ['value'], index = range(3))]
+
+    real_output = gaussian_smooth(argument, p_width = '1')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_gsmooth_2():
+
+    argument = [pd.DataFrame([0., 4., 0.], columns = ['value'], index = range(3))]
+    expected_output = {'error': 'p_width must be positive'}
+
+    real_output = gaussian_smooth(argument, p_width = 0)
+
+    assert_equal(real_output, expected_output)
+
+
+# --------------------------------------------------------------------
+# state analytics
+TS_STATE = [pd.DataFrame(['off', 'on', 'on', 'off', 'on', 'off'], columns = ['value'],
+    index = [1393628400 + i for i in [0, 600, 1200, 3000, 3300, 4200]])]
+
+def test_state_1():
+
+    real_output = state_changes(TS_STATE, state_value = 'on')
+    test_ts_list_equality(real_output, [pd.DataFrame([2], columns = ['value'], index = [1393628400])])
+
+    real_output = state_duration(TS_STATE, state_value = 'on')
+    test_ts_list_equality(real_output, [pd.DataFrame([3300], columns = ['value'], index = [1393628400])])
+
+    real_output = longest_state_run(TS_STATE, state_value = 'on')
+    test_ts_list_equality(real_output, [pd.DataFrame([2400], columns = ['value'], index = [1393628400])])
+
+
+def test_state_2():
+
+    # The last run in state is cut at the beginning of the second hour
+    index = [1393628400, 1393632000]
+
+    real_output = state_changes(TS_STATE, state_value = 'on', period = 'hour')
+    test_ts_list_equality(real_output, [pd.DataFrame([2, 0], columns = ['value'], index = index)])
+
+    real_output = state_duration(TS_STATE, state_value = 'on', period = 'hour')
+    test_ts_list_equality(real_output, [pd.DataFrame([2700, 600], columns = ['value'], index = index)])
+
+    real_output = longest_state_run(TS_STATE, state_value = 'on', period = 'hour')
+    test_ts_list_equality(real_output, [pd.DataFrame([2400, 600], columns = ['value'], index = index)])
+
+
+def test_state_3():
+
+    argument = [pd.DataFrame([1, 0, 1], columns = ['value'], index = [1393628400, 1393632000, 1393635600]),
+        pd.DataFrame([], columns = ['value'], index = np.array([], dtype = np.int64))]
+
+    # The values are compared as strings, as in count_state_change
+    real_output = state_duration(argument, state_value = '0', period = 'day')
+    assert_equal(real_output[0]['value'].tolist(), [3600])
+    assert_equal(len(real_output[1]), 0)
+
+    assert_equal(state_changes(argument, period = 'decade'), {'error': 'Invalid period given: decade'})
+
+
+# --------------------------------------------------------------------
+# clean_duplicated
+def test_clean_1():
+
+    argument = [pd.DataFrame([1., 1., 2., np.nan, np.nan, 2., 2.], columns = ['value'],
+        index = [300*i for i in [0, 1, 2, 3, 4, 6, 5]]),
+        pd.DataFrame(['on', 'on', 'off', 'on'], columns = ['value'], index = [0, 300, 600, 900])]
+    expected_output = [pd.DataFrame([1., 2., np.nan, np.nan, 2.], columns = ['value'],
+        index = [0, 600, 900, 1200, 1500]),
+        pd.DataFrame(['on', 'off', 'on'], columns = ['value'], index = [0, 600, 900])]
+
+    real_output = clean_duplicated(argument)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
 # --------------------------------------------------------------------
 # increments
 def test_inc_1():
@@ -511,6 +982,51 @@ def test_scpow_3():
     test_ts_list_equality(real_output, expected_output)
 
 
+# --------------------------------------------------------------------
+# scalar_chain
+def test_sch_1():
+
+    argument = [pd.DataFrame([1, 2, 0, 4], columns = ['value'], dtype = 'float64',
+        index = [1393628100, 1393628400, 1393628900, 1393629500]),
+        pd.DataFrame([1000, 3], columns = ['value'], index = [10, 20])]
+    operations = [('scalar_division', '1000'), ('scalar_product', 0.12),
+        ('scalar_sum', '5'), ('scalar_power', '-1')]
+
+    expected_output = argument
+    for (name, number) in operations:
+        expected_output = globals()[name](expected_output, number = number)
+
+    real_output = scalar_chain(argument, operations = operations)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_sch_2():
+
+    # Infinite values are deleted even if the next function makes them finite
+    argument = [pd.DataFrame([1, 10, 0], columns = ['value'], dtype = 'float64', index = [0, 1, 2])]
+    expected_output = [pd.DataFrame([1., 1.], columns = ['value'], index = [0, 2])]
+
+    real_output = scalar_chain(argument, operations = [('scalar_product', 1e308),
+        ('scalar_power', 0)])
+
+    test_ts_list_equality(real_output, scalar_power(scalar_product(argument, number = 1e308), number = 0))
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_sch_3():
+
+    argument = [pd.DataFrame([1, 10, 0], columns = ['value'], dtype = 'float64', index = [0, 1, 2])]
+
+    real_output = scalar_chain(argument, operations = [('scalar_product', 2), ('scalar_log', 0)])
+
+    assert_equal(real_output, {'error': 'Unknown scalar function: scalar_log'})
+
+    real_output = scalar_chain(argument, operations = [('scalar_product', 2), ('scalar_sum', 'a')])
+
+    assert_equal(real_output, {'error': 'number is not numeric'})
+
+
 # ---------------------------------- Aggregate functions ----------------------------------------
 # --------------------------------------------------------------------
 # inner_sum
@@ -789,6 +1305,19 @@ def test_last_3():
     test_ts_list_equality(real_output, expected_output)
 
 
+def test_last_4():
+    # The last values of a float timeserie are views of it
+    argument = [pd.DataFrame({'value': np.arange(10.)}, index = range(0, 3000, 300))]
+
+    real_output = last(argument, number = 3)
+
+    test_ts_list_equality(real_output, [argument[0].iloc[-3:]])
+    assert_true(np.shares_memory(real_output[0]['value'].values, argument[0]['value'].values))
+
+    argument = [pd.DataFrame({'value': [1., 2.]}, index = [0, 0])]
+    assert_equal(last(argument, number = 2), {'error': 'Non unique index'})
+
+
 # --------------------------------------------------------------------
 # addition
 def test_add_1():
@@ -874,6 +1403,36 @@ def test_add_5():
     test_ts_list_equality(real_output, expected_output)
 
 
+def test_add_6():
+
+    # Several timeseries lists are summed at once, with the timeseries
+    # of length 1 treated as scalars
+    argument = [[pd.DataFrame([1., 2., 3., 4.], columns = ['value'], index = [900, 0, 600, 300])],
+        [pd.DataFrame([100.], columns = ['value'], index = [5])],
+        [pd.DataFrame([10., 20., np.nan], columns = ['value'], index = [300, 600, 900])],
+        [pd.DataFrame([1000., 2000., 3000.], columns = ['value'], index = [900, 600, 300])]]
+    expected_output = [pd.DataFrame([3114., 2123.], columns = ['value'], index = [300, 600])]
+
+    real_output = addition(*argument)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_add_7():
+
+    # A running sum with a single value is a scalar for the next timeserie,
+    # as in the pairwise sum
+    argument = [[pd.DataFrame([1., 2.], columns = ['value'], index = [0, 300])],
+        [pd.DataFrame([10., 20.], columns = ['value'], index = [300, 600])],
+        [pd.DataFrame([100., 200.], columns = ['value'], index = [600, 900])]]
+    expected_output = [pd.DataFrame([112., 212.], columns = ['value'], index = [600, 900])]
+
+    real_output = addition(*argument)
+
+    test_ts_list_equality(real_output, expected_output)
+    assert_equal(ts_n_addition([ts[0] for ts in argument]), None)
+
+
 
 # --------------------------------------------------------------------
 # scalar_product
@@ -1175,6 +1734,114 @@ def test_div_5():
     test_ts_list_equality(real_output, expected_output)
 
 
+
+# --------------------------------------------------------------------
+# alignment of pair operations
+TS_ALIGN = [[pd.DataFrame([1., 2., 3.], columns = ['value'], index = [300, 600, 900])],
+    [pd.DataFrame([10., 20., 30.], columns = ['value'], index = [0, 600, 1200])]]
+
+def test_align_1():
+
+    expected_output = [pd.DataFrame([22.], columns = ['value'], index = [600])]
+
+    real_output = addition(*TS_ALIGN)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_align_2():
+
+    expected_output = [pd.DataFrame([-10., 1., -18., 3., -30.], columns = ['value'],
+        index = [0, 300, 600, 900, 1200])]
+
+    real_output = subtraction(*TS_ALIGN, align = 'outer')
+
+    test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([-9., 0., -18., 2., -29.], columns = ['value'],
+        index = [0, 300, 600, 900, 1200])]
+
+    real_output = subtraction(*TS_ALIGN, align = 'outer', fill_value = '1')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_align_3():
+
+    # Each epoch of the first timeserie takes the last value of the second one
+    expected_output = [pd.DataFrame([10., 40., 60.], columns = ['value'], index = [300, 600, 900])]
+
+    real_output = product(*TS_ALIGN, align = 'asof')
+
+    test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([22., 33.], columns = ['value'], index = [600, 1200])]
+
+    real_output = addition(TS_ALIGN[1], TS_ALIGN[0], align = 'asof')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_align_4():
+
+    expected_output = {'error': 'Unknown alignment: left'}
+
+    assert_equal(division(*TS_ALIGN, align = 'left'), expected_output)
+
+    expected_output = {'error': 'unknown argument test'}
+
+    assert_equal(addition(TS_ALIGN[0], TS_ALIGN[1], test = 1), expected_output)
+
+
+TS_ASOF = [[pd.DataFrame(['on', 'off', 'on'], columns = ['value'], index = [0, 300, 1100])],
+    [pd.DataFrame([1., 2., 3., 4.], columns = ['value'], index = [950, 100, 1290, 400])]]
+
+def test_asof_1():
+
+    expected_output = [pd.DataFrame(['on', 'off', 'off', 'on'], columns = ['value'],
+        index = [100, 400, 950, 1290])]
+
+    real_output = asof_join(TS_ASOF[1], TS_ASOF[0])
+
+    test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([2., 4., 1.], columns = ['value'], index = [0, 300, 1100])]
+
+    real_output = asof_join(TS_ASOF[0], TS_ASOF[1], direction = 'nearest', tolerance = '150')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_asof_2():
+
+    expected_output = [pd.DataFrame([9., 18.], columns = ['value'], index = [0, 600])]
+
+    real_output = subtraction(TS_ALIGN[1], TS_ALIGN[0], align = 'asof',
+        direction = 'forward', tolerance = 300)
+
+    test_ts_list_equality(real_output, expected_output)
+
+    expected_output = [pd.DataFrame([11., 22., 33.], columns = ['value'], index = [0, 600, 1200])]
+
+    real_output = addition(TS_ALIGN[1], TS_ALIGN[0], align = 'asof', direction = 'nearest')
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_asof_3():
+
+    assert_equal(asof_join(TS_ASOF[0], TS_ASOF[1], direction = 'closest'),
+        {'error': 'Unknown direction: closest'})
+
+    assert_equal(asof_join(TS_ASOF[0], TS_ASOF[1], tolerance = -1),
+        {'error': 'tolerance must be positive'})
+
+    assert_equal(product(TS_ALIGN[0], TS_ALIGN[1], align = 'asof', tolerance = 'a'),
+        {'error': 'tolerance is not numeric'})
+
+    assert_equal(asof_join(TS_ASOF[0], TS_ASOF[0] + TS_ASOF[1]),
+        {'error': 'As-of join - Timeseries list must have same dimension'})
+
 # -----------------------------------------------------------------------------
 # Timeseries splitting
 
@@ -1289,6 +1956,36 @@ def test_split_5():
     test_ts_list_equality(real_output, expected_output)
 
 
+def test_split_6():
+
+    # Range crossing the daylight saving changes of 2014
+    index = [i for i in range(1395532800, 1414972800, 1800)]
+    argument = [pd.DataFrame([i for i in range(len(index))], columns = ['value'],
+        index = index)]
+
+    for period in ['hour', 'day', 'week', 'month']:
+
+        groups = {}
+        for j, i in enumerate(index):
+            k = au.time_interval_beginning(period, epoch_ref = i)
+            groups.setdefault(k, []).append(j)
+        expected_output = [argument[0].iloc[groups[k]] for k in sorted(groups)]
+
+        real_output = split(argument, period = period)
+
+        test_ts_list_equality(real_output, expected_output)
+
+
+def test_split_7():
+
+    argument = [pd.DataFrame([0, 1, 2], columns = ['value'],
+        index = [1393624800, 1393628400, 1393632000])]
+
+    split(argument, period = 'month')
+
+    assert_equal(list(argument[0].columns), ['value'])
+
+
 # ---------------------------------------------------------------------------------------------
 # timeseries list generation
 def tsl_gen_test_1():
@@ -1357,3 +2054,83 @@ def tstl_test_2():
     assert_equal(real_output, expected_output)
 
 
+# ----------------------------------------------------------------------------------------------
+# ts_list to json
+def test_tstj_1():
+
+    argument = [pd.DataFrame({'value': [1.5, -0., np.nan, 1.5, 1.5, 1.5]},
+            index = [0, 300, 600, 900, 1200, 1500]),
+        pd.DataFrame({'value': [1, 2]}, index = [0, 300]),
+        pd.DataFrame({'value': [u'on', None, u'o, "f"']}, index = [0, 300, 600]),
+        pd.DataFrame({'value': []}, index = np.array([], dtype = np.int64))]
+
+    expected_output = json.dumps(ts_list_to_list(argument))
+
+    for chunk_size in [1, 4, 10000]:
+        assert_equal(ts_list_to_json(argument, chunk_size = chunk_size), expected_output)
+
+    assert_equal(ts_list_to_json([]), '[]')
+
+def test_tstj_2():
+
+    # Repeated values are encoded once
+    values = [0.1*(i/10) for i in range(1000)]
+    argument = [pd.DataFrame({'value': values}, index = range(0, 300000, 300))]
+
+    pieces = list(iter_ts_list_json(argument, chunk_size = 100))
+
+    assert_equal(len(pieces), 23)
+    assert_equal(''.join(pieces), json.dumps(ts_list_to_list(argument)))
+
+
+def test_tstj_3():
+
+    argument = [pd.DataFrame({'value': [1., 2., 3.]}, index = [0, 300, 600])]
+
+    assert_equal(ts_list_to_json(argument, chunk_size = '2'), json.dumps(ts_list_to_list(argument)))
+
+    for chunk_size in [0, -1]:
+        assert_equal(ts_list_to_json(argument, chunk_size = chunk_size),
+            {'error': 'chunk_size must be positive'})
+        assert_equal(iter_ts_list_json(argument, chunk_size = chunk_size),
+            {'error': 'chunk_size must be positive'})
+    assert_equal(ts_list_to_json(argument, chunk_size = 'a'),
+        {'error': 'chunk_size must be an integer'})
+
+
+# ----------------------------------------------------------------------------------------------
+# ts_list to bytes
+TS_BYTES = [pd.DataFrame({'value': [1.5, np.nan, -2.]}, index = [1393628400, 1393628700, 1393629000]),
+    pd.DataFrame({'value': [1, 0, 1]}, index = [0, 100, 90000]),
+    pd.DataFrame({'value': [u'on', None, 2]}, index = [5, 3, 2**40]),
+    pd.DataFrame({'value': [True]}, index = [7]),
+    pd.DataFrame({'value': []}, index = np.array([], dtype = np.int64))]
+
+def test_tstb_1():
+
+    data = ts_list_to_bytes(TS_BYTES)
+
+    # header, and the regular epochs of the first timeserie are a first epoch and a step
+    assert_equal(data[:8], BINARY_MAGIC + '\x05\x00\x00\x00')
+    assert_equal(data[8:16], '\x03\x00\x00\x00\x01f\x00\x00')
+
+    real_output = generate_ts_list(data)
+
+    assert_equal(len(real_output), len(TS_BYTES))
+    for (ts, expected_ts) in zip(real_output, TS_BYTES):
+        assert_frame_equal(ts, expected_ts)
+
+def test_tstb_2():
+
+    # The values are decoded without copying them
+    data = bytearray(ts_list_to_bytes(TS_BYTES[:1]))
+    ts = bytes_to_ts_list(data)[0]
+    data[-8:] = np.array([4.], dtype = '<f8').tostring()
+
+    assert_equal(ts['value'].tolist()[2], 4.)
+
+    error = {'error': 'Invalid binary timeseries list'}
+    assert_equal(bytes_to_ts_list(data[:-8]), error)
+    assert_equal(bytes_to_ts_list('TSL'), error)
+
+
@@ -0,0 +1,96 @@
+# --------------------------------------------------------------------
+# Author: Francesc Torradeflot - <ciscu@nomorecode.com>
+#
+# Description:
+# Tests on timeseries_graph.py
+#
+# --------------------------------------------------------------------
+# Copyright (c) 2014 - All Rights Reserved.
+#
+# This source is subject to the Nomorecode Source License.
+# Please see the License.md file for more information, which is
+# part of this source code package.
+# --------------------------------------------------------------------
+
+# --------------------------------------------------------------------
+# Imports and defines.
+from nose.tools import *
+import sys
+sys.path.append('../../src')
+import pandas as pd
+
+from analysis.timeseries_graph import *
+import analysis.timeseries_functions as tf
+from timeseries_functions_tests import test_ts_list_equality
+
+TS_LIST = [pd.DataFrame({'value': [1., 2., 4.]}, index = [0, 300, 600])]
+
+
+# --------------------------------------------------------------------
+# optimize
+def test_graph_1():
+    # Equal subtrees are computed once
+    node = lazy.addition(lazy.scalar_product(TS_LIST, number = 2),
+        lazy.scalar_product(TS_LIST, number = 2))
+
+    graph = optimize(node)
+
+    assert_true(graph.args[0] is graph.args[1])
+    assert_equal(count_consumers(graph)[graph.args[0].key], 2)
+    test_ts_list_equality(node.collect(), tf.addition(tf.scalar_product(TS_LIST, number = 2),
+        tf.scalar_product(TS_LIST, number = 2)))
+
+def test_graph_2():
+    # Scalar functions are fused, unless the inner one is used elsewhere
+    inner = lazy.scalar_product(TS_LIST, number = 2)
+    node = lazy.scalar_sum(lazy.scalar_division(inner, number = 4), number = 1)
+
+    graph = optimize(node)
+    assert_equal(graph.name, 'scalar_chain')
+    assert_equal(graph.kwargs['operations'], (('scalar_product', 2), ('scalar_division', 4),
+        ('scalar_sum', 1)))
+    test_ts_list_equality(node.collect(), [pd.DataFrame({'value': [1.5, 2., 3.]},
+        index = [0, 300, 600])])
+
+    graph = optimize(lazy.addition(node, inner))
+    assert_equal(graph.args[0].name, 'scalar_chain')
+    assert_true(graph.args[0].args[0] is graph.args[1])
+
+def test_graph_3():
+    # last is pushed down to get_variable if it is not distributed
+    fetch = lazy.get_variable(1, range = 'last_day', distr = 'False')
+    graph = optimize(lazy.last(fetch, number = 3))
+    assert_equal(graph.args[0].kwargs['count'], 3)
+
+    fetch = lazy.get_variable(1, range = 'last_day', distr = 'False', count = 2)
+    graph = optimize(lazy.last(fetch, number = 3))
+    assert_equal(graph.args[0].kwargs['count'], 2)
+
+    for fetch in [lazy.get_variable(1, range = 'last_day'), lazy.get_variable(1, distr = False),
+            lazy.get_variable(1, range = 'today', distr = False, compact = True)]:
+        assert_true('count' not in optimize(lazy.last(fetch, number = 3)).args[0].kwargs)
+
+    # the number is not pushed down when it is not an integer, as ts_last does
+    fetch = lazy.get_variable(1, range = 'last_day', distr = 'False')
+    assert_true('count' not in optimize(lazy.last(fetch, number = '3')).args[0].kwargs)
+
+
+# --------------------------------------------------------------------
+# evaluate
+def test_graph_4():
+    node = lazy.scalar_product(lazy.generate_ts_list('a'), number = 2)
+    assert_equal(node.collect(), {'error': 'Unable to load : a'})
+
+    node = lazy.scalar_power(TS_LIST, number = 'a')
+    assert_equal(node.collect(), {'error': 'Unable to compute function'})
+
+    assert_raises(AttributeError, getattr, lazy, 'unknown_function')
+
+    # The results are released once they are used
+    inner = lazy.scalar_product(TS_LIST, number = 2)
+    node = lazy.addition(inner, inner)
+    counts = count_consumers(node)
+    results = {}
+    compute(node, counts, results)
+    assert_equal(results, {})
+    assert_equal(set(counts.values()), set([0]))
@@ -145,6 +145,39 @@ def test_ff_3():
     assert_equal(real_output, expected_output)
 
 
+# ---------------------------- find_scalar_chain ----------------------------------
+
+def test_fsc_1():
+
+    args = ['scalar_product(scalar_division(x;number=1000);number=0.12)']
+    kwargs = {'number': '5'}
+
+    expected_output = ('x', [('scalar_division', '1000'), ('scalar_product', '0.12'), ('scalar_sum', '5')])
+
+    real_output = find_scalar_chain('scalar_sum', args, kwargs)
+
+    assert_equal(real_output, expected_output)
+
+
+def test_fsc_2():
+
+    # Default numbers, and the chain stops at the first non scalar function
+    args = ['scalar_power(last(scalar_sub(x)))']
+
+    expected_output = ('last(scalar_sub(x))', [('scalar_power', 1.), ('scalar_product', 1.)])
+
+    real_output = find_scalar_chain('scalar_product', args, {})
+
+    assert_equal(real_output, expected_output)
+
+
+def test_fsc_3():
+
+    # A single scalar function or unknown kwargs are not chains
+    assert_equal(find_scalar_chain('scalar_sum', ['x'], {'number': '5'}), None)
+    assert_equal(find_scalar_chain('scalar_sum', ['scalar_sum(x;test=1)'], {}), None)
+
+
 # ------------------------------------- Tests on analysis_parser ---------------------------
 
 def test_ap_1():
@@ -160,6 +193,43 @@ def test_ap_1():
     test_ts_list_equality(real_output, expected_output)
 
 
+def test_ap_chain():
+
+    # Infinite values are deleted before scalar_power makes them finite
+    argument = 'scalar_sum(scalar_power(scalar_product(generate_ts_list(' + \
+        '[{"value":[1, 10], "index":[0, 300]}]);number=1e308);number=0);number=1)'
+
+    expected_output = [pd.DataFrame([2.], columns = ['value'], index = [0])]
+
+    real_output = parser(argument)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_ap_asof():
+
+    argument = 'asof_join(generate_ts_list([{"value":[1, 2], "index":[0, 600]}]);' + \
+        'generate_ts_list([{"value":[5, 7], "index":[280, 900]}]);direction=nearest;tolerance=300)'
+
+    expected_output = [pd.DataFrame([5, 7], columns = ['value'], index = [0, 600])]
+
+    real_output = parser(argument)
+
+    test_ts_list_equality(real_output, expected_output)
+
+
+def test_ap_plan():
+
+    ts_list_text = 'generate_ts_list([{"value":[1, 2, 4], "index":[0, 300, 600]}])'
+    argument = 'addition(scalar_sum(scalar_product(' + ts_list_text + ';number=2);number=1);' + \
+        ts_list_text + ')'
+
+    graph = plan(argument)
+
+    test_ts_list_equality(graph.collect(), parser(argument))
+    assert_equal(plan('unknown_function(1)'), {'error': 'Unknown function: unknown_function'})
+
+
 def test_ap_2():
 
     ts_list_text = '[{"value":[0, 1, 1], "index":[1393628100, 1393628400, 1393628900]}]'